@@ -2,7 +2,7 @@
 {
     "name": "Registre Pharmaceutique",
     "summary": "Gestion des établissements pharmaceutiques (officine, dépôt, grossiste, agence, fabrication)",
-    "version": "16.0.1.0.0",
+    "version": "16.0.1.1.0",
     "author": "Fatima",
     "category": "Industries",
     "license": "LGPL-3",
@@ -15,19 +15,27 @@
         "security/security.xml",
         "security/ir.model.access.csv",
         "data/sequences.xml",
+        "data/import_job_cron.xml",
         "wizards/import_geo_views.xml",
         "wizards/import_establishment_views.xml",
+        "wizards/export_establishment_views.xml",
+        "wizards/import_photo_views.xml",
         "views/geo_views.xml",
         "views/officine_views.xml",
         "views/depot_views.xml",
         "views/grossiste_views.xml",
         "views/agence_views.xml",
         "views/fabrication_views.xml",
+        "views/import_job_views.xml",
+        "views/establishment_search_views.xml",
+        "views/stat_geo_views.xml",
         "views/menus.xml"
     ],
     "assets": {
         "web.assets_backend": [
             "pharma_registry/static/src/scss/pharma_forms.scss",
+            "pharma_registry/static/src/js/geo_select_field.js",
+            "pharma_registry/static/src/xml/geo_select_field.xml",
         ],
     },
     "application": True,
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Points d'entrée HTTP du registre pharmaceutique."""
+
+import os
+
+from werkzeug.exceptions import Forbidden, NotFound
+from werkzeug.wsgi import wrap_file
+
+from odoo import http
+from odoo.http import content_disposition, request
+
+from ..models.establishment import COMPACT_PAGE_LIMIT, ESTABLISHMENT_MODELS
+from ..models.geo import build_geo_tree, get_geo_version
+from ..tools import geo_cache
+from ..wizards.export_establishment import EXPORT_MIMETYPES
+
+
+def _to_int(value):
+    """Lire un identifiant passé en paramètre d'URL (0 si absent ou invalide)."""
+
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class PharmaRegistryController(http.Controller):
+    """Routes JSON utilisées par les écrans et intégrations du registre."""
+
+    @http.route("/pharma_registry/search", type="json", auth="user")
+    def search(self, query, limit=20):
+        """Rechercher un établissement par nom, code, téléphone ou responsable, tous types confondus."""
+
+        limit = min(int(limit or 20), 100)
+        return request.env["pharma.establishment.search"].search_establishments(query, limit=limit)
+
+    @http.route(
+        "/pharma_registry/establishments/<string:type_etablissement>", type="http", auth="user", methods=["GET"]
+    )
+    def establishments(self, type_etablissement, after=0, limit=COMPACT_PAGE_LIMIT, region_id=None,
+                       department_id=None, commune_id=None, located=None):
+        """Servir une page de la projection compacte d'un type d'établissement.
+
+        La réponse porte un ETag : un client qui renvoie ``If-None-Match``
+        reçoit un 304 sans corps tant que la sélection n'a pas changé.
+        """
+
+        model_name = ESTABLISHMENT_MODELS.get(type_etablissement)
+        if not model_name:
+            raise NotFound()
+        Model = request.env[model_name]
+        after, limit = _to_int(after), _to_int(limit) or COMPACT_PAGE_LIMIT
+        domain = Model._get_compact_domain(
+            _to_int(region_id), _to_int(department_id), _to_int(commune_id), located not in (None, "", "0", "false")
+        )
+        etag = Model.get_compact_etag(domain, after, limit)
+        headers = [("ETag", '"%s"' % etag), ("Cache-Control", "private, no-cache")]
+        if request.httprequest.if_none_match.contains(etag):
+            return request.make_response("", headers=headers, status=304)
+        return request.make_json_response(Model.get_compact_page(domain, after, limit), headers=headers)
+
+    @http.route("/pharma_registry/geo_tree", type="http", auth="user", methods=["GET"])
+    def geo_tree(self, v=None):
+        """Servir toute la hiérarchie région ➔ département ➔ commune en une réponse.
+
+        Appelée avec la version courante (``?v=``), la réponse est gardée en
+        cache par le navigateur jusqu'à la prochaine modification du
+        référentiel, qui change l'URL. Sinon elle est revalidée par ETag.
+        """
+
+        version = get_geo_version(request.env)
+        etag = "geo-%s-%s" % (request.env.cr.dbname, version)
+        headers = [("ETag", '"%s"' % etag), ("Vary", "Cookie")]
+        if str(v) == str(version):
+            headers.append(("Cache-Control", "private, max-age=31536000, immutable"))
+        else:
+            headers.append(("Cache-Control", "private, no-cache"))
+        if request.httprequest.if_none_match.contains(etag):
+            return request.make_response("", headers=headers, status=304)
+        return request.make_json_response(build_geo_tree(request.env), headers=headers)
+
+    @http.route("/pharma_registry/geo_cache/stats", type="json", auth="user")
+    def geo_cache_stats(self):
+        """Compteurs du cache du référentiel dans le processus qui répond (administrateurs)."""
+
+        if not request.env.user.has_group("base.group_system"):
+            raise Forbidden()
+        return geo_cache.get_stats()
+
+    @http.route("/pharma_registry/export/<int:wizard_id>", type="http", auth="user")
+    def export_file(self, wizard_id):
+        """Transmettre en flux le fichier produit par un assistant d'export."""
+
+        wizard = request.env["pharma.export.establishment.wizard"].browse(wizard_id).exists()
+        path = wizard and wizard._get_export_path()
+        if not path or not os.path.exists(path):
+            raise NotFound()
+        handle = open(path, "rb")
+        return http.Response(
+            wrap_file(request.httprequest.environ, handle),
+            headers=[
+                ("Content-Type", EXPORT_MIMETYPES[wizard.file_format]),
+                ("Content-Disposition", content_disposition(wizard.export_filename)),
+                ("Content-Length", str(os.path.getsize(path))),
+            ],
+            direct_passthrough=True,
+        )
+
+    @http.route("/pharma_registry/nearby", type="json", auth="user")
+    def nearby(self, latitude, longitude, radius_km=5, types=None, limit=50):
+        """Lister les établissements situés autour d'un point, les plus proches d'abord."""
+
+        limit = min(int(limit or 50), 500)
+        return request.env["pharma.establishment.search"].search_nearby(
+            float(latitude), float(longitude), float(radius_km), types=types, limit=limit
+        )
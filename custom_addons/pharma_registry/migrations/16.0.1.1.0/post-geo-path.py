@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""Réécrire ``geo_path`` avec un segment vide pour chaque niveau absent, une requête par table."""
+
+from odoo.addons.pharma_registry.models.establishment import ESTABLISHMENT_MODELS
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    for model_name in ESTABLISHMENT_MODELS.values():
+        cr.execute(
+            f"""
+            UPDATE "{model_name.replace('.', '_')}"
+               SET geo_path = CASE WHEN region_id IS NOT NULL THEN
+                   region_id::text || '/' || COALESCE(department_id::text, '') || '/' || COALESCE(commune_id::text, '')
+               END
+            """
+        )
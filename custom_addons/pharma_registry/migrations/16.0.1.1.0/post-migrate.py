@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""Réécrire les représentations dérivées des coordonnées, une requête par table.
+
+``points_geolocalisation`` et ``geo_cell`` ne sont plus des champs calculés :
+ils sont remis en cohérence avec latitude/longitude au format canonique
+« latitude,longitude ».
+"""
+
+from odoo.addons.pharma_registry.models.establishment import ESTABLISHMENT_MODELS
+from odoo.addons.pharma_registry.tools import spatial
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    for model_name in ESTABLISHMENT_MODELS.values():
+        cr.execute(
+            f"""
+            UPDATE "{model_name.replace('.', '_')}"
+               SET points_geolocalisation = {spatial.points_sql()},
+                   geo_cell = {spatial.cell_sql()}
+            """
+        )
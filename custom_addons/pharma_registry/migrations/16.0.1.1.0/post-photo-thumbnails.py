@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""Produire les vignettes ``photo_512`` et ``photo_128`` des fiches qui ont déjà une photo.
+
+Les vignettes sont écrites par l'ORM, qui les réduit à leur taille ; les
+fiches sont traitées par paquets pour borner la mémoire.
+"""
+
+from odoo import SUPERUSER_ID, api
+from odoo.tools import split_every
+
+from odoo.addons.pharma_registry.models.establishment import ESTABLISHMENT_MODELS
+
+# Nombre de fiches dont les images sont chargées en mémoire à la fois.
+THUMBNAIL_BATCH_SIZE = 100
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    for model_name in ESTABLISHMENT_MODELS.values():
+        Model = env[model_name].with_context(active_test=False)
+        domain = [("photo", "!=", False), "|", ("photo_512", "=", False), ("photo_128", "=", False)]
+        record_ids = Model.search(domain).ids
+        for batch_ids in split_every(THUMBNAIL_BATCH_SIZE, record_ids):
+            records = Model.browse(batch_ids)
+            for record in records:
+                record.write({"photo_512": record.photo, "photo_128": record.photo})
+            records.flush_recordset()
+            records.invalidate_recordset()
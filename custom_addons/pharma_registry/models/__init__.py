@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from . import fuzzy_search
 from . import geo
 from . import establishment
 from . import officine
@@ -6,3 +7,7 @@ from . import depot
 from . import grossiste
 from . import agence
 from . import fabrication
+from . import establishment_search
+from . import stat_geo
+from . import import_job
+from . import ir_http
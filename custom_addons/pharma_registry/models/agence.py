@@ -11,12 +11,12 @@ class PharmaAgence(models.Model):
     _description = "Agence de promotion"
     _inherit = "pharma.establishment.base"
 
-    name = fields.Char(string="Nom de l'agence de promotion", required=True)
-    numero_telephone = fields.Char(string="Numéro téléphone", required=True)
+    name = fields.Char(string="Nom de l'agence de promotion", required=True, index="trigram")
+    numero_telephone = fields.Char(string="Numéro téléphone", required=True, index="trigram")
     annee_ouverture = fields.Integer(string="Année d'ouverture", required=True)
     numero_agrement = fields.Char(string="Numéro de l'agrément", required=True)
     date_agrement = fields.Date(string="Date de l'agrément", required=True)
-    pharmacien_responsable = fields.Char(string="Prénom et nom du pharmacien responsable", required=True)
+    pharmacien_responsable = fields.Char(string="Prénom et nom du pharmacien responsable", required=True, index="trigram")
     nombre_employe_pharmacien = fields.Integer(string="Nombre d'employés pharmaciens", required=True)
     nombre_employe_non_pharmacien = fields.Integer(string="Nombre d'employés non pharmaciens", required=True)
     chiffre_affaire = fields.Float(string="Chiffre d'affaires (FCFA)")
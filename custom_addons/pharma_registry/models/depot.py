@@ -11,10 +11,10 @@ class PharmaDepot(models.Model):
     _description = "Dépôt de médicaments"
     _inherit = "pharma.establishment.base"
 
-    name = fields.Char(string="Nom du dépôt", required=True)
-    numero_telephone = fields.Char(string="Numéro téléphone", required=True)
+    name = fields.Char(string="Nom du dépôt", required=True, index="trigram")
+    numero_telephone = fields.Char(string="Numéro téléphone", required=True, index="trigram")
     annee_ouverture = fields.Integer(string="Année d'ouverture", required=True)
-    responsable_nom = fields.Char(string="Prénom et nom responsable / dépositaire", required=True)
+    responsable_nom = fields.Char(string="Prénom et nom responsable / dépositaire", required=True, index="trigram")
     sexe_responsable = fields.Selection(
         [("f", "Féminin"), ("m", "Masculin"), ("na", "Non renseigné")],
         string="Sexe",
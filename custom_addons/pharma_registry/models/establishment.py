@@ -1,8 +1,38 @@
 """Blocs fonctionnels partagés par tous les modèles d'établissements pharmaceutiques."""
 
 # -*- coding: utf-8 -*-
+import hashlib
+
 from odoo import api, fields, models
 from odoo.exceptions import ValidationError
+from odoo.tools.sql import create_index
+
+from ..tools import spatial
+from ..tools.instrumentation import profiled
+from .geo import find_geo_incoherences, format_incoherences, get_geo_version
+
+# Modèle concret de chaque type d'établissement.
+ESTABLISHMENT_MODELS = {
+    "officine": "pharma.officine",
+    "depot": "pharma.depot",
+    "grossiste": "pharma.grossiste",
+    "agence": "pharma.agence",
+    "fabrication": "pharma.fabrication",
+}
+
+# Rayon de départ et rayon maximal (km) de la recherche des plus proches voisins.
+NEAREST_START_RADIUS_KM = 5.0
+NEAREST_MAX_RADIUS_KM = 2000.0
+
+# Projection compacte servie aux listes et cartes, et taille maximale d'une page.
+COMPACT_FIELDS = ("code", "name", "commune_id", "latitude", "longitude")
+COMPACT_PAGE_LIMIT = 5000
+
+# Photo et vignettes stockées, avec leur taille maximale (px), de la plus grande à la plus petite.
+PHOTO_SIZES = (("photo", 1024), ("photo_512", 512), ("photo_128", 128))
+
+# Champs de rapprochement indexés sur lower() pour les recherches insensibles à la casse.
+LOWER_INDEXED_FIELDS = ("name", "code", "numero_ordre", "numero_agrement")
 
 
 class PharmaEstablishmentBase(models.AbstractModel):
@@ -10,30 +40,42 @@ class PharmaEstablishmentBase(models.AbstractModel):
 
     _name = "pharma.establishment.base"
     _description = "Base établissement pharmaceutique"
+    _inherit = "pharma.fuzzy.search.mixin"
 
     region_id = fields.Many2one(
         "pharma.geo.region",
         string="Région",
         required=True,
+        index=True,
         help="Région d'implantation",
     )
     department_id = fields.Many2one(
         "pharma.geo.department",
         required=True,
+        index=True,
         string="Département",
         help="Département correspondant à la région",
     )
     commune_id = fields.Many2one(
         "pharma.geo.commune",
         required=True,
+        index=True,
         string="Commune",
         help="Commune correspondant au département",
     )
+    geo_path = fields.Char(
+        string="Chemin géographique",
+        compute="_compute_geo_path",
+        store=True,
+        help="Clé « région/département/commune » (identifiants, vide pour un niveau absent) "
+        "permettant de filtrer un niveau géographique par préfixe.",
+    )
     code = fields.Char(
         string="Code",
         # required=True,
         copy=False,
         readonly=True,
+        index="trigram",
         # default=lambda self: self._generate_code_prefix(),
     )
     quartier = fields.Char(string="Quartier / Village / Hameau", required=True)
@@ -42,81 +84,356 @@ class PharmaEstablishmentBase(models.AbstractModel):
     longitude = fields.Float(string="Longitude", default=False, digits=(10, 6))
     points_geolocalisation = fields.Char(
         string="Points de géolocalisation",
-        compute="_compute_points_geolocalisation",
-        inverse="_inverse_points_geolocalisation",
-        store=True,
+        help="« latitude,longitude », tenu à jour à chaque écriture des coordonnées.",
+    )
+    geo_cell = fields.Integer(
+        string="Cellule géographique",
+        readonly=True,
+        index=True,
+        help="Cellule de la grille de %s° contenant les coordonnées, utilisée par les "
+        "recherches de proximité." % spatial.CELL_SIZE,
     )
     observations = fields.Text(string="Observations")
+    import_hash = fields.Char(
+        string="Empreinte d'import",
+        copy=False,
+        readonly=True,
+        help="Empreinte des valeurs du dernier import différentiel ayant écrit la fiche.",
+    )
     active = fields.Boolean(default=True, string="Actif")
     photo = fields.Image(string="Photo", max_width=1024, max_height=1024)
+    photo_512 = fields.Image(string="Photo (512)", max_width=512, max_height=512, readonly=True)
+    photo_128 = fields.Image(string="Photo (128)", max_width=128, max_height=128, readonly=True)
+
+    def init(self):
+        """Créer les index fonctionnels du rapprochement des imports et des filtres géographiques."""
+
+        if self._abstract:
+            return
+        create_index(
+            self._cr,
+            f"{self._table}_active_geo_index",
+            self._table,
+            ['"active"', '"region_id"', '"department_id"', '"commune_id"'],
+        )
+        create_index(
+            self._cr,
+            f"{self._table}_geo_path_index",
+            self._table,
+            ['"geo_path" text_pattern_ops'],
+        )
+        for field_name in LOWER_INDEXED_FIELDS:
+            if field_name in self._fields:
+                create_index(
+                    self._cr,
+                    f"{self._table}_{field_name}_lower_index",
+                    self._table,
+                    [f'lower("{field_name}")'],
+                )
 
     @api.constrains("department_id", "region_id")
+    @profiled("_check_region_coherence", count=lambda records, _result: len(records))
     def _check_region_coherence(self):
         """Vérifier si le département appartient à la région"""
 
-        for record in self:
-            if (
-                record.department_id
-                and record.region_id
-                and record.department_id.region_id != record.region_id
-            ):
-                raise ValidationError(
-                    "Le département choisi n'appartient pas à la région sélectionnée."
-                )
+        invalid = find_geo_incoherences(self, "department_id", "region_id")
+        if invalid:
+            raise ValidationError(
+                format_incoherences("Le département choisi n'appartient pas à la région sélectionnée.", invalid)
+            )
 
     @api.constrains("commune_id", "department_id")
+    @profiled("_check_department_coherence", count=lambda records, _result: len(records))
     def _check_department_coherence(self):
         """Vérifier que la commune appartient bien au département indiqué."""
 
+        invalid = find_geo_incoherences(self, "commune_id", "department_id")
+        if invalid:
+            raise ValidationError(
+                format_incoherences("La commune choisie n'appartient pas au département sélectionné.", invalid)
+            )
+
+    @api.depends("region_id", "department_id", "commune_id")
+    def _compute_geo_path(self):
+        """Composer la clé « région/département/commune » à partir des identifiants.
+
+        Un niveau absent laisse un segment vide (« 3//17 ») : chaque segment
+        garde sa position et un préfixe ne désigne qu'un seul niveau.
+        """
+
         for record in self:
-            if (
-                record.commune_id
-                and record.department_id
-                and record.commune_id.department_id != record.department_id
-            ):
+            if record.region_id:
+                record.geo_path = "/".join(
+                    str(geo.id) if geo else "" for geo in (record.region_id, record.department_id, record.commune_id)
+                )
+            else:
+                record.geo_path = False
+
+    @api.model
+    def _get_geo_path_domain(self, region_id, department_id=None, commune_id=None):
+        """Retourner un domaine filtrant un niveau géographique par préfixe indexé.
+
+        Le préfixe couvre les niveaux renseignés à partir de la région ; un
+        niveau inférieur donné sans son parent (commune sans département) est
+        filtré sur son propre champ.
+        """
+
+        levels = [("region_id", region_id), ("department_id", department_id), ("commune_id", commune_id)]
+        parts = []
+        for _field_name, level in levels:
+            if not level:
+                break
+            parts.append(str(level))
+        prefix = "/".join(parts)
+        domain = ["|", ("geo_path", "=", prefix), ("geo_path", "=like", prefix + "/%")]
+        return domain + [(field_name, "=", level) for field_name, level in levels[len(parts):] if level]
+
+    @api.model
+    def _prepare_coordinate_vals(self, vals):
+        """Compléter des valeurs écrites avec les représentations dérivées des coordonnées.
+
+        Latitude et longitude font foi : ``points_geolocalisation`` et
+        ``geo_cell`` en sont déduits et écrits dans la même requête. Un texte
+        ``points_geolocalisation`` écrit seul est d'abord décodé.
+        """
+
+        if "points_geolocalisation" in vals and "latitude" not in vals and "longitude" not in vals:
+            coordinates = spatial.parse_points(vals["points_geolocalisation"])
+            if coordinates is None:
                 raise ValidationError(
-                    "La commune choisie n'appartient pas au département sélectionné."
+                    "Points de géolocalisation invalides : '%s' (attendu : latitude,longitude)."
+                    % vals["points_geolocalisation"]
                 )
+            vals["latitude"], vals["longitude"] = coordinates
+        if "latitude" in vals or "longitude" in vals:
+            latitude, longitude = vals.get("latitude") or 0.0, vals.get("longitude") or 0.0
+            vals["points_geolocalisation"] = spatial.format_points(latitude, longitude)
+            vals["geo_cell"] = spatial.cell_of(latitude, longitude)
+        return vals
 
-    @api.depends("latitude", "longitude")
-    def _compute_points_geolocalisation(self):
-        """Afficher latitude et longitude séparées par une virgule."""
+    @api.model
+    def _prepare_photo_vals(self, vals):
+        """Écrire les vignettes avec la photo, dans le même appel.
 
-        for record in self:
-            if record.latitude not in (False, None) and record.longitude not in (False, None):
-                record.points_geolocalisation = f"{record.latitude},{record.longitude},"
-            else:
-                record.points_geolocalisation = False
+        Une vignette non fournie reçoit la photo, réduite à sa taille par le
+        champ image ; l'import des photos fournit des vignettes déjà réduites.
+        """
+
+        if "photo" in vals:
+            for field_name, _size in PHOTO_SIZES[1:]:
+                vals.setdefault(field_name, vals["photo"])
+        return vals
 
-    def _inverse_points_geolocalisation(self):
-        """Autoriser la saisie manuelle des coordonnées si nécessaire."""
+    def _write_partial_coordinates(self, vals):
+        """Écrire une seule des deux coordonnées, par groupe de fiches partageant l'autre."""
 
+        other = "longitude" if "latitude" in vals else "latitude"
+        groups = {}
         for record in self:
-            value = (record.points_geolocalisation or "").strip()
-            if not value:
-                record.latitude = False
-                record.longitude = False
-                continue
-
-            parts = [p.strip() for p in value.split(",") if p.strip()]
-            if len(parts) >= 2:
-                try:
-                    lon = float(parts[0])
-                    lat = float(parts[1])
-                except ValueError:
-                    continue
-                record.longitude = lon
-                record.latitude = lat
+            groups.setdefault(record[other], []).append(record.id)
+        for value, ids in groups.items():
+            self.browse(ids).write(dict(vals, **{other: value}))
+        return True
 
+    # ------------------------------------------------------------------
+    # Recherches de proximité
+    # ------------------------------------------------------------------
     @api.model
-    def create(self, vals):
-        if not vals.get("code"):
-            vals["code"] = self._generate_code_prefix()
-        return super().create(vals)
+    def _search_spatial(self, bbox, center=None, radius_km=None, limit=None):
+        """Retourner ``[(id, distance_km)]`` des fiches actives d'un rectangle, par distance."""
+
+        self.check_access_rights("read")
+        self.flush_model(["latitude", "longitude", "geo_cell", "active"])
+        rows = spatial.search_spatial(
+            self._cr, self._table, bbox, center=center, radius_km=radius_km, limit=limit, where="active"
+        )
+        allowed = set(self._search([("id", "in", [row[0] for row in rows])]))
+        return [row for row in rows if row[0] in allowed]
+
+    @api.model
+    def search_within_radius(self, latitude, longitude, radius_km, limit=None):
+        """Retourner les fiches situées à moins de ``radius_km`` d'un point, les plus proches d'abord."""
+
+        rows = self._search_spatial(
+            spatial.bbox_around(latitude, longitude, radius_km),
+            center=(latitude, longitude),
+            radius_km=radius_km,
+            limit=limit,
+        )
+        return self.browse(row[0] for row in rows)
+
+    @api.model
+    def search_nearest(self, latitude, longitude, count=10, max_radius_km=NEAREST_MAX_RADIUS_KM):
+        """Retourner les ``count`` fiches les plus proches d'un point.
+
+        Le rayon de recherche double tant que le nombre de fiches trouvées est
+        insuffisant : chaque passage reste servi par l'index des cellules.
+        """
+
+        radius_km = min(NEAREST_START_RADIUS_KM, max_radius_km)
+        while True:
+            records = self.search_within_radius(latitude, longitude, radius_km, limit=count)
+            if len(records) >= count or radius_km >= max_radius_km:
+                return records
+            radius_km = min(radius_km * 2, max_radius_km)
+
+    @api.model
+    def search_in_bbox(self, min_latitude, min_longitude, max_latitude, max_longitude, limit=None):
+        """Retourner les fiches situées dans un rectangle de coordonnées."""
+
+        rows = self._search_spatial((min_latitude, min_longitude, max_latitude, max_longitude), limit=limit)
+        return self.browse(row[0] for row in rows)
+
+    # ------------------------------------------------------------------
+    # Lecture compacte (listes et cartes)
+    # ------------------------------------------------------------------
+    @api.model
+    def _get_compact_domain(self, region_id=None, department_id=None, commune_id=None, located=False):
+        """Construire le domaine d'une lecture compacte à partir des filtres géographiques."""
+
+        if region_id:
+            domain = self._get_geo_path_domain(region_id, department_id, commune_id)
+        elif commune_id:
+            domain = [("commune_id", "=", commune_id)]
+        elif department_id:
+            domain = [("department_id", "=", department_id)]
+        else:
+            domain = []
+        if located:
+            domain += ["|", ("latitude", "!=", 0), ("longitude", "!=", 0)]
+        return domain
+
+    @api.model
+    def get_compact_page(self, domain, after=0, limit=COMPACT_PAGE_LIMIT):
+        """Retourner une page de la projection compacte, paginée par id croissant.
+
+        ``next`` vaut le dernier id de la page lorsqu'une page suivante peut
+        exister : il est repris comme paramètre ``after`` de l'appel suivant.
+        Les noms des communes sont transmis une seule fois par page.
+        """
+
+        limit = max(1, min(int(limit or COMPACT_PAGE_LIMIT), COMPACT_PAGE_LIMIT))
+        records = self.search_read(
+            list(domain) + [("id", ">", int(after or 0))],
+            list(COMPACT_FIELDS),
+            order="id",
+            limit=limit,
+            load=None,
+        )
+        communes = self.env["pharma.geo.commune"].browse(
+            {record["commune_id"] for record in records if record["commune_id"]}
+        )
+        rows = []
+        for record in records:
+            located = spatial.is_located(record["latitude"], record["longitude"])
+            rows.append(
+                [
+                    record["id"],
+                    record["code"],
+                    record["name"],
+                    record["commune_id"],
+                    record["latitude"] if located else None,
+                    record["longitude"] if located else None,
+                ]
+            )
+        return {
+            "fields": ["id"] + list(COMPACT_FIELDS),
+            "rows": rows,
+            "communes": {commune["id"]: commune["name"] for commune in communes.read(["name"])},
+            "next": rows[-1][0] if len(rows) == limit else None,
+        }
+
+    @api.model
+    def get_compact_etag(self, domain, after=0, limit=COMPACT_PAGE_LIMIT):
+        """Empreinte d'une page : ses fiches, leur dernière modification et le référentiel.
+
+        Seules les lignes de la page (``id > after``, au plus ``limit``) sont
+        agrégées, avec les mêmes règles d'accès que la lecture : nombre, plus
+        grand id et dernière ``write_date`` changent dès qu'une fiche de la page
+        est créée, modifiée, archivée ou supprimée. La version du référentiel
+        couvre le renommage des communes transmises avec la page.
+        """
+
+        after = int(after or 0)
+        limit = max(1, min(int(limit or COMPACT_PAGE_LIMIT), COMPACT_PAGE_LIMIT))
+        self.flush_model()
+        where_query = self._where_calc(list(domain))
+        self._apply_ir_rules(where_query, "read")
+        from_clause, where_clause, where_params = where_query.get_sql()
+        self.env.cr.execute(
+            f"""
+            SELECT count(*), max(page.id), max(page.write_date)
+              FROM (
+                    SELECT "{self._table}".id, "{self._table}".write_date
+                      FROM {from_clause}
+                     WHERE {where_clause or "TRUE"} AND "{self._table}".id > %s
+                     ORDER BY "{self._table}".id
+                     LIMIT %s
+                   ) page
+            """,
+            list(where_params) + [after, limit],
+        )
+        count, last_id, write_date = self.env.cr.fetchone()
+        geo_version = get_geo_version(self.env)
+        signature = (
+            f"{self._name}:{self.env.uid}:{domain}:{after}:{limit}:{count}:{last_id}:{write_date}:{geo_version}"
+        )
+        return hashlib.sha1(signature.encode("utf-8")).hexdigest()
+
+    @api.model_create_multi
+    @profiled("create", count=lambda _model, records: len(records))
+    def create(self, vals_list):
+        missing = [vals for vals in vals_list if not vals.get("code")]
+        if missing:
+            for vals, code in zip(missing, self._reserve_codes(len(missing))):
+                vals["code"] = code
+        for vals in vals_list:
+            self._prepare_coordinate_vals(vals)
+            self._prepare_photo_vals(vals)
+        records = super().create(vals_list)
+        self.env["pharma.stat.geo"]._refresh_establishments(self._name, records.commune_id.ids)
+        return records
+
+    def write(self, vals):
+        if ("latitude" in vals) != ("longitude" in vals):
+            return self._write_partial_coordinates(vals)
+        vals = self._prepare_photo_vals(self._prepare_coordinate_vals(dict(vals)))
+        Stat = self.env["pharma.stat.geo"]
+        if not Stat._affects_stats(vals):
+            return super().write(vals)
+        commune_ids = set(self.commune_id.ids)
+        result = super().write(vals)
+        Stat._refresh_establishments(self._name, commune_ids | set(self.commune_id.ids))
+        return result
+
+    def unlink(self):
+        commune_ids = self.commune_id.ids
+        result = super().unlink()
+        self.env["pharma.stat.geo"]._refresh_establishments(self._name, commune_ids)
+        return result
+
+    @api.model
+    def _find_id_by_lower_value(self, field_name, value):
+        """Retrouver une fiche active par égalité insensible à la casse (index lower())."""
+
+        if field_name not in LOWER_INDEXED_FIELDS or field_name not in self._fields:
+            raise ValueError(f"Champ de rapprochement non indexé: {field_name}")
+        self.flush_model([field_name, "active"])
+        self._cr.execute(
+            f'SELECT id FROM "{self._table}" WHERE lower("{field_name}") = lower(%s) AND active ORDER BY id LIMIT 1',
+            (str(value).strip(),),
+        )
+        row = self._cr.fetchone()
+        return row[0] if row else False
 
     def _generate_code_prefix(self):
         """Générer un identifiant en ajoutant un préfixe selon le type."""
 
+        return self._reserve_codes(1)[0]
+
+    def _reserve_codes(self, count):
+        """Réserver en une fois ``count`` codes préfixés dans la séquence du type."""
+
         prefix_map = {
             "pharma.officine": "off",
             "pharma.depot": "dep",
@@ -134,7 +451,47 @@ class PharmaEstablishmentBase(models.AbstractModel):
 
         prefix = prefix_map.get(self._name, "etab")
         seq_code = sequence_map.get(self._name, "pharma.establishment.code")
-        number = self.env["ir.sequence"].next_by_code(seq_code)
-        if not number:
-            number = self.env["ir.sequence"].next_by_code("pharma.establishment.code") or "0001"
-        return f"{prefix}-{number}"
+        sequence = self._get_code_sequence(seq_code) or self._get_code_sequence("pharma.establishment.code")
+        if not sequence:
+            return [f"{prefix}-0001"] * count
+        return [f"{prefix}-{number}" for number in self._reserve_sequence_numbers(sequence, count)]
+
+    def _get_code_sequence(self, seq_code):
+        """Retrouver la séquence comme le ferait ``ir.sequence.next_by_code``."""
+
+        company_id = self.env.company.id
+        return self.env["ir.sequence"].sudo().search(
+            [("code", "=", seq_code), ("company_id", "in", [company_id, False])],
+            order="company_id",
+            limit=1,
+        )
+
+    def _reserve_sequence_numbers(self, sequence, count):
+        """Tirer ``count`` numéros formatés d'une séquence en une seule requête.
+
+        Une séquence standard est avancée par ``nextval`` sur une série, une
+        séquence sans trou par un unique UPDATE : la ligne ``ir_sequence`` n'est
+        plus verrouillée une fois par établissement créé.
+        """
+
+        if sequence.use_date_range:
+            return [sequence._next() for _index in range(count)]
+
+        if sequence.implementation == "standard":
+            self._cr.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                ("ir_sequence_%03d" % sequence.id, count),
+            )
+            numbers = sorted(row[0] for row in self._cr.fetchall())
+        else:
+            increment = sequence.number_increment
+            self._cr.execute(
+                "UPDATE ir_sequence SET number_next = number_next + %s WHERE id = %s RETURNING number_next",
+                (increment * count, sequence.id),
+            )
+            first = self._cr.fetchone()[0] - increment * count
+            numbers = [first + increment * index for index in range(count)]
+            sequence.invalidate_recordset(["number_next"])
+
+        prefix, suffix = sequence._get_prefix_suffix()
+        return [prefix + "%%0%sd" % sequence.padding % number + suffix for number in numbers]
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""Index de recherche unifié couvrant tous les types d'établissements."""
+
+from odoo import api, fields, models, tools
+from odoo.osv.expression import get_unaccent_wrapper
+
+from ..tools import spatial
+from .establishment import ESTABLISHMENT_MODELS
+
+# Champ du responsable (titulaire, dépositaire, directeur…) de chaque type.
+HOLDER_FIELDS = {
+    "officine": "titulaire_nom",
+    "depot": "responsable_nom",
+    "grossiste": "responsable_nom",
+    "agence": "pharmacien_responsable",
+    "fabrication": "responsable_nom",
+}
+
+# Colonnes textuelles interrogées par la recherche globale.
+SEARCH_COLUMNS = ("name", "code", "numero_telephone", "holder_name")
+
+# Colonnes lues par la recherche globale dans la requête de classement.
+RESULT_COLUMNS = (
+    "id",
+    "type_etablissement",
+    "res_model",
+    "res_id",
+    "code",
+    "name",
+    "numero_telephone",
+    "holder_name",
+    "commune_id",
+)
+
+# Colonnes lues par la recherche de proximité, avant la distance.
+NEARBY_COLUMNS = ("id", "res_model", "res_id", "type_etablissement", "code", "name", "latitude", "longitude")
+
+
+def escape_like(value):
+    """Protéger ``\\``, ``%`` et ``_`` pour qu'ils gardent leur sens littéral dans un motif LIKE."""
+
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class PharmaEstablishmentSearch(models.Model):
+    """Vue SQL réunissant les cinq types d'établissements pour une recherche unique.
+
+    La vue est toujours à jour ; chaque branche s'appuie sur les index trigram
+    des tables sources (nom, code, téléphone, responsable).
+    """
+
+    _name = "pharma.establishment.search"
+    _description = "Recherche globale des établissements"
+    _auto = False
+    _order = "name"
+    _rec_name = "name"
+
+    type_etablissement = fields.Selection(
+        [
+            ("officine", "Officine"),
+            ("depot", "Dépôt de médicaments"),
+            ("grossiste", "Grossiste répartiteur"),
+            ("agence", "Agence de promotion"),
+            ("fabrication", "Établissement de fabrication"),
+        ],
+        string="Type d'établissement",
+        readonly=True,
+    )
+    res_model = fields.Char(string="Modèle", readonly=True)
+    res_id = fields.Many2oneReference(string="Fiche", model_field="res_model", readonly=True)
+    code = fields.Char(string="Code", readonly=True)
+    name = fields.Char(string="Nom", readonly=True)
+    numero_telephone = fields.Char(string="Numéro téléphone", readonly=True)
+    holder_name = fields.Char(string="Responsable", readonly=True)
+    region_id = fields.Many2one("pharma.geo.region", string="Région", readonly=True)
+    department_id = fields.Many2one("pharma.geo.department", string="Département", readonly=True)
+    commune_id = fields.Many2one("pharma.geo.commune", string="Commune", readonly=True)
+    latitude = fields.Float(string="Latitude", digits=(10, 6), readonly=True)
+    longitude = fields.Float(string="Longitude", digits=(10, 6), readonly=True)
+    geo_cell = fields.Integer(string="Cellule géographique", readonly=True)
+    active = fields.Boolean(string="Actif", readonly=True)
+
+    def init(self):
+        """(Re)créer la vue à partir des tables de chaque type d'établissement."""
+
+        branches = []
+        for index, (type_etablissement, model_name) in enumerate(ESTABLISHMENT_MODELS.items(), start=1):
+            branches.append(
+                f"""
+                SELECT id * {len(ESTABLISHMENT_MODELS)} + {index - 1} AS id,
+                       '{type_etablissement}' AS type_etablissement,
+                       '{model_name}' AS res_model,
+                       id AS res_id,
+                       code,
+                       name,
+                       numero_telephone,
+                       "{HOLDER_FIELDS[type_etablissement]}" AS holder_name,
+                       region_id,
+                       department_id,
+                       commune_id,
+                       latitude,
+                       longitude,
+                       geo_cell,
+                       active
+                  FROM "{self.env[model_name]._table}"
+                """
+            )
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute(f'CREATE VIEW "{self._table}" AS ({" UNION ALL ".join(branches)})')
+
+    # ------------------------------------------------------------------
+    # Recherche
+    # ------------------------------------------------------------------
+    @api.model
+    def _search_ranked(self, query, limit=20, domain=None, columns=RESULT_COLUMNS):
+        """Retourner les lignes de la vue correspondant à ``query``, les plus pertinentes d'abord.
+
+        Une seule requête : le domaine (archivage et règles d'accès compris)
+        et le filtre ILIKE sur les colonnes indexées s'appliquent avant la
+        limite ; le classement utilise la similarité trigram lorsque pg_trgm
+        est disponible. Les ``columns`` sont lues par cette même requête :
+        l'identifiant calculé de la vue ne permet pas de relire une ligne par
+        index.
+        """
+
+        query = (query or "").strip()
+        if not query:
+            return []
+        self.check_access_rights("read")
+        for model_name in ESTABLISHMENT_MODELS.values():
+            self.env[model_name].flush_model()
+        where_query = self._where_calc(list(domain or []))
+        self._apply_ir_rules(where_query, "read")
+        from_clause, where_clause, where_params = where_query.get_sql()
+        unaccent = get_unaccent_wrapper(self.env.cr)
+
+        def qualified(column):
+            return f'"{self._table}"."{column}"'
+
+        conditions = " OR ".join(f"{unaccent(qualified(column))} ILIKE {unaccent('%s')}" for column in SEARCH_COLUMNS)
+        pattern = escape_like(query)
+        params = list(where_params) + ["%%%s%%" % pattern] * len(SEARCH_COLUMNS)
+        if self.env.registry.has_trigram:
+            rank = "GREATEST(%s)" % ", ".join(
+                f"similarity(COALESCE({unaccent(qualified(column))}, ''), {unaccent('%s')})"
+                for column in SEARCH_COLUMNS
+            )
+            params += [query] * len(SEARCH_COLUMNS)
+        else:
+            rank = f"({unaccent(qualified('name'))} ILIKE {unaccent('%s')})::int"
+            params.append("%s%%" % pattern)
+        limit_clause = ""
+        if limit:
+            limit_clause = "LIMIT %s"
+            params.append(limit)
+        self.env.cr.execute(
+            f"""
+            SELECT {", ".join(qualified(column) for column in columns)}
+              FROM {from_clause}
+             WHERE {where_clause or "TRUE"} AND ({conditions})
+             ORDER BY {rank} DESC, {qualified("name")}
+             {limit_clause}
+            """,
+            params,
+        )
+        return self.env.cr.fetchall()
+
+    @api.model
+    def search_establishments(self, query, limit=20):
+        """Point d'entrée de la recherche globale : résultats classés, tous types confondus."""
+
+        rows = [dict(zip(RESULT_COLUMNS, row)) for row in self._search_ranked(query, limit=limit)]
+        communes = self.env["pharma.geo.commune"].browse({row["commune_id"] for row in rows if row["commune_id"]})
+        commune_names = dict(communes.name_get())
+        return [
+            {
+                "id": row["res_id"],
+                "model": row["res_model"],
+                "type": row["type_etablissement"],
+                "code": row["code"],
+                "name": row["name"],
+                "numero_telephone": row["numero_telephone"],
+                "holder_name": row["holder_name"],
+                "commune": commune_names.get(row["commune_id"], ""),
+            }
+            for row in rows
+        ]
+
+    @api.model
+    def name_search(self, name="", args=None, operator="ilike", limit=100):
+        if not name or operator != "ilike":
+            return super().name_search(name, args=args, operator=operator, limit=limit)
+        return self._search_ranked(name, limit=limit, domain=args, columns=("id", "name"))
+
+    @api.model
+    def _name_search(self, name, args=None, operator="ilike", limit=100, name_get_uid=None):
+        if not name or operator != "ilike":
+            return super()._name_search(name, args=args, operator=operator, limit=limit, name_get_uid=name_get_uid)
+        return [row[0] for row in self._search_ranked(name, limit=limit, domain=args, columns=("id",))]
+
+    @api.model
+    def search_nearby(self, latitude, longitude, radius_km, types=None, limit=50):
+        """Établissements de tous types situés à moins de ``radius_km`` d'un point.
+
+        Une seule requête sur la vue : chaque branche utilise l'index des
+        cellules de sa table, et les colonnes renvoyées sont lues par cette
+        même requête. Retourne des dictionnaires classés par distance.
+        """
+
+        where, params = "active", []
+        if types:
+            where += " AND type_etablissement IN %s"
+            params.append(tuple(types))
+        for model_name in ESTABLISHMENT_MODELS.values():
+            self.env[model_name].flush_model(["latitude", "longitude", "geo_cell", "active"])
+        rows = spatial.search_spatial(
+            self.env.cr,
+            self._table,
+            spatial.bbox_around(latitude, longitude, radius_km),
+            center=(latitude, longitude),
+            radius_km=radius_km,
+            limit=limit,
+            columns=", ".join(NEARBY_COLUMNS),
+            where=where,
+            params=params,
+        )
+        rows = [dict(zip(NEARBY_COLUMNS + ("distance",), row)) for row in rows]
+        ids_by_model = {}
+        for row in rows:
+            ids_by_model.setdefault(row["res_model"], []).append(row["res_id"])
+        allowed = {
+            model_name: set(self.env[model_name]._search([("id", "in", ids)]))
+            for model_name, ids in ids_by_model.items()
+            if self.env[model_name].check_access_rights("read", raise_exception=False)
+        }
+        return [
+            {
+                "id": row["res_id"],
+                "model": row["res_model"],
+                "type": row["type_etablissement"],
+                "code": row["code"],
+                "name": row["name"],
+                "latitude": row["latitude"],
+                "longitude": row["longitude"],
+                "distance_km": round(row["distance"], 3),
+            }
+            for row in rows
+            if row["res_id"] in allowed.get(row["res_model"], ())
+        ]
+
+    def action_open_record(self):
+        """Ouvrir la fiche d'origine de l'établissement."""
+
+        self.ensure_one()
+        return {
+            "type": "ir.actions.act_window",
+            "res_model": self.res_model,
+            "res_id": self.res_id,
+            "view_mode": "form",
+            "target": "current",
+        }
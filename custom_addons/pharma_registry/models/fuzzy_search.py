@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""Recherche par nom tolérante aux fautes de frappe et aux accents."""
+
+from odoo import api, models
+
+from ..tools import fuzzy
+
+
+class PharmaFuzzySearchMixin(models.AbstractModel):
+    """Compléter ``name_search`` par les noms les plus proches (pg_trgm).
+
+    Les correspondances exactes (ilike) restent en tête ; les fiches proches
+    au sens trigram sont ajoutées ensuite lorsque la limite n'est pas atteinte.
+    """
+
+    _name = "pharma.fuzzy.search.mixin"
+    _description = "Recherche approchée par nom"
+
+    @api.model
+    def _name_search(self, name, args=None, operator="ilike", limit=100, name_get_uid=None):
+        ids = list(
+            super()._name_search(name, args=args, operator=operator, limit=limit, name_get_uid=name_get_uid)
+        )
+        if not name or operator != "ilike" or (limit and len(ids) >= limit) or not fuzzy.is_available(self.env):
+            return ids
+        similar_ids = [
+            record_id
+            for record_id in fuzzy.find_similar_ids(self, name, limit=limit and limit * 2)
+            if record_id not in ids
+        ]
+        if similar_ids:
+            allowed = set(
+                self._search(list(args or []) + [("id", "in", similar_ids)], access_rights_uid=name_get_uid)
+            )
+            ids.extend(record_id for record_id in similar_ids if record_id in allowed)
+        return ids[:limit] if limit else ids
@@ -4,15 +4,216 @@
 from odoo import fields, models, api
 from odoo.exceptions import ValidationError
 
+from ..tools import geo_cache
+from ..tools.instrumentation import profiled
+
+# Nombre maximal de fiches nommées dans un message d'incohérence.
+INCOHERENCE_NAMES_LIMIT = 10
+
+# Paramètre système incrémenté à chaque modification du référentiel géographique.
+GEO_VERSION_PARAM = "pharma_registry.geo_version"
+
+# Champs dont la modification change la hiérarchie servie aux clients.
+GEO_VERSION_FIELDS = ("name", "region_id", "department_id")
+
+
+def get_geo_version(env):
+    """Retourner la version courante du référentiel géographique.
+
+    Le paramètre est lu directement (index unique sur la clé) plutôt que par
+    ``get_param`` : sa valeur validée est vue immédiatement par tous les
+    processus sans vider le cache de l'ORM à chaque modification.
+    """
+
+    env.cr.execute("SELECT value FROM ir_config_parameter WHERE key = %s", [GEO_VERSION_PARAM])
+    row = env.cr.fetchone()
+    try:
+        return int(row[0]) if row else 0
+    except ValueError:
+        return 0
+
+
+def bump_geo_version(env):
+    """Incrémenter la version du référentiel en une requête atomique.
+
+    L'incrément est fait par la base : deux transactions concurrentes
+    produisent deux versions distinctes.
+    """
+
+    env.cr.execute(
+        """
+        INSERT INTO ir_config_parameter (key, value, create_uid, write_uid, create_date, write_date)
+        VALUES (%(key)s, '1', %(uid)s, %(uid)s, now() at time zone 'UTC', now() at time zone 'UTC')
+        ON CONFLICT (key) DO UPDATE
+           SET value = (COALESCE(NULLIF(ir_config_parameter.value, ''), '0')::int + 1)::text,
+               write_uid = EXCLUDED.write_uid,
+               write_date = EXCLUDED.write_date
+        """,
+        {"key": GEO_VERSION_PARAM, "uid": env.uid},
+    )
+    # Une image lue pendant la transaction peut contenir des fiches annulées
+    # ensuite : elle est oubliée à la fin de la transaction, quelle qu'elle soit.
+    dbname = env.cr.dbname
+    geo_cache.invalidate(dbname)
+    env.cr.postcommit.add(lambda: geo_cache.invalidate(dbname))
+    env.cr.postrollback.add(lambda: geo_cache.invalidate(dbname))
+
+
+def get_geo_snapshot(env):
+    """Retourner l'image en cache du référentiel géographique.
+
+    ``regions``, ``departments`` et ``communes`` reprennent les listes de
+    :func:`build_geo_tree`, parents compris ; ``region_ids`` (nom ➔ id),
+    ``department_ids`` et ``commune_ids`` (id parent ➔ nom ➔ id) et
+    ``departments_by_name`` indexent les noms normalisés.
+    """
+
+    return geo_cache.get_snapshot(env.cr.dbname, get_geo_version(env), lambda: _load_geo_snapshot(env))
+
+
+def _load_geo_snapshot(env):
+    """Lire tout le référentiel en trois requêtes, indépendamment des droits de l'utilisateur."""
+
+    env = env(su=True)
+    regions = [
+        [region["id"], region["name"]]
+        for region in env["pharma.geo.region"].search_read([], ["name"], order="name")
+    ]
+    departments = [
+        [department["id"], department["name"], department["region_id"]]
+        for department in env["pharma.geo.department"].search_read(
+            [], ["name", "region_id"], order="name", load=None
+        )
+    ]
+    communes = [
+        [commune["id"], commune["name"], commune["department_id"], commune["region_id"]]
+        for commune in env["pharma.geo.commune"].search_read(
+            [], ["name", "department_id", "region_id"], order="name", load=None
+        )
+    ]
+    snapshot = {
+        "regions": regions,
+        "departments": departments,
+        "communes": communes,
+        "region_ids": {},
+        "department_ids": {},
+        "departments_by_name": {},
+        "commune_ids": {},
+    }
+    for region_id, name in regions:
+        snapshot["region_ids"].setdefault(geo_cache.normalize_name(name), region_id)
+    for department_id, name, region_id in departments:
+        key = geo_cache.normalize_name(name)
+        snapshot["department_ids"].setdefault(region_id, {}).setdefault(key, department_id)
+        snapshot["departments_by_name"].setdefault(key, department_id)
+    for commune_id, name, department_id, _region_id in communes:
+        key = geo_cache.normalize_name(name)
+        snapshot["commune_ids"].setdefault(department_id, {}).setdefault(key, commune_id)
+    return snapshot
+
+
+def build_geo_tree(env):
+    """Retourner toute la hiérarchie sous forme de listes compactes.
+
+    Régions ``[id, nom]``, départements ``[id, nom, région]``, communes
+    ``[id, nom, département, région]``, lues depuis le cache du référentiel.
+    """
+
+    for model_name in ("pharma.geo.region", "pharma.geo.department", "pharma.geo.commune"):
+        env[model_name].check_access_rights("read")
+    snapshot = get_geo_snapshot(env)
+    return {
+        "version": get_geo_version(env),
+        "regions": snapshot["regions"],
+        "departments": snapshot["departments"],
+        "communes": snapshot["communes"],
+    }
+
+
+def find_geo_incoherences(records, child_field, parent_field):
+    """Retourner, en une requête, les fiches dont le niveau ``child_field`` n'est
+    pas rattaché à leur ``parent_field`` (ex. département hors de la région)."""
+
+    record_ids = tuple(record_id for record_id in records.ids if isinstance(record_id, int))
+    if not record_ids:
+        return records.browse()
+    child_model = records.env[records._fields[child_field].comodel_name]
+    records.flush_recordset([child_field, parent_field])
+    child_model.flush_model([parent_field])
+    records.env.cr.execute(
+        f"""
+        SELECT rec.id
+          FROM "{records._table}" rec
+          JOIN "{child_model._table}" child ON child.id = rec."{child_field}"
+         WHERE rec.id IN %s
+           AND rec."{parent_field}" IS NOT NULL
+           AND child."{parent_field}" IS DISTINCT FROM rec."{parent_field}"
+        """,
+        [record_ids],
+    )
+    return records.browse(row[0] for row in records.env.cr.fetchall())
+
+
+def format_incoherences(message, records):
+    """Compléter un message d'erreur avec le nom des fiches concernées."""
+
+    names = records[:INCOHERENCE_NAMES_LIMIT].mapped("display_name")
+    if len(records) > INCOHERENCE_NAMES_LIMIT:
+        names.append("… (+%s)" % (len(records) - INCOHERENCE_NAMES_LIMIT))
+    return "%s\n%s" % (message, ", ".join(names))
+
+
+class PharmaGeoVersionMixin(models.AbstractModel):
+    """Incrémenter la version du référentiel quand la hiérarchie servie aux clients change.
+
+    Toute création ou suppression l'incrémente ; une écriture seulement si
+    elle modifie réellement un nom ou un parent.
+    """
+
+    _name = "pharma.geo.version.mixin"
+    _description = "Version du référentiel géographique"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        bump_geo_version(self.env)
+        return records
+
+    def write(self, vals):
+        changed = self._changes_geo_version(vals)
+        result = super().write(vals)
+        if changed:
+            bump_geo_version(self.env)
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        bump_geo_version(self.env)
+        return result
+
+    def _changes_geo_version(self, vals):
+        """Indiquer si ``vals`` modifie le nom ou le parent d'au moins une fiche."""
+
+        for field_name in GEO_VERSION_FIELDS:
+            if field_name not in vals or field_name not in self._fields:
+                continue
+            field = self._fields[field_name]
+            for record in self:
+                new_value = field.convert_to_record(field.convert_to_cache(vals[field_name], record), record)
+                if new_value != record[field_name]:
+                    return True
+        return False
+
 
 class PharmaGeoRegion(models.Model):
     """Niveau administratif supérieur utilisé par chaque établissement."""
 
     _name = "pharma.geo.region"
     _description = "Région sanitaire"
+    _inherit = ["pharma.fuzzy.search.mixin", "pharma.geo.version.mixin"]
     _order = "name"
 
-    name = fields.Char(string="Région", required=True)
+    name = fields.Char(string="Région", required=True, index="trigram")
     department_ids = fields.One2many("pharma.geo.department", "region_id", string="Départements")
 
     _sql_constraints = [
@@ -25,9 +226,10 @@ class PharmaGeoDepartment(models.Model):
 
     _name = "pharma.geo.department"
     _description = "Département sanitaire"
+    _inherit = ["pharma.fuzzy.search.mixin", "pharma.geo.version.mixin"]
     _order = "name"
 
-    name = fields.Char(string="Département", required=True)
+    name = fields.Char(string="Département", required=True, index="trigram")
     region_id = fields.Many2one("pharma.geo.region", string="Région", required=True, ondelete="restrict")
     commune_ids = fields.One2many("pharma.geo.commune", "department_id", string="Communes")
 
@@ -45,9 +247,10 @@ class PharmaGeoCommune(models.Model):
 
     _name = "pharma.geo.commune"
     _description = "Commune sanitaire"
+    _inherit = ["pharma.fuzzy.search.mixin", "pharma.geo.version.mixin"]
     _order = "name"
 
-    name = fields.Char(string="Commune", required=True)
+    name = fields.Char(string="Commune", required=True, index="trigram")
     region_id = fields.Many2one("pharma.geo.region", string="Région", required=True, ondelete="restrict")
     department_id = fields.Many2one(
         "pharma.geo.department",
@@ -65,12 +268,15 @@ class PharmaGeoCommune(models.Model):
     ]
 
     @api.constrains("department_id")
+    @profiled("_check_department_region", count=lambda records, _result: len(records))
     def _check_department_region(self):
         """Valider que le département appartient à la région sélectionnée."""
 
-        for record in self:
-            if record.department_id.region_id != record.region_id:
-                raise ValidationError("Le département doit appartenir à la région sélectionnée.")
+        invalid = find_geo_incoherences(self, "department_id", "region_id")
+        if invalid:
+            raise ValidationError(
+                format_incoherences("Le département doit appartenir à la région sélectionnée.", invalid)
+            )
 
     @api.onchange("region_id")
     def _onchange_region_id(self):
@@ -11,10 +11,10 @@ class PharmaGrossiste(models.Model):
     _description = "Grossiste répartiteur"
     _inherit = "pharma.establishment.base"
 
-    name = fields.Char(string="Nom grossiste répartiteur", required=True)
-    numero_telephone = fields.Char(string="Numéro téléphone", required=True)
+    name = fields.Char(string="Nom grossiste répartiteur", required=True, index="trigram")
+    numero_telephone = fields.Char(string="Numéro téléphone", required=True, index="trigram")
     annee_ouverture = fields.Integer(string="Année d'ouverture", required=True)
-    responsable_nom = fields.Char(string="Prénom et nom responsable / directeur", required=True)
+    responsable_nom = fields.Char(string="Prénom et nom responsable / directeur", required=True, index="trigram")
     nombre_employe_pharmacien = fields.Integer(string="Nombre d'employés pharmaciens", required=True)
     nombre_employe_non_pharmacien = fields.Integer(string="Nombre d'employés non pharmaciens", required=True)
     nombre_agent_securite = fields.Integer(string="Nombre d'agents de sécurité", required=True)
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""Tâches d'import exécutées en arrière-plan par lots validés."""
+
+import itertools
+import logging
+import time
+
+from psycopg2 import errors
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+# Durée maximale d'un passage du planificateur avant de rendre la main (secondes).
+JOB_TIME_BUDGET = 240
+
+# Conflits entre transactions concurrentes : le lot est repris au passage suivant.
+RETRYABLE_ERRORS = (errors.SerializationFailure, errors.DeadlockDetected)
+
+
+class PharmaImportJob(models.Model):
+    """Import de fichier confié au planificateur et suivi ligne à ligne."""
+
+    _name = "pharma.import.job"
+    _description = "Tâche d'import"
+    _order = "id desc"
+
+    name = fields.Char(string="Tâche", required=True)
+    wizard_model = fields.Char(string="Assistant", required=True, readonly=True)
+    options = fields.Json(string="Options", readonly=True)
+    file_data = fields.Binary(string="Fichier", attachment=True, readonly=True)
+    filename = fields.Char(string="Nom du fichier", readonly=True)
+    user_id = fields.Many2one(
+        "res.users",
+        string="Demandé par",
+        default=lambda self: self.env.user,
+        readonly=True,
+    )
+    state = fields.Selection(
+        [
+            ("queued", "En attente"),
+            ("running", "En cours"),
+            ("done", "Terminé"),
+            ("failed", "Échec"),
+            ("cancelled", "Annulé"),
+        ],
+        string="État",
+        default="queued",
+        required=True,
+        readonly=True,
+    )
+    chunk_size = fields.Integer(
+        string="Lignes par lot validé",
+        default=1000,
+        help="Nombre de lignes traitées entre deux validations (commit) de la transaction.",
+    )
+    total_rows = fields.Integer(string="Lignes à traiter", readonly=True)
+    processed_rows = fields.Integer(string="Lignes traitées", readonly=True)
+    progress = fields.Float(string="Progression", compute="_compute_progress")
+    counters = fields.Json(string="Compteurs", readonly=True)
+    missing_count = fields.Integer(string="Fiches absentes du fichier", compute="_compute_missing_count")
+    result_message = fields.Char(string="Résultat", readonly=True)
+    error_message = fields.Text(string="Erreurs", readonly=True)
+    date_start = fields.Datetime(string="Début", readonly=True)
+    date_end = fields.Datetime(string="Fin", readonly=True)
+    duration = fields.Float(string="Durée (s)", readonly=True)
+
+    @api.depends("total_rows", "processed_rows", "state")
+    def _compute_progress(self):
+        """Exprimer l'avancement en pourcentage des lignes traitées."""
+
+        for job in self:
+            if job.state == "done":
+                job.progress = 100.0
+            elif job.total_rows:
+                job.progress = 100.0 * job.processed_rows / job.total_rows
+            else:
+                job.progress = 0.0
+
+    @api.depends("counters")
+    def _compute_missing_count(self):
+        for job in self:
+            job.missing_count = len((job.counters or {}).get("missing_ids") or ())
+
+    # ------------------------------------------------------------------
+    # Actions
+    # ------------------------------------------------------------------
+    def action_retry(self):
+        """Reprendre une tâche en échec à partir de la dernière ligne validée."""
+
+        self.filtered(lambda job: job.state in ("failed", "cancelled")).write(
+            {"state": "queued", "error_message": False}
+        )
+        self._trigger_processing()
+
+    def action_cancel(self):
+        """Retirer de la file les tâches qui n'ont pas encore abouti."""
+
+        self.filtered(lambda job: job.state in ("queued", "running")).write({"state": "cancelled"})
+
+    def action_view_missing(self):
+        """Ouvrir les fiches déjà importées qui étaient absentes du fichier de la tâche."""
+
+        self.ensure_one()
+        return self._get_wizard()._get_missing_action(self.counters["missing_ids"])
+
+    def _trigger_processing(self):
+        """Demander un passage immédiat du planificateur des imports."""
+
+        cron = self.env.ref("pharma_registry.ir_cron_pharma_import_job", raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+
+    # ------------------------------------------------------------------
+    # Traitement par le planificateur
+    # ------------------------------------------------------------------
+    @api.model
+    def _cron_process_jobs(self, time_budget=JOB_TIME_BUDGET):
+        """Traiter les tâches en attente dans l'ordre, en validant chaque lot."""
+
+        deadline = time.monotonic() + time_budget
+        for job in self.search([("state", "in", ("queued", "running"))], order="id"):
+            if time.monotonic() >= deadline or not job._process(deadline):
+                job._trigger_processing()
+                break
+
+    def _process(self, deadline):
+        """Avancer une tâche jusqu'à la fin du fichier ou jusqu'à l'échéance.
+
+        Chaque lot est validé (commit) avec la progression : une tâche
+        interrompue reprend à la première ligne non validée. Retourne True
+        lorsque la tâche est terminée.
+        """
+
+        self.ensure_one()
+        if not self.date_start:
+            self.date_start = fields.Datetime.now()
+        self.state = "running"
+        started = time.monotonic()
+
+        try:
+            wizard = self._get_wizard()
+            if not self.total_rows:
+                self.total_rows = sum(1 for _row in wizard._iter_rows())
+                if not self.total_rows:
+                    raise UserError(_("Le fichier ne contient aucune donnée."))
+            import_context = wizard._start_import()
+            import_context["counters"].update(self.counters or {})
+            rows = wizard._iter_rows()
+            # Ignorer les lignes déjà validées lors d'un passage précédent.
+            next(itertools.islice(rows, self.processed_rows, self.processed_rows), None)
+
+            while True:
+                chunk = list(itertools.islice(rows, max(self.chunk_size, 1)))
+                if not chunk:
+                    break
+                counters = wizard._import_rows(chunk, import_context)
+                self._store_matched_ids(wizard._pop_matched_ids(import_context))
+                self.write(
+                    {
+                        "processed_rows": self.processed_rows + len(chunk),
+                        "counters": dict(counters),
+                        "duration": self.duration + time.monotonic() - started,
+                    }
+                )
+                started = time.monotonic()
+                self.env.cr.commit()
+                if self._is_cancelled():
+                    return True
+                if time.monotonic() >= deadline:
+                    return False
+            wizard._restore_matched_ids(import_context, self._load_matched_ids())
+            counters = wizard._finish_import(import_context)
+        except RETRYABLE_ERRORS as error:
+            self.env.cr.rollback()
+            _logger.info(
+                "Tâche d'import %s interrompue par un accès concurrent, reprise au prochain passage : %s",
+                self.id,
+                error,
+            )
+            return False
+        except Exception as error:  # pylint: disable=broad-except
+            self.env.cr.rollback()
+            if self._is_cancelled():
+                return True
+            _logger.exception("Échec de la tâche d'import %s", self.id)
+            self.write(
+                {
+                    "state": "failed",
+                    "error_message": _("Lot débutant à la ligne %s : %s") % (self.processed_rows + 1, error),
+                    "date_end": fields.Datetime.now(),
+                }
+            )
+            self.env.cr.commit()
+            return True
+
+        if self._is_cancelled():
+            self.env.cr.rollback()
+            return True
+        self.write(
+            {
+                "state": "done",
+                "counters": dict(counters),
+                "result_message": wizard._get_result_message(counters),
+                "date_end": fields.Datetime.now(),
+                "duration": self.duration + time.monotonic() - started,
+            }
+        )
+        self.env.cr.commit()
+        return True
+
+    def _get_wizard(self):
+        """Reconstruire en mémoire l'assistant de la tâche, lisant le fichier depuis sa pièce jointe.
+
+        Le fichier n'est ni décodé ni recopié : l'assistant lit directement la
+        pièce jointe de la tâche, en flux. L'assistant agit avec les droits et
+        les règles d'accès de l'utilisateur qui a demandé l'import.
+        """
+
+        attachment = self.env["ir.attachment"].sudo().search(
+            [("res_model", "=", self._name), ("res_field", "=", "file_data"), ("res_id", "=", self.id)],
+            limit=1,
+        )
+        if not attachment:
+            raise UserError(_("Le fichier de la tâche est introuvable."))
+        if not self.user_id:
+            raise UserError(_("La tâche n'a pas de demandeur dont appliquer les droits."))
+        return (
+            self.env[self.wizard_model]
+            .with_user(self.user_id)
+            .with_context(pharma_import_attachment_id=attachment.id)
+            .new(dict(self.options or {}, filename=self.filename))
+        )
+
+    def _store_matched_ids(self, record_ids):
+        """Ajouter en une requête les fiches rapprochées par un lot à celles de la tâche.
+
+        Elles sont validées avec le lot, sans être réécrites dans les
+        compteurs à chaque lot.
+        """
+
+        if record_ids:
+            self.env.cr.execute(
+                """
+                INSERT INTO pharma_import_job_match (job_id, res_id)
+                SELECT %s, unnest(%s::int[])
+                ON CONFLICT (job_id, res_id) DO NOTHING
+                """,
+                [self.id, list(record_ids)],
+            )
+
+    def _load_matched_ids(self):
+        """Retourner les fiches rapprochées par tous les lots validés de la tâche."""
+
+        self.env.cr.execute("SELECT res_id FROM pharma_import_job_match WHERE job_id = %s", [self.id])
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    def _is_cancelled(self):
+        """Relire l'état validé de la tâche : une annulation peut venir d'une autre transaction."""
+
+        self.invalidate_recordset(["state"])
+        return self.state == "cancelled"
+
+
+class PharmaImportJobMatch(models.Model):
+    """Fiche rapprochée par une tâche d'import différentiel, conservée d'un passage à l'autre."""
+
+    _name = "pharma.import.job.match"
+    _description = "Fiche rapprochée par une tâche d'import"
+    _log_access = False
+
+    job_id = fields.Many2one("pharma.import.job", string="Tâche", required=True, ondelete="cascade")
+    res_id = fields.Integer(string="Fiche", required=True)
+
+    _sql_constraints = [
+        (
+            "pharma_import_job_match_unique",
+            "unique(job_id, res_id)",
+            "Une fiche n'est rapprochée qu'une fois par tâche.",
+        ),
+    ]
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+from odoo import models
+
+from .geo import get_geo_version
+
+
+class IrHttp(models.AbstractModel):
+    """Transmettre au client web la version du référentiel géographique."""
+
+    _inherit = "ir.http"
+
+    def session_info(self):
+        info = super().session_info()
+        info["pharma_geo_version"] = get_geo_version(self.env)
+        return info
@@ -11,8 +11,8 @@ class PharmaOfficine(models.Model):
     _description = "Officine"
     _inherit = "pharma.establishment.base"
 
-    name = fields.Char(string="Nom de l'officine", required=True)
-    numero_telephone = fields.Char(string="Numéro téléphone", required=True)
+    name = fields.Char(string="Nom de l'officine", required=True, index="trigram")
+    numero_telephone = fields.Char(string="Numéro téléphone", required=True, index="trigram")
     annee_creation = fields.Integer(string="Année de création", required=True)
     annee_exploitation = fields.Integer(string="Année d'exploitation", required=True)
     statut = fields.Selection(
@@ -22,11 +22,12 @@ class PharmaOfficine(models.Model):
             ("creation","Création"),
         ],
         string="Statut (Transfert / Rachat / Création)",
+        index=True,
     )
-    titulaire_nom = fields.Char(string="Prénom et nom titulaire / pharmacien responsable", required=True)
+    titulaire_nom = fields.Char(string="Prénom et nom titulaire / pharmacien responsable", required=True, index="trigram")
     numero_ordre = fields.Char(string="Numéro d'inscription ordre des pharmaciens", required=True)
     sexe_titulaire = fields.Selection(
-        [("f", "Féminin"), ("m", "Masculin"),],
+        [("f", "Féminin"), ("m", "Masculin"), ("na", "Non renseigné")],
         string="Sexe",
     )
     tranche_age = fields.Selection(
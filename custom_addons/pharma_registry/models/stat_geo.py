@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""Statistiques des établissements agrégées par commune et tenues à jour à chaque écriture."""
+
+from odoo import api, fields, models
+
+from .establishment import ESTABLISHMENT_MODELS
+
+# Champs numériques additionnés par commune (0 pour les types qui ne les portent pas).
+STAT_SUM_FIELDS = (
+    "nombre_employe_pharmacien",
+    "nombre_employe_non_pharmacien",
+    "nombre_assistants",
+    "nombre_agent_securite",
+    "nombre_agent_hygiene",
+    "nombre_vehicule",
+    "chiffre_affaire",
+)
+
+# Champs d'un établissement dont la modification change les agrégats.
+STAT_TRIGGER_FIELDS = frozenset(("commune_id", "active") + STAT_SUM_FIELDS)
+
+# Clé des communes à recalculer dans les données de validation du curseur.
+PENDING_KEY = "pharma.stat.geo.pending"
+
+
+class PharmaStatGeo(models.Model):
+    """Une ligne par type d'établissement et par commune.
+
+    Les agrégats de région et de département s'obtiennent par ``read_group``
+    sur cette table, dont la taille ne dépend que du référentiel géographique.
+    Les écritures d'établissements ne font que noter les communes touchées :
+    elles sont recalculées ensemble, par commune croissante, juste avant la
+    validation de la transaction.
+    """
+
+    _name = "pharma.stat.geo"
+    _description = "Statistiques géographiques des établissements"
+    _order = "region_id, department_id, commune_id, type_etablissement"
+    _log_access = False
+
+    type_etablissement = fields.Selection(
+        [
+            ("officine", "Officine"),
+            ("depot", "Dépôt de médicaments"),
+            ("grossiste", "Grossiste répartiteur"),
+            ("agence", "Agence de promotion"),
+            ("fabrication", "Établissement de fabrication"),
+        ],
+        string="Type d'établissement",
+        required=True,
+        readonly=True,
+    )
+    commune_id = fields.Many2one(
+        "pharma.geo.commune", string="Commune", required=True, readonly=True, ondelete="cascade"
+    )
+    department_id = fields.Many2one(
+        "pharma.geo.department", string="Département", related="commune_id.department_id", store=True, index=True
+    )
+    region_id = fields.Many2one(
+        "pharma.geo.region", string="Région", related="commune_id.region_id", store=True, index=True
+    )
+    establishment_count = fields.Integer(string="Établissements actifs", readonly=True)
+    nombre_employe_pharmacien = fields.Integer(string="Employés pharmaciens", readonly=True)
+    nombre_employe_non_pharmacien = fields.Integer(string="Employés non pharmaciens", readonly=True)
+    nombre_assistants = fields.Integer(string="Assistants", readonly=True)
+    nombre_agent_securite = fields.Integer(string="Agents de sécurité", readonly=True)
+    nombre_agent_hygiene = fields.Integer(string="Agents d'hygiène", readonly=True)
+    nombre_vehicule = fields.Integer(string="Véhicules", readonly=True)
+    chiffre_affaire = fields.Float(string="Chiffre d'affaires (FCFA)", readonly=True)
+
+    _sql_constraints = [
+        (
+            "pharma_stat_geo_unique",
+            "unique(type_etablissement, commune_id)",
+            "Une seule ligne de statistiques par type et par commune.",
+        ),
+    ]
+
+    def init(self):
+        """Alimenter la table à l'installation à partir des établissements existants."""
+
+        self.env.cr.execute(f'SELECT 1 FROM "{self._table}" LIMIT 1')
+        if not self.env.cr.fetchone():
+            for type_etablissement in ESTABLISHMENT_MODELS:
+                self._refresh(type_etablissement)
+
+    @api.model
+    def _refresh(self, type_etablissement, commune_ids=None):
+        """Recalculer en une requête les lignes d'un type pour les communes indiquées.
+
+        Sans ``commune_ids``, toutes les communes sont recalculées. Une commune
+        qui n'a plus d'établissement actif garde une ligne à zéro.
+        """
+
+        if commune_ids is not None:
+            commune_ids = tuple(commune_id for commune_id in commune_ids if commune_id)
+            if not commune_ids:
+                return
+        Establishment = self.env[ESTABLISHMENT_MODELS[type_etablissement]]
+        Establishment.flush_model(
+            ["commune_id", "active"] + [name for name in STAT_SUM_FIELDS if name in Establishment._fields]
+        )
+        self.env["pharma.geo.commune"].flush_model(["region_id", "department_id"])
+        sums = ", ".join(
+            f'COALESCE(SUM(est."{field_name}"), 0)' if field_name in Establishment._fields else "0"
+            for field_name in STAT_SUM_FIELDS
+        )
+        columns = ", ".join(f'"{field_name}"' for field_name in STAT_SUM_FIELDS)
+        updates = ", ".join(f'"{field_name}" = EXCLUDED."{field_name}"' for field_name in STAT_SUM_FIELDS)
+        where = "WHERE commune.id IN %(commune_ids)s" if commune_ids is not None else ""
+        self.env.cr.execute(
+            f"""
+            INSERT INTO "{self._table}" (type_etablissement, commune_id, department_id, region_id,
+                                         establishment_count, {columns})
+            SELECT %(type)s, commune.id, commune.department_id, commune.region_id, COUNT(est.id), {sums}
+              FROM pharma_geo_commune commune
+              LEFT JOIN "{Establishment._table}" est ON est.commune_id = commune.id AND est.active
+              {where}
+             GROUP BY commune.id
+             ORDER BY commune.id
+            ON CONFLICT (type_etablissement, commune_id) DO UPDATE
+               SET department_id = EXCLUDED.department_id,
+                   region_id = EXCLUDED.region_id,
+                   establishment_count = EXCLUDED.establishment_count,
+                   {updates}
+            """,
+            {"type": type_etablissement, "commune_ids": commune_ids},
+        )
+        self.invalidate_model()
+
+    @api.model
+    def _refresh_establishments(self, model_name, commune_ids):
+        """Noter les communes touchées par une écriture sur un modèle d'établissement.
+
+        Le recalcul a lieu avant la validation (``cr.precommit``) : les lignes
+        de statistiques ne sont verrouillées que le temps de la validation, et
+        toujours dans le même ordre, ce qui évite les interblocages entre
+        transactions écrivant les mêmes communes.
+        """
+
+        commune_ids = {commune_id for commune_id in commune_ids if commune_id}
+        if not commune_ids:
+            return
+        data = self.env.cr.precommit.data
+        if PENDING_KEY not in data:
+            data[PENDING_KEY] = {}
+            self.env.cr.precommit.add(self._flush_pending_refresh)
+        for type_etablissement, establishment_model in ESTABLISHMENT_MODELS.items():
+            if establishment_model == model_name:
+                data[PENDING_KEY].setdefault(type_etablissement, set()).update(commune_ids)
+
+    @api.model
+    def _flush_pending_refresh(self):
+        """Recalculer les communes notées dans la transaction, par type puis commune croissante."""
+
+        pending = self.env.cr.precommit.data.pop(PENDING_KEY, None) or {}
+        for type_etablissement in sorted(pending):
+            self._refresh(type_etablissement, sorted(pending[type_etablissement]))
+
+    @api.model
+    def _affects_stats(self, vals):
+        """Indiquer si des valeurs écrites sur un établissement modifient les agrégats."""
+
+        return not STAT_TRIGGER_FIELDS.isdisjoint(vals)
+
+    @api.model
+    def refresh_all(self):
+        """Reconstruire toutes les statistiques à partir des établissements."""
+
+        self.check_access_rights("write")
+        self.env.cr.precommit.data.pop(PENDING_KEY, None)
+        for type_etablissement in ESTABLISHMENT_MODELS:
+            self._refresh(type_etablissement)
+        return True
+
+    def action_refresh_all(self):
+        """Recalculer les statistiques depuis la liste et la recharger."""
+
+        self.refresh_all()
+        return {"type": "ir.actions.client", "tag": "reload"}
+
+    @api.model
+    def get_totals(self, groupby="region_id", domain=None):
+        """Retourner les totaux agrégés par ``groupby`` (région, département, commune ou type)."""
+
+        self._flush_pending_refresh()
+        return self.read_group(
+            domain or [],
+            ["establishment_count:sum"] + ["%s:sum" % field_name for field_name in STAT_SUM_FIELDS],
+            [groupby],
+            lazy=False,
+        )
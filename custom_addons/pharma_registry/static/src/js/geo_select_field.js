@@ -0,0 +1,137 @@
+/** @odoo-module **/
+/**
+ * Listes déroulantes en cascade région ➔ département ➔ commune.
+ *
+ * Le référentiel complet est chargé une fois par version depuis
+ * /pharma_registry/geo_tree ; le filtrage par parent se fait ensuite
+ * dans le navigateur, sans appel serveur.
+ */
+
+import { Component, onWillStart } from "@odoo/owl";
+import { registry } from "@web/core/registry";
+import { session } from "@web/session";
+import { standardFieldProps } from "@web/views/fields/standard_field_props";
+
+// Niveau de la hiérarchie servi par chaque modèle géographique.
+const LEVELS = {
+    "pharma.geo.region": "regions",
+    "pharma.geo.department": "departments",
+    "pharma.geo.commune": "communes",
+};
+
+// Arbres déjà chargés (promesses), par version du référentiel.
+const trees = {};
+
+export function loadGeoTree(version) {
+    if (!trees[version]) {
+        trees[version] = fetch(`/pharma_registry/geo_tree?v=${encodeURIComponent(version)}`, {
+            credentials: "same-origin",
+        })
+            .then((response) => {
+                if (!response.ok) {
+                    throw new Error(response.statusText);
+                }
+                return response.json();
+            })
+            .then((tree) => {
+                tree.byId = {};
+                for (const level of Object.values(LEVELS)) {
+                    tree.byId[level] = new Map(tree[level].map((item) => [item[0], item]));
+                }
+                return tree;
+            })
+            .catch((error) => {
+                delete trees[version];
+                throw error;
+            });
+    }
+    return trees[version];
+}
+
+export class GeoSelectField extends Component {
+    setup() {
+        onWillStart(async () => {
+            this.tree = await loadGeoTree(session.pharma_geo_version || 0);
+        });
+    }
+
+    get level() {
+        return LEVELS[this.props.record.fields[this.props.name].relation];
+    }
+
+    get currentId() {
+        return this.props.value ? this.props.value[0] : false;
+    }
+
+    get displayName() {
+        return this.props.value ? this.props.value[1] : "";
+    }
+
+    getParentId(fieldName) {
+        const value = this.props.record.data[fieldName];
+        return value ? value[0] : false;
+    }
+
+    get options() {
+        const regionId = this.getParentId("region_id");
+        const departmentId = this.getParentId("department_id");
+        if (this.level === "departments") {
+            return this.tree.departments.filter((item) => !regionId || item[2] === regionId);
+        }
+        if (this.level === "communes") {
+            return this.tree.communes.filter((item) =>
+                departmentId ? item[2] === departmentId : !regionId || item[3] === regionId
+            );
+        }
+        return this.tree.regions;
+    }
+
+    /**
+     * Valeurs à écrire pour un choix : le parent est déduit de l'enfant
+     * et les enfants qui n'appartiennent plus au parent sont vidés.
+     */
+    getChanges(item) {
+        const data = this.props.record.data;
+        const byId = this.tree.byId;
+        const changes = { [this.props.name]: item ? [item[0], item[1]] : false };
+        const link = (fieldName, level, id) => {
+            if (fieldName in data) {
+                const parent = id && byId[level].get(id);
+                changes[fieldName] = parent ? [parent[0], parent[1]] : false;
+            }
+        };
+        if (this.level === "communes" && item) {
+            link("department_id", "departments", item[2]);
+            link("region_id", "regions", item[3]);
+        } else if (this.level === "departments") {
+            if (item) {
+                link("region_id", "regions", item[2]);
+            }
+            const commune = byId.communes.get(this.getParentId("commune_id"));
+            if ("commune_id" in data && commune && (!item || commune[2] !== item[0])) {
+                changes.commune_id = false;
+            }
+        } else if (this.level === "regions") {
+            const department = byId.departments.get(this.getParentId("department_id"));
+            if ("department_id" in data && department && (!item || department[2] !== item[0])) {
+                changes.department_id = false;
+            }
+            const commune = byId.communes.get(this.getParentId("commune_id"));
+            if ("commune_id" in data && commune && (!item || commune[3] !== item[0])) {
+                changes.commune_id = false;
+            }
+        }
+        return changes;
+    }
+
+    onChange(ev) {
+        const item = this.tree.byId[this.level].get(parseInt(ev.target.value, 10));
+        this.props.record.update(this.getChanges(item));
+    }
+}
+
+GeoSelectField.template = "pharma_registry.GeoSelectField";
+GeoSelectField.props = { ...standardFieldProps };
+GeoSelectField.supportedTypes = ["many2one"];
+
+registry.category("fields").add("pharma_geo_select", GeoSelectField);
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+from . import test_compact
+from . import test_establishment
+from . import test_fuzzy
+from . import test_geo
+from . import test_import_benchmark
+from . import test_import_establishment
+from . import test_import_job
+from . import test_photo
+from . import test_search_stats
+from . import test_spatial
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Générateur de référentiels et de fichiers d'établissements synthétiques."""
+
+import base64
+import csv
+import datetime
+import importlib.util
+import io
+import os
+import random
+
+from odoo.modules.module import get_module_path
+from odoo.tests import TransactionCase
+
+from odoo.addons.pharma_registry.wizards.import_establishment import (
+    ADDRESS_HEADERS,
+    NAME_HEADERS,
+    TYPE_COLUMNS,
+)
+
+
+class SyntheticRegistryGenerator:
+    """Produire des fichiers d'import déterministes de taille paramétrable.
+
+    La même graine produit toujours les mêmes fichiers, ce qui rend les
+    mesures comparables d'un commit à l'autre.
+    """
+
+    def __init__(self, prefix="BENCH", regions=14, departments_per_region=3, communes_per_department=10, seed=2024):
+        self.prefix = prefix
+        self.regions = regions
+        self.departments_per_region = departments_per_region
+        self.communes_per_department = communes_per_department
+        self.seed = seed
+
+    def geo_rows(self):
+        """Retourner une ligne REGION / DEPARTEMENT / COMMUNE par commune."""
+
+        rows = []
+        for region in range(self.regions):
+            region_name = f"{self.prefix} Région {region:02d}"
+            for department in range(self.departments_per_region):
+                department_name = f"{region_name} Département {department:02d}"
+                for commune in range(self.communes_per_department):
+                    rows.append(
+                        {
+                            "REGION": region_name,
+                            "DEPARTEMENT": department_name,
+                            "COMMUNE": f"{department_name} Commune {commune:02d}",
+                        }
+                    )
+        return rows
+
+    def establishment_rows(self, type_etablissement, count):
+        """Retourner ``count`` lignes valides au format attendu par l'assistant."""
+
+        rng = random.Random(f"{self.seed}-{type_etablissement}")
+        geo_rows = self.geo_rows()
+        rows = []
+        for index in range(count):
+            geo = geo_rows[rng.randrange(len(geo_rows))]
+            row = dict(geo)
+            row.update(
+                {
+                    NAME_HEADERS[type_etablissement]: f"{self.prefix} {type_etablissement} {index:07d}",
+                    ADDRESS_HEADERS[type_etablissement]: f"{index} rue {rng.randrange(1, 500)}",
+                    "QUARTIER": f"Quartier {rng.randrange(1, 200)}",
+                    "LATITUDE": f"{rng.uniform(12.3, 16.7):.6f}",
+                    "LONGITUDE": f"{rng.uniform(-17.5, -11.4):.6f}",
+                    "OBSERVATIONS": "",
+                }
+            )
+            for field_name, headers, kind, _required in TYPE_COLUMNS[type_etablissement]:
+                row[headers[0]] = self._fake_value(rng, field_name, kind, index)
+            rows.append(row)
+        return rows
+
+    @staticmethod
+    def _fake_value(rng, field_name, kind, index):
+        if kind == "int":
+            if field_name.startswith("annee"):
+                return str(rng.randrange(1960, 2024))
+            return str(rng.randrange(0, 30))
+        if kind == "float":
+            return f"{rng.uniform(1e6, 5e8):.2f}"
+        if kind == "date":
+            return (datetime.date(2000, 1, 1) + datetime.timedelta(days=rng.randrange(9000))).isoformat()
+        if kind == "sexe":
+            return rng.choice(("F", "M", ""))
+        if kind == "tranche":
+            return rng.choice(("25-29", "30-39", "40-49", "50-59", "60 et plus", ""))
+        if kind == "statut":
+            return rng.choice(("Transfert", "Rachat", "Création"))
+        if field_name.startswith("numero_") and field_name != "numero_telephone":
+            return f"{field_name[7:].upper()}-{index:07d}"
+        if field_name == "numero_telephone":
+            return f"77{rng.randrange(10 ** 7):07d}"
+        return f"{field_name} {rng.randrange(10 ** 6)}"
+
+    @staticmethod
+    def to_csv(rows):
+        """Encoder des lignes en CSV base64, prêt pour le champ ``file_data``."""
+
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+        return base64.b64encode(buffer.getvalue().encode("utf-8"))
+
+
+class PharmaRegistryCase(TransactionCase):
+    """Référentiel synthétique réduit (2 régions, 4 départements, 8 communes) et assistants d'import."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.generator = SyntheticRegistryGenerator(
+            prefix="TEST", regions=2, departments_per_region=2, communes_per_department=2
+        )
+        cls.env["pharma.import.geo.wizard"].create(
+            {"file_data": cls.generator.to_csv(cls.generator.geo_rows()), "filename": "geo.csv"}
+        )._run_import()
+        cls.communes = cls.env["pharma.geo.commune"].search([("name", "=like", "TEST %")], order="id")
+        cls.commune = cls.communes[0]
+
+    def _import_wizard(self, rows, **values):
+        """Préparer un assistant d'import de dépôts pour ``rows``."""
+
+        return self.env["pharma.import.establishment.wizard"].create(
+            dict(
+                {"type_etablissement": "depot", "file_data": self.generator.to_csv(rows), "filename": "depot.csv"},
+                **values,
+            )
+        )
+
+    def _import(self, rows, **values):
+        """Importer ``rows`` comme dépôts dans la transaction et retourner les compteurs."""
+
+        return self._import_wizard(rows, **values)._run_import()
+
+    @classmethod
+    def _depot_vals(cls, name, latitude=0.0, longitude=0.0, commune=None):
+        """Valeurs d'un dépôt dans ``commune`` (par défaut la première) aux coordonnées données."""
+
+        commune = commune or cls.commune
+        return {
+            "name": name,
+            "numero_telephone": "770000000",
+            "annee_ouverture": 2020,
+            "responsable_nom": "Responsable",
+            "quartier": "Quartier",
+            "adresse": "Adresse",
+            "region_id": commune.region_id.id,
+            "department_id": commune.department_id.id,
+            "commune_id": commune.id,
+            "latitude": latitude,
+            "longitude": longitude,
+        }
+
+    @classmethod
+    def _create_depot(cls, name, latitude=0.0, longitude=0.0, commune=None):
+        """Créer un dépôt dans ``commune`` (par défaut la première) aux coordonnées données."""
+
+        return cls.env["pharma.depot"].create(cls._depot_vals(name, latitude, longitude, commune))
+
+    def _run_migration(self, script, version="16.0.1.0.0"):
+        """Exécuter un script de migration 16.0.1.1.0 comme depuis ``version``."""
+
+        path = os.path.join(get_module_path("pharma_registry"), "migrations", "16.0.1.1.0", script)
+        spec = importlib.util.spec_from_file_location("pharma_registry_migration", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.migrate(self.env.cr, version)
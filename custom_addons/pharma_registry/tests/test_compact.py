@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""Projection compacte paginée des établissements et son ETag."""
+
+from odoo.tests import HttpCase, tagged
+
+from .common import PharmaRegistryCase
+
+
+class CompactFeedCase(PharmaRegistryCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.feed_commune = cls.communes[-1]
+        cls.depots = cls.env["pharma.depot"]
+        for index in range(3):
+            cls.depots |= cls._create_depot("Compact %s" % index, 14.7, -17.4, commune=cls.feed_commune)
+        cls.domain = cls.env["pharma.depot"]._get_compact_domain(commune_id=cls.feed_commune.id)
+
+    def setUp(self):
+        super().setUp()
+        # La date de modification est celle du début de la transaction : les fiches sont
+        # vieillies pour qu'une écriture du test la fasse changer.
+        self.depots.flush_recordset()
+        self.env.cr.execute(
+            "UPDATE pharma_depot SET write_date = write_date - interval '1 day' WHERE id IN %s",
+            [tuple(self.depots.ids)],
+        )
+        self.depots.invalidate_recordset(["write_date"])
+
+
+class TestCompactFeed(CompactFeedCase):
+    def _etag(self, after=0, limit=2):
+        return self.env["pharma.depot"].get_compact_etag(self.domain, after, limit)
+
+    def test_compact_page(self):
+        page = self.env["pharma.depot"].get_compact_page(self.domain, limit=2)
+        self.assertEqual([row[0] for row in page["rows"]], self.depots[:2].ids)
+        self.assertEqual(page["next"], self.depots[1].id)
+        self.assertEqual(page["communes"], {self.feed_commune.id: self.feed_commune.name})
+
+        page = self.env["pharma.depot"].get_compact_page(self.domain, after=page["next"], limit=2)
+        self.assertEqual([row[0] for row in page["rows"]], self.depots[2:].ids)
+        self.assertIsNone(page["next"])
+
+    def test_etag_follows_page_records(self):
+        first_page, second_page = self._etag(), self._etag(after=self.depots[1].id)
+        self.assertEqual(self._etag(), first_page)
+        self.assertNotEqual(first_page, second_page)
+
+        # Une fiche hors de la page ne change pas son empreinte.
+        self.depots[2].name = "Compact modifié"
+        self.assertEqual(self._etag(), first_page)
+        self.assertNotEqual(self._etag(after=self.depots[1].id), second_page)
+
+        self.depots[0].name = "Compact modifié"
+        changed = self._etag()
+        self.assertNotEqual(changed, first_page)
+
+        self.depots[1].active = False
+        self.assertNotEqual(self._etag(), changed)
+
+    def test_etag_follows_geo_version(self):
+        etag = self._etag()
+        self.feed_commune.name += " bis"
+        self.assertNotEqual(self._etag(), etag)
+
+
+@tagged("post_install", "-at_install")
+class TestCompactRoute(HttpCase, CompactFeedCase):
+    def test_not_modified(self):
+        self.env["res.users"].create(
+            {
+                "name": "Lecteur du registre",
+                "login": "pharma_feed_user",
+                "password": "pharma_feed_user",
+                "groups_id": [(6, 0, [self.env.ref("pharma_registry.group_pharma_user").id])],
+            }
+        )
+        self.authenticate("pharma_feed_user", "pharma_feed_user")
+        url = "/pharma_registry/establishments/depot?commune_id=%s&limit=2" % self.feed_commune.id
+
+        response = self.url_open(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row[0] for row in response.json()["rows"]], self.depots[:2].ids)
+        etag = response.headers["ETag"]
+
+        response = self.url_open(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.content)
+
+        self.depots[0].name = "Compact modifié"
+        self.depots.flush_recordset()
+        response = self.url_open(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
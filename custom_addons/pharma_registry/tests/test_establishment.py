@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Codes des établissements et contrôles de cohérence géographique."""
+
+from odoo.exceptions import ValidationError
+
+from odoo.addons.pharma_registry.models.geo import INCOHERENCE_NAMES_LIMIT
+
+from .common import PharmaRegistryCase
+
+
+class TestCodeReservation(PharmaRegistryCase):
+    def setUp(self):
+        super().setUp()
+        self.Depot = self.env["pharma.depot"]
+        self.sequence = self.env.ref("pharma_registry.seq_pharma_depot_code")
+
+    def _next_number(self):
+        self.sequence.invalidate_recordset(["number_next_actual"])
+        return self.sequence.number_next_actual
+
+    def test_reserve_codes(self):
+        for implementation in ("standard", "no_gap"):
+            with self.subTest(implementation=implementation):
+                self.sequence.write({"implementation": implementation, "number_increment": 2})
+                first = self._next_number()
+                codes = self.Depot._reserve_codes(3)
+                self.assertEqual(codes, ["dep-" + self.sequence.get_next_char(first + 2 * step) for step in range(3)])
+                self.assertEqual(self._next_number(), first + 6)
+
+    def test_create_assigns_consecutive_codes(self):
+        first = self._next_number()
+        depots = self._create_depot("Premier") | self._create_depot("Second")
+        depots |= self.Depot.create(
+            [dict(vals, name=name) for vals, name in zip(depots.copy_data(), ("Troisième", "Quatrième"))]
+        )
+        self.assertEqual(
+            depots.mapped("code"), ["dep-" + self.sequence.get_next_char(first + step) for step in range(4)]
+        )
+
+
+class TestGeoCoherence(PharmaRegistryCase):
+    def setUp(self):
+        super().setUp()
+        self.other = self.communes.filtered(lambda commune: commune.region_id != self.commune.region_id)[0]
+
+    def test_region_incoherences_reported_together(self):
+        count = INCOHERENCE_NAMES_LIMIT + 2
+        vals_list = [
+            dict(self._depot_vals("Incohérent %02d" % index), region_id=self.other.region_id.id)
+            for index in range(count)
+        ]
+        with self.assertRaises(ValidationError) as caught:
+            self.env["pharma.depot"].create(vals_list)
+        message = caught.exception.args[0]
+        self.assertIn("n'appartient pas à la région", message)
+        named = [index for index in range(count) if "Incohérent %02d" % index in message]
+        self.assertEqual(len(named), INCOHERENCE_NAMES_LIMIT)
+        self.assertIn("(+2)", message)
+
+    def test_department_incoherence_on_write(self):
+        depots = self._create_depot("Premier") | self._create_depot("Second")
+        with self.assertRaisesRegex(ValidationError, "n'appartient pas au département"):
+            depots.write({"commune_id": self.other.id})
+        depots.write(
+            {
+                "region_id": self.other.region_id.id,
+                "department_id": self.other.department_id.id,
+                "commune_id": self.other.id,
+            }
+        )
+        self.assertEqual(depots.commune_id, self.other)
+
+    def test_commune_department_region(self):
+        with self.assertRaisesRegex(ValidationError, "Premier.*Second|Second.*Premier"):
+            self.env["pharma.geo.commune"].create(
+                [
+                    {
+                        "name": name,
+                        "region_id": self.other.region_id.id,
+                        "department_id": self.commune.department_id.id,
+                    }
+                    for name in ("Premier", "Second")
+                ]
+            )
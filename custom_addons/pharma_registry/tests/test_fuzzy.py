@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Rapprochement approché (pg_trgm) à l'import et dans la recherche par nom."""
+
+from odoo.addons.pharma_registry.tools import fuzzy
+
+from .common import PharmaRegistryCase
+
+
+class TestFuzzyMatching(PharmaRegistryCase):
+    def setUp(self):
+        super().setUp()
+        if not fuzzy.is_available(self.env):
+            self.skipTest("L'extension pg_trgm n'est pas installée.")
+        self.Depot = self.env["pharma.depot"]
+        self.target = self._create_depot("Pharmacie Keur Massar")
+
+    def _row(self, name):
+        row = self.generator.establishment_rows("depot", 1)[0]
+        row["NOM DU DEPOT"] = name
+        return row
+
+    def test_import_matches_close_name(self):
+        row = self._row("Pharmacie Keur Masar")
+        row["ADRESSE  EXACTE DU DEPOT"] = "Nouvelle adresse"
+        counters = self._import([row], match_mode="fuzzy")
+        self.assertEqual((counters["created"], counters["updated"]), (0, 1))
+        self.assertEqual(self.target.adresse, "Nouvelle adresse")
+        self.assertFalse(self.Depot.search([("name", "=", "Pharmacie Keur Masar")]))
+
+        counters = self._import([self._row("Pharmacie Keur Masar")])
+        self.assertEqual((counters["created"], counters["updated"]), (1, 0))
+
+    def test_import_keeps_distant_names_apart(self):
+        counters = self._import([self._row("Dépôt Ouakam Plage")], match_mode="fuzzy")
+        self.assertEqual((counters["created"], counters["updated"]), (1, 0))
+        self.assertEqual(self.target.adresse, "Adresse")
+
+    def test_geo_import_matches_close_commune(self):
+        department = "TEST Région 00 Département 00"
+        rows = [{"REGION": "TEST Région 00", "DEPARTEMENT": department, "COMMUNE": department + " Comune 00"}]
+        counters = self.env["pharma.import.geo.wizard"].create(
+            {"file_data": self.generator.to_csv(rows), "filename": "geo.csv", "match_mode": "fuzzy"}
+        )._run_import()
+        self.assertEqual(counters["communes"], 0)
+        self.assertFalse(self.env["pharma.geo.commune"].search([("name", "=", rows[0]["COMMUNE"])]))
+
+    def test_name_search_completes_with_similar_names(self):
+        other = self._create_depot("Pharmacie Keur Massar Extension")
+        results = self.Depot.name_search("Pharmaci Ker Masar", limit=10)
+        self.assertEqual([record_id for record_id, _name in results][:2], [self.target.id, other.id])
+
+        # Les correspondances exactes restent en tête et le domaine s'applique aux noms proches.
+        results = self.Depot.name_search("Keur Massar Extension", limit=10)
+        self.assertEqual(results[0][0], other.id)
+        results = self.Depot.name_search("Pharmaci Ker Masar", args=[("id", "!=", self.target.id)], limit=10)
+        self.assertNotIn(self.target.id, [record_id for record_id, _name in results])
+
+        self.target.active = False
+        results = self.Depot.name_search("Pharmaci Ker Masar", limit=10)
+        self.assertNotIn(self.target.id, [record_id for record_id, _name in results])
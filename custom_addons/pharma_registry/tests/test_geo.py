@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Filtres par chemin géographique, version et cache du référentiel."""
+
+from odoo.addons.pharma_registry.models.geo import get_geo_snapshot, get_geo_version
+
+from .common import PharmaRegistryCase
+
+
+class TestGeoPath(PharmaRegistryCase):
+    def test_geo_path_keeps_empty_segments(self):
+        commune = self.commune
+        depot = self._create_depot("Chemin complet")
+        self.assertEqual(
+            depot.geo_path, "%s/%s/%s" % (commune.region_id.id, commune.department_id.id, commune.id)
+        )
+        draft = self.env["pharma.depot"].new({"region_id": commune.region_id.id, "commune_id": commune.id})
+        self.assertEqual(draft.geo_path, "%s//%s" % (commune.region_id.id, commune.id))
+
+    def test_geo_path_domain_matches_field_filters(self):
+        Depot = self.env["pharma.depot"]
+        for commune in self.communes:
+            self._create_depot("Dépôt %s" % commune.name, commune=commune)
+        commune = self.communes[-1]
+        region, department = commune.region_id, commune.department_id
+        cases = [
+            ((region.id,), [("region_id", "=", region.id)]),
+            ((region.id, department.id), [("department_id", "=", department.id)]),
+            ((region.id, department.id, commune.id), [("commune_id", "=", commune.id)]),
+            ((region.id, None, commune.id), [("commune_id", "=", commune.id)]),
+        ]
+        for levels, expected in cases:
+            with self.subTest(levels=levels):
+                domain = Depot._get_geo_path_domain(*levels)
+                self.assertTrue(Depot.search(expected))
+                self.assertEqual(Depot.search(domain), Depot.search(expected))
+        self.assertIn(("commune_id", "=", commune.id), Depot._get_geo_path_domain(region.id, None, commune.id))
+
+
+class TestGeoVersion(PharmaRegistryCase):
+    def test_version_changes_only_with_hierarchy(self):
+        commune = self.commune
+        version = get_geo_version(self.env)
+
+        commune.write({"name": commune.name, "department_id": commune.department_id.id})
+        self.assertEqual(get_geo_version(self.env), version)
+
+        commune.name = commune.name + " bis"
+        self.assertEqual(get_geo_version(self.env), version + 1)
+
+        self.env["pharma.geo.region"].create({"name": "TEST Nouvelle région"})
+        self.assertEqual(get_geo_version(self.env), version + 2)
+
+    def test_snapshot_reloaded_after_change(self):
+        snapshot = get_geo_snapshot(self.env)
+        self.assertIs(get_geo_snapshot(self.env), snapshot)
+
+        region = self.env["pharma.geo.region"].create({"name": "TEST Nouvelle région"})
+        reloaded = get_geo_snapshot(self.env)
+        self.assertIsNot(reloaded, snapshot)
+        self.assertIn([region.id, region.name], reloaded["regions"])
+
+    def test_geo_import_reuses_existing_records(self):
+        counters = self.env["pharma.import.geo.wizard"].create(
+            {"file_data": self.generator.to_csv(self.generator.geo_rows()), "filename": "geo.csv"}
+        )._run_import()
+        self.assertEqual((counters["regions"], counters["departments"], counters["communes"]), (0, 0, 0))
+
+        rows = [{"REGION": "TEST Région 00", "DEPARTEMENT": "TEST Nouveau département", "COMMUNE": "TEST Commune"}]
+        counters = self.env["pharma.import.geo.wizard"].create(
+            {"file_data": self.generator.to_csv(rows), "filename": "geo.csv"}
+        )._run_import()
+        self.assertEqual((counters["regions"], counters["departments"], counters["communes"]), (0, 1, 1))
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Mesures de performance des assistants d'import.
+
+Exclues de la suite standard ; à lancer explicitement, par exemple :
+
+    odoo -d bench -i pharma_registry --test-tags pharma_benchmark --stop-after-init
+
+La taille des fichiers se règle par les variables d'environnement
+``PHARMA_BENCH_ROWS`` (lignes par type) et ``PHARMA_BENCH_COMMUNES``
+(communes par département). Si ``PHARMA_BENCH_OUTPUT`` désigne un fichier,
+chaque mesure y est ajoutée en JSON (une ligne par mesure).
+"""
+
+import json
+import logging
+import os
+import time
+import tracemalloc
+
+from odoo.tests import TransactionCase, tagged
+
+from .common import SyntheticRegistryGenerator
+
+_logger = logging.getLogger(__name__)
+
+ESTABLISHMENT_TYPES = ("officine", "depot", "grossiste", "agence", "fabrication")
+
+
+@tagged("-standard", "-at_install", "post_install", "pharma_benchmark")
+class TestImportBenchmark(TransactionCase):
+    """Mesurer débit, nombre de requêtes et mémoire de pointe des imports."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.rows = int(os.environ.get("PHARMA_BENCH_ROWS", 2000))
+        communes = int(os.environ.get("PHARMA_BENCH_COMMUNES", 10))
+        cls.generator = SyntheticRegistryGenerator(communes_per_department=communes)
+        cls.env["pharma.import.geo.wizard"].create(
+            {"file_data": cls.generator.to_csv(cls.generator.geo_rows()), "filename": "geo.csv"}
+        )._run_import()
+
+    def _measure(self, label, wizard, rows):
+        """Exécuter l'import de l'assistant et consigner la mesure."""
+
+        cursor = self.env.cr
+        queries_before = cursor.sql_log_count
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            counters = wizard._run_import()
+            # Écritures en attente et statistiques différées à la validation font partie du coût.
+            self.env.flush_all()
+            self.env.cr.precommit.run()
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        result = {
+            "benchmark": label,
+            "rows": rows,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(rows / elapsed, 1) if elapsed else None,
+            "queries": cursor.sql_log_count - queries_before,
+            "peak_memory_kb": peak // 1024,
+        }
+        _logger.info("PHARMA_BENCH %s", json.dumps(result, sort_keys=True))
+        output = os.environ.get("PHARMA_BENCH_OUTPUT")
+        if output:
+            with open(output, "a", encoding="utf-8") as handle:
+                handle.write(json.dumps(result, sort_keys=True) + "\n")
+        return counters
+
+    def test_geo_import(self):
+        generator = SyntheticRegistryGenerator(
+            prefix="BENCHGEO", communes_per_department=self.generator.communes_per_department
+        )
+        rows = generator.geo_rows()
+        wizard = self.env["pharma.import.geo.wizard"].create(
+            {"file_data": generator.to_csv(rows), "filename": "geo.csv"}
+        )
+        counters = self._measure("geo", wizard, len(rows))
+        self.assertEqual(counters["communes"], len(rows))
+
+    def test_establishment_imports(self):
+        for type_etablissement in ESTABLISHMENT_TYPES:
+            with self.subTest(type_etablissement=type_etablissement):
+                file_data = self.generator.to_csv(
+                    self.generator.establishment_rows(type_etablissement, self.rows)
+                )
+                values = {
+                    "type_etablissement": type_etablissement,
+                    "file_data": file_data,
+                    "filename": f"{type_etablissement}.csv",
+                }
+                Wizard = self.env["pharma.import.establishment.wizard"]
+                counters = self._measure(f"{type_etablissement}.create", Wizard.create(values), self.rows)
+                self.assertEqual(counters["created"], self.rows)
+                counters = self._measure(f"{type_etablissement}.update", Wizard.create(values), self.rows)
+                self.assertEqual(counters["updated"], self.rows)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""Rapprochement, import différentiel, numéros de ligne et aller-retour export ➔ import."""
+
+import base64
+import csv
+import io
+
+from odoo.exceptions import UserError
+
+from .common import PharmaRegistryCase
+
+
+class TestImportEstablishment(PharmaRegistryCase):
+    def setUp(self):
+        super().setUp()
+        self.rows = self.generator.establishment_rows("depot", 3)
+        self.Depot = self.env["pharma.depot"]
+
+    def _find(self, row):
+        return self.Depot.search([("name", "=", row["NOM DU DEPOT"])])
+
+    def test_match_existing_records(self):
+        for prefetch_matching in (True, False):
+            with self.subTest(prefetch_matching=prefetch_matching):
+                rows = self.generator.establishment_rows("depot", 3)
+                for row in rows:
+                    row["NOM DU DEPOT"] += " %s" % prefetch_matching
+                counters = self._import(rows, prefetch_matching=prefetch_matching)
+                self.assertEqual((counters["created"], counters["updated"]), (3, 0))
+
+                rows[0]["NOM DU DEPOT"] = rows[0]["NOM DU DEPOT"].upper()
+                rows[1]["ADRESSE  EXACTE DU DEPOT"] = "Nouvelle adresse"
+                counters = self._import(rows, prefetch_matching=prefetch_matching)
+                self.assertEqual((counters["created"], counters["updated"]), (0, 3))
+                self.assertEqual(self._find(rows[1]).adresse, "Nouvelle adresse")
+                self.assertEqual(len(self._find(rows[2])), 1)
+
+    def test_match_without_update(self):
+        self._import(self.rows)
+        self.rows[0]["ADRESSE  EXACTE DU DEPOT"] = "Nouvelle adresse"
+        counters = self._import(self.rows, allow_update=False)
+        self.assertEqual((counters["created"], counters["updated"]), (0, 0))
+        self.assertNotEqual(self._find(self.rows[0]).adresse, "Nouvelle adresse")
+
+    def test_delta_import_hashes(self):
+        counters = self._import(self.rows, delta_import=True)
+        self.assertEqual(counters["created"], 3)
+        records = self.Depot.browse([self._find(row).id for row in self.rows])
+        hashes = records.mapped("import_hash")
+        self.assertTrue(all(hashes))
+
+        counters = self._import(self.rows, delta_import=True)
+        self.assertEqual((counters["created"], counters["changed"], counters["unchanged"]), (0, 0, 3))
+        self.assertEqual(counters["missing"], 0)
+        self.assertEqual(records.mapped("import_hash"), hashes)
+
+        self.rows[1]["ADRESSE  EXACTE DU DEPOT"] = "Nouvelle adresse"
+        counters = self._import(self.rows, delta_import=True)
+        self.assertEqual((counters["created"], counters["changed"], counters["unchanged"]), (0, 1, 2))
+        self.assertEqual(records[1].adresse, "Nouvelle adresse")
+        self.assertNotEqual(records[1].import_hash, hashes[1])
+        self.assertEqual(records[0].import_hash, hashes[0])
+
+    def test_delta_import_lists_missing_records(self):
+        self._import(self.rows, delta_import=True)
+        absent = self._find(self.rows[2])
+
+        wizard = self._import_wizard(self.rows[:2], delta_import=True)
+        action = wizard.action_import()
+        params = action["params"]
+        self.assertEqual(params["type"], "warning")
+        self.assertEqual(params["next"]["domain"], [("id", "in", absent.ids)])
+        self.assertIn(absent.code, params["message"])
+
+        counters = self._import(self.rows[:2] + self.rows[:1], delta_import=True)
+        self.assertEqual(counters["missing"], 1)
+        self.assertEqual(counters["missing_ids"], absent.ids)
+        self.assertNotIn("matched_ids", counters)
+
+    def test_errors_report_file_line_numbers(self):
+        rows = self.generator.establishment_rows("depot", 2)
+        rows[0]["OBSERVATIONS"] = "première ligne\nseconde ligne"
+        rows[1]["ANNEE D'OUVERTURE"] = "inconnue"
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerow(rows[0])
+        buffer.write("\r\n")
+        writer.writerow(rows[1])
+        wizard = self.env["pharma.import.establishment.wizard"].create(
+            {
+                "type_etablissement": "depot",
+                "file_data": base64.b64encode(buffer.getvalue().encode("utf-8")),
+                "filename": "depot.csv",
+            }
+        )
+
+        # En-tête, valeur sur deux lignes, ligne vide : la ligne en erreur est la cinquième.
+        self.assertEqual([row.line_number for row in wizard._iter_rows()], [2, 5])
+        wizard.action_dry_run()
+        report = base64.b64decode(wizard.report_file).decode("utf-8-sig")
+        self.assertEqual([line[0] for line in csv.reader(io.StringIO(report))][1:], ["5"])
+        with self.assertRaisesRegex(UserError, "Ligne 5"):
+            wizard._run_import()
+
+    def test_export_import_round_trip(self):
+        self._import(self.rows)
+        records = self.Depot.search([("name", "in", [row["NOM DU DEPOT"] for row in self.rows])])
+        field_names = [
+            "code",
+            "name",
+            "quartier",
+            "adresse",
+            "numero_telephone",
+            "annee_ouverture",
+            "responsable_nom",
+            "sexe_responsable",
+            "region_id",
+            "department_id",
+            "commune_id",
+            "latitude",
+            "longitude",
+        ]
+        before = records.read(field_names)
+        exported = self._export()
+        for code in records.mapped("code"):
+            self.assertIn(code.encode("utf-8"), exported)
+
+        counters = self.env["pharma.import.establishment.wizard"].create(
+            {
+                "type_etablissement": "depot",
+                "file_data": base64.b64encode(exported),
+                "filename": "depot.csv",
+                "match_field": "code",
+            }
+        )._run_import()
+        self.assertEqual(counters["created"], 0)
+        self.assertEqual(records.read(field_names), before)
+        self.assertEqual(self._export(), exported)
+
+    def test_export_applies_record_rules(self):
+        first, second = self.communes[:2]
+        visible = self._create_depot("Exporté visible", commune=first)
+        hidden = self._create_depot("Exporté masqué", commune=second)
+        archived = self._create_depot("Exporté archivé", commune=first)
+        archived.active = False
+        manager = self.env["res.users"].create(
+            {
+                "name": "Gestionnaire régional",
+                "login": "pharma_export_manager",
+                "groups_id": [(6, 0, [self.env.ref("pharma_registry.group_pharma_manager").id])],
+            }
+        )
+        self.env["ir.rule"].create(
+            {
+                "name": "Dépôts d'une commune",
+                "model_id": self.env["ir.model"]._get_id("pharma.depot"),
+                "groups": [(6, 0, [self.env.ref("pharma_registry.group_pharma_manager").id])],
+                "domain_force": "[('commune_id', '=', %s)]" % first.id,
+            }
+        )
+        exported = self._export(user=manager)
+        self.assertIn(visible.code.encode("utf-8"), exported)
+        self.assertNotIn(hidden.code.encode("utf-8"), exported)
+        self.assertNotIn(archived.code.encode("utf-8"), exported)
+
+        exported = self._export(user=manager, include_archived=True)
+        self.assertIn(archived.code.encode("utf-8"), exported)
+        self.assertNotIn(hidden.code.encode("utf-8"), exported)
+
+    def _export(self, user=None, **values):
+        Wizard = self.env["pharma.export.establishment.wizard"]
+        if user:
+            Wizard = Wizard.with_user(user)
+        wizard = Wizard.create(dict({"type_etablissement": "depot"}, **values))
+        self.addCleanup(wizard.unlink)
+        wizard.action_export()
+        with open(wizard._get_export_path(), "rb") as handle:
+            return handle.read()
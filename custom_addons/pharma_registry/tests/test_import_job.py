@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""Reprise et annulation des tâches d'import en arrière-plan."""
+
+import time
+from unittest.mock import patch
+
+from psycopg2 import errors
+
+from odoo.exceptions import UserError
+
+from .common import PharmaRegistryCase
+
+
+class TestImportJob(PharmaRegistryCase):
+    def setUp(self):
+        super().setUp()
+        # Une validation de lot ne fait que vider les écritures en attente, une annulation que les
+        # oublier : le test reste annulable.
+        self.patch(self.env.cr, "commit", self.env.cr.flush)
+        self.patch(self.env.cr, "rollback", self.env.transaction.clear)
+        self.rows = self.generator.establishment_rows("depot", 5)
+
+    def _enqueue(self, rows, chunk_size, **values):
+        action = self._import_wizard(rows, run_in_background=True, **values).action_import()
+        job = self.env["pharma.import.job"].browse(action["res_id"])
+        job.chunk_size = chunk_size
+        return job
+
+    def _depot_count(self):
+        return self.env["pharma.depot"].search_count([("name", "in", [row["NOM DU DEPOT"] for row in self.rows])])
+
+    def test_resume_after_deadline(self):
+        job = self._enqueue(self.rows, chunk_size=2)
+        self.assertFalse(job._process(deadline=0))
+        self.assertEqual((job.state, job.total_rows, job.processed_rows), ("running", 5, 2))
+        self.assertEqual(self._depot_count(), 2)
+
+        self.assertTrue(job._process(deadline=time.monotonic() + 60))
+        self.assertEqual((job.state, job.processed_rows), ("done", 5))
+        self.assertEqual(job.counters["created"], 5)
+        self.assertEqual(self._depot_count(), 5)
+
+    def test_resumed_delta_import_lists_missing_records(self):
+        self._import(self.rows, delta_import=True)
+        absent = self.env["pharma.depot"].search([("name", "=", self.rows[4]["NOM DU DEPOT"])])
+
+        job = self._enqueue(self.rows[:4], chunk_size=1, delta_import=True)
+        passes = 1
+        while not job._process(deadline=0):
+            passes += 1
+        self.assertEqual(passes, 5)
+        self.assertEqual(job.state, "done")
+        self.assertEqual(job.counters["unchanged"], 4)
+        self.assertNotIn("matched_ids", job.counters)
+        self.assertEqual(len(job._load_matched_ids()), 4)
+        self.assertEqual(job.counters["missing_ids"], absent.ids)
+        self.assertEqual(job.missing_count, 1)
+        self.assertEqual(job.action_view_missing()["domain"], [("id", "in", absent.ids)])
+
+    def test_cancel_stops_running_job(self):
+        job = self._enqueue(self.rows, chunk_size=2)
+
+        def commit_then_cancel():
+            # Annulation validée par une autre transaction pendant le premier lot.
+            self.env.cr.flush()
+            self.env.cr.execute("UPDATE pharma_import_job SET state = 'cancelled' WHERE id = %s", [job.id])
+
+        with patch.object(self.env.cr, "commit", commit_then_cancel):
+            self.assertTrue(job._process(deadline=time.monotonic() + 60))
+        self.assertEqual((job.state, job.processed_rows), ("cancelled", 2))
+        self.assertEqual(self._depot_count(), 2)
+
+        job.action_retry()
+        self.assertEqual(job.state, "queued")
+        self.assertTrue(job._process(deadline=time.monotonic() + 60))
+        self.assertEqual((job.state, job.processed_rows), ("done", 5))
+        self.assertEqual(self._depot_count(), 5)
+
+    def test_cancel_queued_job(self):
+        job = self._enqueue(self.rows, chunk_size=2)
+        job.action_cancel()
+        self.assertEqual(job.state, "cancelled")
+        self.env["pharma.import.job"]._cron_process_jobs()
+        self.assertEqual((job.state, job.processed_rows), ("cancelled", 0))
+        self.assertEqual(self._depot_count(), 0)
+
+    def _user(self, login, *groups):
+        return self.env["res.users"].create(
+            {
+                "name": login,
+                "login": login,
+                "groups_id": [(6, 0, [self.env.ref(group).id for group in ("base.group_user",) + groups])],
+            }
+        )
+
+    def test_job_runs_with_requester_rights(self):
+        manager = self._user("pharma_job_manager", "pharma_registry.group_pharma_manager")
+        job = self._enqueue(self.rows, chunk_size=10)
+        job.user_id = manager
+        self.assertTrue(job._process(deadline=time.monotonic() + 60))
+        self.assertEqual(job.state, "done")
+        depots = self.env["pharma.depot"].search([("name", "in", [row["NOM DU DEPOT"] for row in self.rows])])
+        self.assertEqual(depots.create_uid, manager)
+
+        job = self._enqueue(self.rows, chunk_size=10)
+        job.user_id = self._user("pharma_job_employee")
+        self.assertTrue(job._process(deadline=time.monotonic() + 60))
+        self.assertEqual((job.state, job.processed_rows), ("failed", 0))
+
+    def test_failure_keeps_concurrent_cancel(self):
+        job = self._enqueue(self.rows, chunk_size=2)
+        Wizard = type(self.env["pharma.import.establishment.wizard"])
+
+        def cancel_then_fail(wizard, rows, import_context):
+            self.env.cr.execute("UPDATE pharma_import_job SET state = 'cancelled' WHERE id = %s", [job.id])
+            raise UserError("Lot invalide")
+
+        with patch.object(Wizard, "_import_rows", cancel_then_fail):
+            self.assertTrue(job._process(deadline=time.monotonic() + 60))
+        self.assertEqual(job.state, "cancelled")
+        self.assertFalse(job.error_message)
+
+    def test_serialization_failure_is_retried(self):
+        job = self._enqueue(self.rows, chunk_size=2)
+        Wizard = type(self.env["pharma.import.establishment.wizard"])
+
+        def conflict(wizard, rows, import_context):
+            raise errors.SerializationFailure("could not serialize access due to concurrent update")
+
+        with patch.object(Wizard, "_import_rows", conflict):
+            self.assertFalse(job._process(deadline=time.monotonic() + 60))
+        self.assertNotEqual(job.state, "failed")
+        self.assertTrue(job._process(deadline=time.monotonic() + 60))
+        self.assertEqual((job.state, job.processed_rows), ("done", 5))
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""Import des photos depuis une archive ZIP et vignettes stockées."""
+
+import base64
+import io
+import zipfile
+
+from PIL import Image
+
+from .common import PharmaRegistryCase
+
+
+def _png(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 40, 40)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _size(value):
+    return Image.open(io.BytesIO(base64.b64decode(value))).size
+
+
+class TestPhotoImport(PharmaRegistryCase):
+    def setUp(self):
+        super().setUp()
+        self.depot = self._create_depot("Photographié")
+        self.manager = self.env["res.users"].create(
+            {
+                "name": "Gestionnaire des photos",
+                "login": "pharma_photo_manager",
+                "groups_id": [(6, 0, [self.env.ref("pharma_registry.group_pharma_manager").id])],
+            }
+        )
+
+    def _import_photos(self, files, **values):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            for name, data in files.items():
+                archive.writestr(name, data)
+        wizard = (
+            self.env["pharma.import.photo.wizard"]
+            .with_user(self.manager)
+            .create(dict({"file_data": base64.b64encode(buffer.getvalue()), "filename": "photos.zip"}, **values))
+        )
+        return wizard.action_import()["params"]["message"]
+
+    def test_import_writes_photo_and_thumbnails(self):
+        message = self._import_photos(
+            {
+                "%s.png" % self.depot.code: _png(1600, 1200),
+                "inconnu-0001.png": _png(10, 10),
+                "%s.txt" % self.depot.code: b"ignore",
+            }
+        )
+        self.assertTrue(message.startswith("1 photos importées, 0 ignorées (photo existante), 1 codes inconnus"))
+        self.depot.invalidate_recordset()
+        self.assertEqual(_size(self.depot.photo), (1024, 768))
+        self.assertEqual(_size(self.depot.photo_512), (512, 384))
+        self.assertEqual(_size(self.depot.photo_128), (128, 96))
+        # Écriture par l'ORM : l'auteur de la modification est l'utilisateur de l'assistant.
+        self.assertEqual(self.depot.write_uid, self.manager)
+
+        message = self._import_photos({"%s.png" % self.depot.code: _png(300, 300)})
+        self.assertTrue(message.startswith("0 photos importées, 1 ignorées"))
+        message = self._import_photos({"%s.png" % self.depot.code: _png(300, 300)}, overwrite=True)
+        self.assertTrue(message.startswith("1 photos importées"))
+        self.depot.invalidate_recordset()
+        self.assertEqual(_size(self.depot.photo_128), (128, 128))
+
+    def test_unreadable_image_is_counted(self):
+        message = self._import_photos({"%s.jpg" % self.depot.code: b"pas une image"})
+        self.assertTrue(message.endswith("1 images illisibles."))
+        self.assertFalse(self.depot.photo)
+
+    def test_write_fills_thumbnails(self):
+        self.depot.photo = base64.b64encode(_png(800, 400))
+        self.assertEqual(_size(self.depot.photo_512), (512, 256))
+        self.assertEqual(_size(self.depot.photo_128), (128, 64))
+
+    def test_migration_backfills_thumbnails(self):
+        self.depot.photo = base64.b64encode(_png(800, 400))
+        self.env["ir.attachment"].search(
+            [
+                ("res_model", "=", "pharma.depot"),
+                ("res_field", "in", ["photo_512", "photo_128"]),
+                ("res_id", "=", self.depot.id),
+            ]
+        ).unlink()
+        self.depot.invalidate_recordset()
+        self.assertFalse(self.depot.photo_128)
+
+        self._run_migration("post-photo-thumbnails.py")
+        self.depot.invalidate_recordset()
+        self.assertEqual(_size(self.depot.photo_512), (512, 256))
+        self.assertEqual(_size(self.depot.photo_128), (128, 64))
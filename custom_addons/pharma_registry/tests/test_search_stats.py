@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Recherche globale des établissements et statistiques par commune."""
+
+from odoo.addons.pharma_registry.models.stat_geo import PENDING_KEY
+
+from .common import PharmaRegistryCase
+
+
+class TestEstablishmentSearch(PharmaRegistryCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.depots = cls.env["pharma.depot"]
+        for index in range(3):
+            cls.depots |= cls._create_depot("Officine Zéphyr %s" % index)
+
+    def test_search_establishments(self):
+        results = self.env["pharma.establishment.search"].search_establishments("Zéphyr", limit=10)
+        self.assertEqual({result["id"] for result in results}, set(self.depots.ids))
+        self.assertEqual({result["model"] for result in results}, {"pharma.depot"})
+        self.assertEqual(results[0]["commune"], self.commune.display_name)
+
+    def test_name_search_filters_before_limit(self):
+        Search = self.env["pharma.establishment.search"]
+        target = self.depots[-1]
+        domain = [("res_model", "=", "pharma.depot"), ("res_id", "=", target.id)]
+        results = Search.name_search("Zéphyr", args=domain, limit=1)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(Search.browse(results[0][0]).res_id, target.id)
+        self.assertEqual(results[0][1], target.name)
+
+        self.depots[0].active = False
+        names = [name for _id, name in Search.name_search("Zéphyr", limit=10)]
+        self.assertNotIn(self.depots[0].name, names)
+        self.assertEqual(len(names), 2)
+
+    def test_search_wildcards_are_literal(self):
+        Search = self.env["pharma.establishment.search"]
+        target = self._create_depot("Officine Zéphyr_100%")
+        # Non protégés, « _ » et « % » retrouveraient aussi les officines « Zéphyr 0 » à « Zéphyr 2 ».
+        for query in ("Zéphyr_", "Zéphyr_1", "Zéphyr_100%"):
+            with self.subTest(query=query):
+                results = Search.search_establishments(query, limit=10)
+                self.assertEqual([result["id"] for result in results], target.ids)
+        self.assertEqual(Search.search_establishments("Zéphyr%2", limit=10), [])
+
+
+class TestStatGeo(PharmaRegistryCase):
+    def _depot_count(self, commune):
+        self.env.cr.flush()
+        stat = self.env["pharma.stat.geo"].search(
+            [("type_etablissement", "=", "depot"), ("commune_id", "=", commune.id)]
+        )
+        return stat.establishment_count
+
+    def test_refresh_is_deferred_to_commit(self):
+        first, second = self.communes[:2]
+        self.env.cr.flush()
+        depot = self._create_depot("Compté", commune=first)
+        self.assertEqual(self.env.cr.precommit.data[PENDING_KEY], {"depot": {first.id}})
+        self.assertEqual(self._depot_count(first), 1)
+        self.assertNotIn(PENDING_KEY, self.env.cr.precommit.data)
+
+        depot.write(
+            {"region_id": second.region_id.id, "department_id": second.department_id.id, "commune_id": second.id}
+        )
+        self.assertEqual((self._depot_count(first), self._depot_count(second)), (0, 1))
+
+        depot.active = False
+        self.assertEqual(self._depot_count(second), 0)
+
+    def test_totals_include_pending_changes(self):
+        Stat = self.env["pharma.stat.geo"]
+        self._create_depot("Compté")
+        totals = Stat.get_totals(
+            "commune_id", [("type_etablissement", "=", "depot"), ("commune_id", "=", self.commune.id)]
+        )
+        self.assertEqual(totals[0]["establishment_count"], 1)
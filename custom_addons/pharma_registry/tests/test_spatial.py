@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""Coordonnées dérivées, recherches de proximité et migration des coordonnées."""
+
+from odoo.exceptions import ValidationError
+
+from odoo.addons.pharma_registry.tools import spatial
+
+from .common import PharmaRegistryCase
+
+CENTER = (14.712, -17.443)
+
+
+class TestCoordinates(PharmaRegistryCase):
+    def test_create_derives_points_and_cell(self):
+        depot = self._create_depot("Situé", *CENTER)
+        self.assertEqual(depot.points_geolocalisation, "14.712000,-17.443000")
+        self.assertEqual(depot.geo_cell, spatial.cell_of(*CENTER))
+
+        depot = self._create_depot("Non situé")
+        self.assertFalse(depot.points_geolocalisation)
+        self.assertFalse(depot.geo_cell)
+
+    def test_write_points_only(self):
+        depot = self._create_depot("Situé", *CENTER)
+        depot.points_geolocalisation = "14.8, -17.5"
+        self.assertEqual((depot.latitude, depot.longitude), (14.8, -17.5))
+        self.assertEqual(depot.points_geolocalisation, "14.800000,-17.500000")
+        self.assertEqual(depot.geo_cell, spatial.cell_of(14.8, -17.5))
+
+        # Seul l'ordre « latitude,longitude » est accepté : aucune inversion n'est devinée.
+        for value in ("abc", "14.8", "120,14"):
+            with self.subTest(value=value), self.assertRaises(ValidationError):
+                depot.points_geolocalisation = value
+
+        depot.points_geolocalisation = False
+        self.assertEqual((depot.latitude, depot.longitude), (0.0, 0.0))
+        self.assertFalse(depot.geo_cell)
+
+    def test_write_one_coordinate(self):
+        first = self._create_depot("Premier", 14.712, -17.443)
+        second = self._create_depot("Second", 14.712, -16.5)
+        (first | second).write({"latitude": 15.25})
+        self.assertEqual(first.points_geolocalisation, "15.250000,-17.443000")
+        self.assertEqual(second.points_geolocalisation, "15.250000,-16.500000")
+        self.assertEqual(first.geo_cell, spatial.cell_of(15.25, -17.443))
+        self.assertEqual(second.geo_cell, spatial.cell_of(15.25, -16.5))
+
+    def test_parse_points(self):
+        self.assertEqual(spatial.parse_points("14.8,-17.5"), (14.8, -17.5))
+        self.assertEqual(spatial.parse_points("-17.5,14.8"), (-17.5, 14.8))
+        self.assertEqual(spatial.parse_points(""), (False, False))
+        self.assertIsNone(spatial.parse_points("120,14"))
+        self.assertIsNone(spatial.parse_points("1,2,3"))
+
+    def test_import_points_column_is_lon_lat(self):
+        row = self.generator.establishment_rows("depot", 1)[0]
+        row.update({"LATITUDE": "", "LONGITUDE": "", "POINTS DE GEOLOCALISATION": "-17.443,14.712"})
+        self._import([row])
+        depot = self.env["pharma.depot"].search([("name", "=", row["NOM DU DEPOT"])])
+        self.assertEqual((depot.latitude, depot.longitude), CENTER)
+        self.assertEqual(depot.points_geolocalisation, "14.712000,-17.443000")
+
+    def test_migrations_rewrite_derived_columns(self):
+        located = self._create_depot("Situé", *CENTER)
+        unlocated = self._create_depot("Non situé")
+        depots = located | unlocated
+        depots.flush_recordset()
+        self.env.cr.execute(
+            """
+            UPDATE pharma_depot
+               SET points_geolocalisation = '-17.443,14.712', geo_cell = NULL, geo_path = NULL
+             WHERE id IN %s
+            """,
+            [tuple(depots.ids)],
+        )
+        for script in ("post-migrate.py", "post-geo-path.py"):
+            self._run_migration(script)
+        depots.invalidate_recordset()
+
+        commune = self.commune
+        self.assertEqual(located.points_geolocalisation, spatial.format_points(*CENTER))
+        self.assertEqual(located.geo_cell, spatial.cell_of(*CENTER))
+        self.assertFalse(unlocated.points_geolocalisation)
+        self.assertFalse(unlocated.geo_cell)
+        expected_path = "%s/%s/%s" % (commune.region_id.id, commune.department_id.id, commune.id)
+        self.assertEqual(depots.mapped("geo_path"), [expected_path, expected_path])
+
+
+class TestProximitySearch(PharmaRegistryCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        latitude, longitude = CENTER
+        # Environ 1 km, 10 km et 100 km au nord du centre.
+        cls.near = cls._create_depot("Proche", latitude + 0.009, longitude)
+        cls.middle = cls._create_depot("Moyen", latitude + 0.09, longitude)
+        cls.far = cls._create_depot("Lointain", latitude + 0.9, longitude)
+        cls.unlocated = cls._create_depot("Non situé")
+
+    def test_search_within_radius(self):
+        Depot = self.env["pharma.depot"]
+        self.assertEqual(Depot.search_within_radius(*CENTER, 20).ids, [self.near.id, self.middle.id])
+        self.assertEqual(Depot.search_within_radius(*CENTER, 20, limit=1), self.near)
+        self.assertEqual(Depot.search_within_radius(*CENTER, 500).ids, (self.near | self.middle | self.far).ids)
+
+        self.near.active = False
+        self.assertEqual(Depot.search_within_radius(*CENTER, 20), self.middle)
+
+    def test_search_nearest(self):
+        Depot = self.env["pharma.depot"]
+        self.assertEqual(Depot.search_nearest(*CENTER, count=1), self.near)
+        self.assertEqual(Depot.search_nearest(*CENTER, count=3).ids, (self.near | self.middle | self.far).ids)
+        self.assertEqual(Depot.search_nearest(*CENTER, count=3, max_radius_km=50).ids, [self.near.id, self.middle.id])
+
+    def test_search_in_bbox(self):
+        latitude, longitude = CENTER
+        found = self.env["pharma.depot"].search_in_bbox(latitude, longitude - 0.1, latitude + 0.5, longitude + 0.1)
+        self.assertEqual(found.ids, [self.near.id, self.middle.id])
+
+    def test_search_nearby_all_types(self):
+        results = self.env["pharma.establishment.search"].search_nearby(*CENTER, 20, types=["depot"])
+        self.assertEqual([result["id"] for result in results], (self.near | self.middle).ids)
+        self.assertAlmostEqual(results[0]["distance_km"], 1.0, delta=0.05)
+        self.assertEqual(self.env["pharma.establishment.search"].search_nearby(*CENTER, 20, types=["officine"]), [])
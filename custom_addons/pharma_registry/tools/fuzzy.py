@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Rapprochement approché de libellés à l'aide de l'extension PostgreSQL pg_trgm.
+
+Les requêtes utilisent l'opérateur ``%`` (similarité trigram) sur la même
+expression que les index ``index="trigram"`` des modèles, afin d'être servies
+par ces index plutôt que par un parcours complet de la table.
+"""
+
+from odoo.osv.expression import get_unaccent_wrapper
+
+# Seuil de similarité par défaut de la recherche par nom dans l'interface.
+NAME_SEARCH_SIMILARITY = 0.3
+
+
+def is_available(env):
+    """Indiquer si l'extension pg_trgm est installée dans la base courante."""
+
+    return bool(env.registry.has_trigram)
+
+
+def _prepare(Model, field_name, threshold):
+    """Écrire les valeurs en attente et fixer le seuil de l'opérateur ``%``."""
+
+    Model.flush_model([field_name])
+    Model.env.cr.execute(
+        "SELECT set_config('pg_trgm.similarity_threshold', %s, true)",
+        [str(threshold)],
+    )
+    return get_unaccent_wrapper(Model.env.cr)
+
+
+def find_best_matches(Model, values, threshold, field_name="name", parent_field=None, parent_id=None):
+    """Retourner ``{valeur: id}`` de la fiche la plus proche de chaque valeur.
+
+    Une seule requête pour toutes les valeurs ; seules les fiches dont la
+    similarité atteint ``threshold`` sont retenues. ``parent_field`` restreint
+    la recherche aux fiches rattachées à ``parent_id``.
+    """
+
+    values = sorted({value for value in values if value})
+    if not values:
+        return {}
+    unaccent = _prepare(Model, field_name, threshold)
+    column = unaccent(f'rec."{field_name}"')
+    value = unaccent("q.value")
+    conditions = []
+    params = [values]
+    if parent_field:
+        conditions.append(f'rec."{parent_field}" = %s')
+        params.append(parent_id)
+    if "active" in Model._fields:
+        conditions.append("rec.active")
+    where = "WHERE %s" % " AND ".join(conditions) if conditions else ""
+    Model.env.cr.execute(
+        f"""
+        SELECT DISTINCT ON (q.value) q.value, rec.id
+          FROM unnest(%s::varchar[]) AS q(value)
+          JOIN "{Model._table}" rec ON {column} %% {value}
+          {where}
+         ORDER BY q.value, similarity({column}, {value}) DESC, rec.id
+        """,
+        params,
+    )
+    return dict(Model.env.cr.fetchall())
+
+
+def find_similar_ids(Model, value, threshold=NAME_SEARCH_SIMILARITY, limit=None, field_name="name"):
+    """Retourner les ids des fiches proches de ``value``, les plus similaires d'abord."""
+
+    if not value:
+        return []
+    unaccent = _prepare(Model, field_name, threshold)
+    column = unaccent(f'rec."{field_name}"')
+    active = "AND rec.active" if "active" in Model._fields and Model._context.get("active_test", True) else ""
+    Model.env.cr.execute(
+        f"""
+        SELECT rec.id
+          FROM "{Model._table}" rec
+         WHERE {column} %% {unaccent('%(value)s')} {active}
+         ORDER BY similarity({column}, {unaccent('%(value)s')}) DESC, rec.id
+         LIMIT %(limit)s
+        """,
+        {"value": value, "limit": limit},
+    )
+    return [row[0] for row in Model.env.cr.fetchall()]
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Cache en mémoire du référentiel géographique, partagé par les requêtes d'un processus.
+
+Chaque base a au plus une image du référentiel, associée à la version
+(paramètre système) sous laquelle elle a été lue. Une modification du
+référentiel incrémente cette version, relue en base à chaque accès par tous
+les processus Odoo : l'image suivante est alors relue. Les images sont
+partagées entre threads et ne doivent jamais être modifiées.
+"""
+
+import logging
+import threading
+import unicodedata
+
+_logger = logging.getLogger(__name__)
+
+_snapshots = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def normalize_name(value):
+    """Ramener un libellé à une clé de comparaison sans casse ni accents."""
+
+    if not value:
+        return ""
+    normalized = unicodedata.normalize("NFKD", str(value))
+    normalized = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    return " ".join(normalized.lower().split())
+
+
+def get_snapshot(dbname, version, loader):
+    """Retourner l'image du référentiel pour ``version``, lue par ``loader`` en cas d'absence."""
+
+    with _lock:
+        cached = _snapshots.get(dbname)
+        if cached and cached[0] == version:
+            _stats["hits"] += 1
+            return cached[1]
+        _stats["misses"] += 1
+        if cached:
+            _stats["invalidations"] += 1
+            del _snapshots[dbname]
+    snapshot = loader()
+    with _lock:
+        _snapshots[dbname] = (version, snapshot)
+    stats = get_stats()
+    _logger.info(
+        "Référentiel géographique relu (base %s, version %s) : %s succès, %s échecs, %s invalidations (%.1f %%).",
+        dbname,
+        version,
+        stats["hits"],
+        stats["misses"],
+        stats["invalidations"],
+        100 * stats["hit_rate"],
+    )
+    return snapshot
+
+
+def invalidate(dbname):
+    """Oublier l'image d'une base (modification du référentiel dans ce processus)."""
+
+    with _lock:
+        if _snapshots.pop(dbname, None):
+            _stats["invalidations"] += 1
+
+
+def get_stats():
+    """Retourner les compteurs de succès, d'échecs et d'invalidations du processus."""
+
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+def reset_stats():
+    with _lock:
+        for key in _stats:
+            _stats[key] = 0
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Instrumentation optionnelle des opérations du registre (requêtes, temps, lignes).
+
+Désactivée par défaut. Pour l'activer, ajouter ``pharma_registry_profiling = True``
+dans la section ``[options]`` du fichier de configuration Odoo, ou définir la
+variable d'environnement ``PHARMA_REGISTRY_PROFILING=1``. Désactivée, elle se
+limite à un test booléen par appel décoré.
+"""
+
+import functools
+import logging
+import os
+import threading
+import time
+
+from odoo.tools import config, str2bool
+
+_logger = logging.getLogger(__name__)
+
+_state = {"enabled": None}
+_local = threading.local()
+_totals = {}
+_totals_lock = threading.Lock()
+
+
+def is_enabled():
+    """Indiquer si l'instrumentation est active (lu une fois dans la configuration)."""
+
+    if _state["enabled"] is None:
+        _state["enabled"] = str2bool(
+            config.get("pharma_registry_profiling") or os.environ.get("PHARMA_REGISTRY_PROFILING") or "0",
+            False,
+        )
+    return _state["enabled"]
+
+
+def set_enabled(enabled):
+    """Activer ou désactiver l'instrumentation à chaud (shell, tests de performance)."""
+
+    _state["enabled"] = bool(enabled)
+
+
+def add_rows(count):
+    """Ajouter des lignes traitées aux opérations en cours du thread courant."""
+
+    for stats in getattr(_local, "stack", ()):
+        stats["rows"] += count
+
+
+def get_totals():
+    """Retourner les cumuls par opération depuis le démarrage du processus."""
+
+    with _totals_lock:
+        return {operation: dict(values) for operation, values in _totals.items()}
+
+
+def reset_totals():
+    with _totals_lock:
+        _totals.clear()
+
+
+def profiled(operation, count=None):
+    """Décorer une méthode de modèle pour mesurer son coût lorsqu'activé.
+
+    ``operation`` est un libellé complété par le nom du modèle ; ``count``
+    calcule le nombre de lignes traitées à partir de ``(records, résultat)``,
+    à défaut ce sont les lignes signalées par :func:`add_rows`.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not is_enabled():
+                return method(self, *args, **kwargs)
+            with _profile(self, f"{self._name}.{operation}") as stats:
+                result = method(self, *args, **kwargs)
+                if count is not None:
+                    stats["rows"] = count(self, result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+class _profile:
+    """Contexte mesurant requêtes, temps SQL et temps Python d'une opération."""
+
+    def __init__(self, records, operation):
+        self.cr = records.env.cr
+        self.operation = operation
+        self.stats = {"rows": 0}
+
+    def __enter__(self):
+        thread = threading.current_thread()
+        if not hasattr(thread, "query_time"):
+            # Compteurs alimentés par odoo.sql_db.Cursor.execute hors requête HTTP.
+            thread.query_count = 0
+            thread.query_time = 0.0
+        self.thread = thread
+        self.queries = self.cr.sql_log_count
+        self.sql_time = thread.query_time
+        self.started = time.perf_counter()
+        _local.stack = getattr(_local, "stack", []) + [self.stats]
+        return self.stats
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.stack = _local.stack[:-1]
+        wall = time.perf_counter() - self.started
+        sql_time = self.thread.query_time - self.sql_time
+        queries = self.cr.sql_log_count - self.queries
+        rows = self.stats["rows"]
+        _logger.info(
+            "%s%s: %s lignes, %s requêtes, SQL %.3fs, Python %.3fs",
+            self.operation,
+            " (échec)" if exc_type else "",
+            rows,
+            queries,
+            sql_time,
+            wall - sql_time,
+        )
+        with _totals_lock:
+            totals = _totals.setdefault(
+                self.operation, {"calls": 0, "rows": 0, "queries": 0, "sql_time": 0.0, "python_time": 0.0}
+            )
+            totals["calls"] += 1
+            totals["rows"] += rows
+            totals["queries"] += queries
+            totals["sql_time"] += sql_time
+            totals["python_time"] += wall - sql_time
+        return False
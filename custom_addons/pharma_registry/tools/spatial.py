@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""Requêtes de proximité sur latitude/longitude sans dépendre de PostGIS.
+
+Chaque établissement géolocalisé porte une cellule de grille (``geo_cell``)
+de ``CELL_SIZE`` degrés, indexée. Une zone de recherche est traduite en
+intervalles de cellules contigus (un par rangée de la grille) servis par cet
+index ; la distance exacte est ensuite calculée par la formule de haversine
+sur les seules fiches retenues.
+"""
+
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Côté d'une cellule de la grille, en degrés (≈ 5,5 km à l'équateur).
+CELL_SIZE = 0.05
+GRID_COLUMNS = int(round(360 / CELL_SIZE))
+
+# Au-delà de ce nombre de rangées, la zone est filtrée sur les seules coordonnées.
+MAX_CELL_ROWS = 200
+
+
+def is_located(latitude, longitude):
+    """Indiquer si des coordonnées sont renseignées (0, 0 signifie « non géolocalisé »)."""
+
+    return bool(latitude or longitude)
+
+
+def format_points(latitude, longitude):
+    """Représentation canonique « latitude,longitude » à 6 décimales, False si non situé."""
+
+    if not is_located(latitude, longitude):
+        return False
+    return "%.6f,%.6f" % (latitude, longitude)
+
+
+def parse_points(value):
+    """Décoder « latitude,longitude » (forme de format_points) en coordonnées.
+
+    Une valeur vide donne (False, False), une valeur invalide None.
+    """
+
+    parts = [part.strip() for part in str(value or "").split(",") if part.strip()]
+    if not parts:
+        return False, False
+    if len(parts) != 2:
+        return None
+    try:
+        latitude, longitude = float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+    if abs(latitude) > 90 or abs(longitude) > 180:
+        return None
+    return latitude, longitude
+
+
+def _row_of(latitude):
+    return int(math.floor((min(max(latitude, -90.0), 90.0) + 90.0) / CELL_SIZE))
+
+
+def _column_of(longitude):
+    return min(int(math.floor((min(max(longitude, -180.0), 180.0) + 180.0) / CELL_SIZE)), GRID_COLUMNS - 1)
+
+
+def cell_of(latitude, longitude):
+    """Retourner la cellule de grille contenant un point, ou False s'il n'est pas situé."""
+
+    if not is_located(latitude, longitude):
+        return False
+    return _row_of(latitude) * GRID_COLUMNS + _column_of(longitude)
+
+
+def bbox_around(latitude, longitude, radius_km):
+    """Retourner le rectangle (lat min, lon min, lat max, lon max) englobant un cercle."""
+
+    angle = radius_km / EARTH_RADIUS_KM
+    delta_latitude = math.degrees(angle)
+    ratio = math.sin(angle) / max(math.cos(math.radians(latitude)), 1e-12)
+    delta_longitude = 180.0 if ratio >= 1 else math.degrees(math.asin(ratio))
+    return (
+        max(latitude - delta_latitude, -90.0),
+        max(longitude - delta_longitude, -180.0),
+        min(latitude + delta_latitude, 90.0),
+        min(longitude + delta_longitude, 180.0),
+    )
+
+
+def cell_ranges(bbox):
+    """Retourner les intervalles de cellules (début, fin) couvrant un rectangle."""
+
+    min_latitude, min_longitude, max_latitude, max_longitude = bbox
+    first_column, last_column = _column_of(min_longitude), _column_of(max_longitude)
+    return [
+        (row * GRID_COLUMNS + first_column, row * GRID_COLUMNS + last_column)
+        for row in range(_row_of(min_latitude), _row_of(max_latitude) + 1)
+    ]
+
+
+# Condition SQL équivalente à is_located sur les colonnes latitude/longitude.
+LOCATED_SQL = "(COALESCE(latitude, 0) <> 0 OR COALESCE(longitude, 0) <> 0)"
+
+
+def points_sql():
+    """Expression SQL équivalente à format_points sur les colonnes latitude/longitude."""
+
+    return (
+        f"CASE WHEN {LOCATED_SQL} THEN "
+        "round(latitude::numeric, 6)::text || ',' || round(longitude::numeric, 6)::text END"
+    )
+
+
+def cell_sql():
+    """Expression SQL équivalente à cell_of sur les colonnes latitude/longitude."""
+
+    row = f"floor((LEAST(GREATEST(latitude, -90), 90) + 90) / {CELL_SIZE})::int"
+    column = f"LEAST(floor((LEAST(GREATEST(longitude, -180), 180) + 180) / {CELL_SIZE})::int, {GRID_COLUMNS - 1})"
+    return f"CASE WHEN {LOCATED_SQL} THEN {row} * {GRID_COLUMNS} + {column} END"
+
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    """Distance orthodromique entre deux points, en kilomètres."""
+
+    half_dlat = math.radians(latitude2 - latitude1) / 2
+    half_dlon = math.radians(longitude2 - longitude1) / 2
+    value = math.sin(half_dlat) ** 2 + math.cos(math.radians(latitude1)) * math.cos(
+        math.radians(latitude2)
+    ) * math.sin(half_dlon) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(value)))
+
+
+def distance_sql(latitude, longitude):
+    """Expression SQL de la distance (km) entre les colonnes latitude/longitude et un point."""
+
+    return (
+        f"{2 * EARTH_RADIUS_KM} * asin(LEAST(1, sqrt("
+        "power(sin(radians(latitude - %s) / 2), 2) "
+        "+ cos(radians(%s)) * cos(radians(latitude)) * power(sin(radians(longitude - %s) / 2), 2))))",
+        [latitude, latitude, longitude],
+    )
+
+
+def bbox_condition(bbox):
+    """Condition SQL restreignant une requête aux fiches situées dans un rectangle."""
+
+    min_latitude, min_longitude, max_latitude, max_longitude = bbox
+    conditions = [
+        "latitude BETWEEN %s AND %s",
+        "longitude BETWEEN %s AND %s",
+        "(latitude <> 0 OR longitude <> 0)",
+    ]
+    params = [min_latitude, max_latitude, min_longitude, max_longitude]
+    ranges = cell_ranges(bbox)
+    if len(ranges) <= MAX_CELL_ROWS:
+        conditions.insert(0, "(%s)" % " OR ".join(["geo_cell BETWEEN %s AND %s"] * len(ranges)))
+        params = [bound for cell_range in ranges for bound in cell_range] + params
+    return " AND ".join(conditions), params
+
+
+def search_spatial(cr, table, bbox, center=None, radius_km=None, limit=None, columns="id", where="", params=()):
+    """Retourner les lignes de ``table`` situées dans ``bbox``, les plus proches de ``center`` d'abord.
+
+    Chaque ligne contient ``columns`` suivi de la distance au centre (None
+    sans centre). Avec ``radius_km``, seules les fiches à cette distance du
+    centre sont conservées.
+    """
+
+    condition, condition_params = bbox_condition(bbox)
+    query_params = []
+    distance = "NULL::float"
+    if center:
+        distance, query_params = distance_sql(*center)
+    filters = [condition]
+    filter_params = list(condition_params)
+    if where:
+        filters.append(where)
+        filter_params.extend(params)
+    query = f'SELECT {columns}, {distance} AS distance FROM "{table}" WHERE {" AND ".join(filters)}'
+    if center and radius_km is not None:
+        query = f"SELECT * FROM ({query}) AS located WHERE distance <= %s"
+        filter_params.append(radius_km)
+    query += " ORDER BY distance, id" if center else " ORDER BY id"
+    if limit:
+        query += " LIMIT %s"
+        filter_params.append(limit)
+    cr.execute(query, query_params + filter_params)
+    return cr.fetchall()
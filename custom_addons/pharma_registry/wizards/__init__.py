@@ -1,3 +1,6 @@
 # -*- coding: utf-8 -*-
+from . import import_mixin
 from . import import_geo
 from . import import_establishment
+from . import export_establishment
+from . import import_photo
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""Export en flux des établissements dans le format de colonnes attendu par l'import."""
+
+import csv
+import os
+import re
+import uuid
+
+from odoo import fields, models, tools, _
+from odoo.exceptions import UserError
+
+from ..models.establishment import ESTABLISHMENT_MODELS
+from ..tools.instrumentation import add_rows, profiled
+from .import_establishment import get_type_columns
+
+try:
+    import xlsxwriter  # type: ignore
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    xlsxwriter = None
+
+# Libellés relus à l'identique par les conversions de l'assistant d'import.
+SEXE_LABELS = {"f": "F", "m": "M"}
+TRANCHE_LABELS = {
+    "moins_30": "18-29",
+    "30_39": "30-39",
+    "40_49": "40-49",
+    "50_59": "50-59",
+    "60_plus": "60+",
+}
+STATUT_LABELS = {"transfert": "Transfert", "rachat": "Rachat", "creation": "Création"}
+
+# Colonnes ajoutées après les colonnes propres au type.
+TRAILING_HEADERS = ["CODE", "REGION", "DEPARTEMENT", "COMMUNE", "LATITUDE", "LONGITUDE"]
+
+EXPORT_MIMETYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+class PharmaExportEstablishmentWizard(models.TransientModel):
+    """Écrire un type d'établissement dans un fichier réimportable, par paquets de lignes."""
+
+    _name = "pharma.export.establishment.wizard"
+    _description = "Assistant d'export des établissements"
+
+    type_etablissement = fields.Selection(
+        [
+            ("officine", "Officine"),
+            ("depot", "Dépôt de médicaments"),
+            ("grossiste", "Grossiste répartiteur"),
+            ("agence", "Agence de promotion"),
+            ("fabrication", "Établissement de fabrication"),
+        ],
+        string="Type d'établissement",
+        required=True,
+        default=lambda self: self.env.context.get("default_type_etablissement") or "officine",
+    )
+    file_format = fields.Selection(
+        [("csv", "CSV"), ("xlsx", "Excel (XLSX)")],
+        string="Format",
+        required=True,
+        default="csv",
+    )
+    include_archived = fields.Boolean(string="Inclure les fiches archivées")
+    chunk_size = fields.Integer(
+        string="Lignes par lecture",
+        default=2000,
+        help="Nombre de fiches lues par requête : la mémoire utilisée ne dépend que de cette valeur.",
+    )
+    export_token = fields.Char(readonly=True, copy=False)
+    export_filename = fields.Char(string="Fichier", readonly=True)
+    row_count = fields.Integer(string="Lignes exportées", readonly=True)
+
+    @profiled("action_export")
+    def action_export(self):
+        """Produire le fichier d'export puis le proposer au téléchargement."""
+
+        self.ensure_one()
+        if self.file_format == "xlsx" and xlsxwriter is None:
+            raise UserError(_("Le module python xlsxwriter est requis pour produire des fichiers XLSX."))
+        self.env[ESTABLISHMENT_MODELS[self.type_etablissement]].check_access_rights("read")
+        self._remove_export_file()
+        self.write(
+            {
+                "export_token": uuid.uuid4().hex,
+                "export_filename": "%s.%s" % (self.type_etablissement, self.file_format),
+            }
+        )
+        path = self._get_export_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        headers = self._get_export_headers()
+        rows = self._iter_export_rows()
+        if self.file_format == "csv":
+            row_count = self._write_csv(path, headers, rows)
+        else:
+            row_count = self._write_xlsx(path, headers, rows)
+        self.row_count = row_count
+        return {
+            "type": "ir.actions.act_url",
+            "url": "/pharma_registry/export/%s" % self.id,
+            "target": "new",
+        }
+
+    def unlink(self):
+        for wizard in self:
+            wizard._remove_export_file()
+        return super().unlink()
+
+    # ------------------------------------------------------------------
+    # Fichier produit
+    # ------------------------------------------------------------------
+    def _get_export_path(self):
+        """Retourner le chemin du fichier d'export, dérivé du jeton de l'assistant."""
+
+        self.ensure_one()
+        if not self.export_token or not re.fullmatch(r"[0-9a-f]{32}", self.export_token):
+            return False
+        directory = os.path.join(tools.config["data_dir"], "pharma_registry_exports", self.env.cr.dbname)
+        return os.path.join(directory, "%s_%s.%s" % (self.id, self.export_token, self.file_format))
+
+    def _remove_export_file(self):
+        path = self._get_export_path()
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    def _get_export_headers(self):
+        """Reprendre les en-têtes lus par l'assistant d'import pour ce type."""
+
+        return [headers[0] for _field, headers, _kind, _required in get_type_columns(self.type_etablissement)] + (
+            TRAILING_HEADERS
+        )
+
+    @staticmethod
+    def _write_csv(path, headers, rows):
+        row_count = 0
+        with open(path, "w", encoding="utf-8-sig", newline="") as handle:
+            writer = csv.writer(handle)
+            writer.writerow(headers)
+            for row in rows:
+                writer.writerow(row)
+                row_count += 1
+        return row_count
+
+    @staticmethod
+    def _write_xlsx(path, headers, rows):
+        """Écrire la feuille ligne à ligne (mode ``constant_memory`` de xlsxwriter)."""
+
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+        try:
+            sheet = workbook.add_worksheet()
+            sheet.write_row(0, 0, headers)
+            row_count = 0
+            for row_count, row in enumerate(rows, start=1):
+                sheet.write_row(row_count, 0, row)
+        finally:
+            workbook.close()
+        return row_count
+
+    # ------------------------------------------------------------------
+    # Lecture par paquets
+    # ------------------------------------------------------------------
+    def _iter_export_rows(self):
+        """Lire les fiches par paquets ordonnés par id (pagination par clé, sans OFFSET).
+
+        Le filtre d'archivage et les règles d'accès en lecture de l'utilisateur
+        s'appliquent comme pour une recherche.
+        """
+
+        Model = self.env[ESTABLISHMENT_MODELS[self.type_etablissement]]
+        if self.include_archived:
+            Model = Model.with_context(active_test=False)
+        columns = get_type_columns(self.type_etablissement)
+        Model.flush_model()
+        where_query = Model._where_calc([])
+        Model._apply_ir_rules(where_query, "read")
+        from_clause, where_clause, where_params = where_query.get_sql()
+        table = f'"{Model._table}"'
+        selected = ", ".join(f'{table}."{field_name}"' for field_name, _headers, _kind, _required in columns)
+        query = f"""
+            SELECT {table}.id, {selected}, {table}.code, region.name, department.name, commune.name,
+                   {table}.latitude, {table}.longitude
+              FROM {from_clause}
+              LEFT JOIN pharma_geo_region region ON region.id = {table}.region_id
+              LEFT JOIN pharma_geo_department department ON department.id = {table}.department_id
+              LEFT JOIN pharma_geo_commune commune ON commune.id = {table}.commune_id
+             WHERE {where_clause or "TRUE"} AND {table}.id > %s
+             ORDER BY {table}.id
+             LIMIT %s
+        """
+        kinds = [kind for _field, _headers, kind, _required in columns]
+        last_id = 0
+        while True:
+            self.env.cr.execute(query, list(where_params) + [last_id, max(self.chunk_size, 1)])
+            records = self.env.cr.fetchall()
+            if not records:
+                return
+            add_rows(len(records))
+            last_id = records[-1][0]
+            for record in records:
+                values = record[1:]
+                latitude, longitude = values[-2:]
+                located = bool(latitude or longitude)
+                yield [self._format_value(value, kind) for value, kind in zip(values, kinds)] + [
+                    value or "" for value in values[len(kinds):-2]
+                ] + [latitude if located else "", longitude if located else ""]
+
+    @staticmethod
+    def _format_value(value, kind):
+        """Ramener une valeur stockée au texte que l'import convertit vers la même valeur."""
+
+        if value is None or value is False:
+            return ""
+        if kind == "sexe":
+            return SEXE_LABELS.get(value, "")
+        if kind == "tranche":
+            return TRANCHE_LABELS.get(value, "")
+        if kind == "statut":
+            return STATUT_LABELS.get(value, "")
+        if kind == "date":
+            return value.isoformat()
+        return value
@@ -3,15 +3,112 @@
 
 import base64
 import csv
+import hashlib
 import io
+import itertools
+import json
 
-from odoo import api, fields, models, _
+from odoo import fields, models, _
 from odoo.exceptions import UserError
 
-try:
-    from openpyxl import load_workbook  # type: ignore
-except ImportError:  # pragma: no cover - dépendance optionnelle
-    load_workbook = None
+from ..models.geo import get_geo_snapshot
+from ..tools import fuzzy
+from ..tools.instrumentation import add_rows, profiled
+
+# En-tête de la colonne « nom » selon le type d'établissement.
+NAME_HEADERS = {
+    "officine": "NOM DE L'OFFICINE",
+    "depot": "NOM DU DEPOT",
+    "grossiste": "NOM GROSSISTE REPARTITEUR",
+    "agence": "NOM DE L'AGENCE DE PROMOTION",
+    "fabrication": "NOM DE L'ETABLISSEMENT",
+}
+
+# En-tête de la colonne d'adresse selon le type d'établissement.
+ADDRESS_HEADERS = {
+    "officine": "ADRESSE  EXACTE DE L'OFFICINE",
+    "depot": "ADRESSE  EXACTE DU DEPOT",
+    "grossiste": "ADRESSE  EXACTE",
+    "agence": "ADRESSE  EXACTE",
+    "fabrication": "ADRESSE  EXACTE",
+}
+
+# Colonnes propres à chaque type : (champ, en-têtes acceptés, conversion, obligatoire).
+TYPE_COLUMNS = {
+    "officine": [
+        ("numero_telephone", ("NUMERO TELEPHONE",), "char", True),
+        ("annee_creation", ("ANNEE CREATION",), "int", True),
+        ("annee_exploitation", ("ANNEE   D'EXPLOITATION", "ANNEE D'EXPLOITATION"), "int", True),
+        ("statut", ("STATUT (TRANSFERT-RACHAT)",), "statut", False),
+        ("titulaire_nom", ("PRENOM ET NOM TITULAIRE/PHARMACIEN RESPONSABLE",), "char", True),
+        ("numero_ordre", ("NUMERO D'INSCRIPTION ORDRE DES PHARMACIEN",), "char", True),
+        ("sexe_titulaire", ("SEXE",), "sexe", False),
+        ("tranche_age", ("TRANCHE D'AGE",), "tranche", False),
+        ("nombre_assistants", ("NOMBRE D'ASSISTANTS",), "int", True),
+        ("nombre_employe_pharmacien", ("NOMBRE D'EMPLOYE PHARMACIEN",), "int", True),
+        ("nombre_employe_non_pharmacien", ("NOMBRE D'EMPLOYE NON PHARMACIEN",), "int", True),
+        ("nombre_agent_securite", ("NOMBRE D'AGENT DE SECURITE",), "int", True),
+        ("nombre_agent_hygiene", ("NOMBRE D'AGENT D'HYGIENE",), "int", True),
+        ("chiffre_affaire", ("CHIFFRE D'AFFAIRE",), "float", False),
+        ("nombre_vehicule", ("NOMBRE DE VEHICULE(LIVRAISON ET TRANSFERT)",), "int", False),
+    ],
+    "depot": [
+        ("numero_telephone", ("NUMERO TELEPHONE",), "char", True),
+        ("annee_ouverture", ("ANNEE D'OUVERTURE",), "int", True),
+        ("responsable_nom", ("PRENOM ET NOM RESPONSABLE/DEPOSITAIRE",), "char", True),
+        ("sexe_responsable", ("SEXE",), "sexe", False),
+    ],
+    "grossiste": [
+        ("numero_telephone", ("NUMERO TELEPHONE",), "char", True),
+        ("annee_ouverture", ("ANNEE D'OUVERTURE",), "int", True),
+        ("responsable_nom", ("PRENOM ET NOM RESPONSABLE/DIRECTEUR",), "char", True),
+        ("nombre_employe_pharmacien", ("NOMBRE D'EMPLOYE PHARMACIEN",), "int", True),
+        ("nombre_employe_non_pharmacien", ("NOMBRE D'EMPLOYE NON PHARMACIEN",), "int", True),
+        ("nombre_agent_securite", ("NOMBRE D'AGENT DE SECURITE",), "int", True),
+        ("nombre_agent_hygiene", ("NOMBRE D'AGENT D'HYGIENE",), "int", True),
+        ("chiffre_affaire", ("CHIFFRE D'AFFAIRE",), "float", False),
+        ("nombre_vehicule", ("NOMBRE DE VEHICULE(LIVRAISON ET TRANSFERT)",), "int", False),
+    ],
+    "agence": [
+        ("numero_telephone", ("NUMERO TELEPHONE",), "char", True),
+        ("annee_ouverture", ("ANNEE D'OUVERTURE",), "int", True),
+        ("numero_agrement", ("NUMERO DE L'AGREMENT",), "char", True),
+        ("date_agrement", ("DATE DE L'AGREMENT",), "date", True),
+        ("pharmacien_responsable", ("PRENOM ET NOM  DU PHARMACIEN RESPONSABLE",), "char", True),
+        ("nombre_employe_pharmacien", ("NOMBRE D'EMPLOYE PHARMACIEN",), "int", True),
+        ("nombre_employe_non_pharmacien", ("NOMBRE D'EMPLOYE NON PHARMACIEN",), "int", True),
+        ("chiffre_affaire", ("CHIFFRE D'AFFAIRE",), "float", False),
+        ("laboratoire_represente", ("NOM DU LABORATOIRE REPRESENTE",), "char", False),
+    ],
+    "fabrication": [
+        ("numero_telephone", ("NUMERO TELEPHONE",), "char", True),
+        ("annee_ouverture", ("ANNEE D'OUVERTURE",), "int", True),
+        ("responsable_nom", ("PRENOM ET NOM RESPONSABLE",), "char", True),
+        ("nombre_employe_pharmacien", ("NOMBRE D'EMPLOYE PHARMACIEN",), "int", True),
+        ("nombre_employe_non_pharmacien", ("NOMBRE D'EMPLOYE NON PHARMACIEN",), "int", True),
+        ("nombre_agent_securite", ("NOMBRE D'AGENT DE SECURITE",), "int", True),
+        ("nombre_agent_hygiene", ("NOMBRE D'AGENT D'HYGIENE",), "int", True),
+        ("chiffre_affaire", ("CHIFFRE D'AFFAIRE",), "float", False),
+    ],
+}
+
+
+# Compteurs d'écriture cumulés par lot et par tâche d'import.
+COUNTER_KEYS = ("created", "updated", "changed", "unchanged")
+
+# Nombre maximal de fiches absentes nommées dans le message de fin d'import.
+MISSING_NAMES_LIMIT = 10
+
+
+def get_type_columns(type_etablissement):
+    """Retourner les colonnes lues pour un type : colonnes communes puis colonnes propres."""
+
+    return [
+        ("name", (NAME_HEADERS[type_etablissement],), "char", True),
+        ("quartier", ("QUARTIER", "QUARTIER/VILLAGE/HAMEAU"), "char", True),
+        ("adresse", (ADDRESS_HEADERS[type_etablissement],), "char", True),
+        ("observations", ("OBSERVATIONS",), "char", False),
+    ] + TYPE_COLUMNS[type_etablissement]
 
 
 class PharmaImportEstablishmentWizard(models.TransientModel):
@@ -19,6 +116,7 @@ class PharmaImportEstablishmentWizard(models.TransientModel):
 
     _name = "pharma.import.establishment.wizard"
     _description = "Assistant d'import des établissements"
+    _inherit = "pharma.import.mixin"
 
     type_etablissement = fields.Selection(
         [
@@ -32,271 +130,707 @@ class PharmaImportEstablishmentWizard(models.TransientModel):
         required=True,
         default=lambda self: self.env.context.get("default_type_etablissement") or "officine",
     )
-    file_data = fields.Binary(string="Fichier", required=True)
-    filename = fields.Char(string="Nom du fichier")
     allow_update = fields.Boolean(string="Mettre à jour les fiches existantes", default=True)
+    batch_size = fields.Integer(
+        string="Taille des lots",
+        default=500,
+        help="Nombre de lignes regroupées dans un même appel de création ou de mise à jour.",
+    )
+    match_field = fields.Selection(
+        [
+            ("name", "Nom"),
+            ("code", "Code"),
+            ("numero", "Numéro d'ordre / d'agrément"),
+        ],
+        string="Rapprocher les fiches par",
+        required=True,
+        default="name",
+        help="Colonne utilisée pour retrouver une fiche existante avant de la mettre à jour.",
+    )
+    prefetch_matching = fields.Boolean(
+        string="Précharger les fiches existantes",
+        default=True,
+        help="Charger en une requête toutes les valeurs de rapprochement du modèle cible "
+        "au lieu d'interroger la base pour chaque ligne.",
+    )
+    delta_import = fields.Boolean(
+        string="Import différentiel",
+        help="Conserver une empreinte des valeurs importées pour chaque fiche : les lignes "
+        "identiques au précédent import sont ignorées et seuls les champs modifiés sont écrits.",
+    )
+    dry_run_summary = fields.Text(string="Résultat de la simulation", readonly=True)
+    report_file = fields.Binary(string="Rapport d'erreurs", readonly=True, attachment=False)
+    report_filename = fields.Char(string="Nom du rapport", readonly=True)
 
+    @profiled("action_import")
     def action_import(self):
         """Créer ou mettre à jour des fiches à partir du fichier transmis."""
 
         self.ensure_one()
-        rows = self._read_rows()
-        if not rows:
-            raise UserError(_("Le fichier ne contient aucune donnée."))
-
-        model_name = {
-            "officine": "pharma.officine",
-            "depot": "pharma.depot",
-            "grossiste": "pharma.grossiste",
-            "agence": "pharma.agence",
-            "fabrication": "pharma.fabrication",
-        }[self.type_etablissement]
-
-        Model = self.env[model_name]
-        created = updated = 0
+        if self.run_in_background:
+            return self._enqueue_job()
+        counters = self._run_import()
+        params = {
+            "title": _("Import des établissements"),
+            "message": self._get_result_message(counters),
+            "type": "success",
+        }
+        if counters.get("missing_ids"):
+            params.update(type="warning", sticky=True, next=self._get_missing_action(counters["missing_ids"]))
+        return {"type": "ir.actions.client", "tag": "display_notification", "params": params}
 
-        for row in rows:
-            vals = self._prepare_vals(row)
-            if not vals.get("name"):
-                raise UserError(_("La colonne 'Nom' est obligatoire pour chaque enregistrement."))
+    @profiled("action_dry_run")
+    def action_dry_run(self):
+        """Contrôler toutes les lignes du fichier sans rien écrire.
 
-            domain = [("name", "=ilike", vals["name"])]
-            record = Model.search(domain, limit=1)
+        Chaque ligne passe par la même préparation que l'import (géographie,
+        colonnes obligatoires, nombres, dates) avec les index chargés une seule
+        fois ; toutes les erreurs sont reportées dans un CSV téléchargeable.
+        """
 
-            if record:
-                if self.allow_update:
-                    record.write(vals)
-                    updated += 1
-                continue
-            Model.create(vals)
-            created += 1
+        self.ensure_one()
+        self._check_match_mode()
+        geo_index = self._build_geo_index()
+        match_field = self._get_match_field_name()
+        match_label = self.env[self._get_model_name()]._fields[match_field].string
+        errors = []
+        row_count = 0
+        rows = self._iter_rows()
+        while True:
+            chunk = list(itertools.islice(rows, max(self.batch_size, 1)))
+            if not chunk:
+                break
+            add_rows(len(chunk))
+            vals_list, chunk_errors = self._prepare_vals_batch(chunk, geo_index, row_count + 1)
+            errors.extend(chunk_errors)
+            line_numbers = self._get_line_numbers(chunk, row_count + 1)
+            for line_number, vals in zip(line_numbers, vals_list):
+                if not vals.get(match_field):
+                    errors.append(
+                        (
+                            line_number,
+                            _("La valeur de rapprochement '%s' est obligatoire pour chaque enregistrement.")
+                            % match_label,
+                        )
+                    )
+            row_count += len(chunk)
+        if not row_count:
+            raise UserError(_("Le fichier ne contient aucune donnée."))
 
-        message = _("%s créations, %s mises à jour") % (created, updated)
+        errors.sort(key=lambda error: error[0])
+        invalid_rows = len({row_number for row_number, _message in errors})
+        values = {
+            "dry_run_summary": _("%s lignes contrôlées, %s lignes en erreur (%s erreurs).")
+            % (row_count, invalid_rows, len(errors)),
+            "report_file": False,
+            "report_filename": False,
+        }
+        if errors:
+            values["report_file"] = self._build_error_report(errors)
+            values["report_filename"] = "%s_erreurs.csv" % (self.filename or "import").rsplit(".", 1)[0]
+        self.write(values)
         return {
-            "type": "ir.actions.client",
-            "tag": "display_notification",
-            "params": {
-                "title": _("Import des établissements"),
-                "message": message,
-                "type": "success",
-            },
+            "type": "ir.actions.act_window",
+            "name": _("Import des établissements"),
+            "res_model": self._name,
+            "res_id": self.id,
+            "view_mode": "form",
+            "target": "new",
         }
 
-    # ------------------------------------------------------------------
-    # Fonctions utilitaires
-    # ------------------------------------------------------------------
-    def _read_rows(self):
-        """Convertir le fichier binaire en liste de dictionnaires."""
-
-        decoded = base64.b64decode(self.file_data)
-        if not self.filename:
-            raise UserError(_("Veuillez fournir un nom de fichier."))
-        extension = self.filename.lower().rsplit(".", 1)[-1]
-        if extension == "csv":
-            content = decoded.decode("utf-8-sig")
-            reader = csv.DictReader(io.StringIO(content))
-            return [row for row in reader if any(row.values())]
-        if extension in ("xlsx", "xlsm"):
-            if load_workbook is None:
-                raise UserError(_("Le module python openpyxl est requis pour lire les fichiers XLSX."))
-            workbook = load_workbook(filename=io.BytesIO(decoded), read_only=True, data_only=True)
-            sheet = workbook.active
-            headers = []
-            data_rows = []
-            for index, row in enumerate(sheet.iter_rows(values_only=True)):
-                if index == 0:
-                    headers = [str(cell).strip() if cell else "" for cell in row]
-                    continue
-                if not any(row):
-                    continue
-                record = {}
-                for header, cell in zip(headers, row):
-                    if not header:
-                        continue
-                    record[header] = cell if cell is not None else ""
-                data_rows.append(record)
-            return data_rows
-        raise UserError(_("Format de fichier non supporté: %s" % extension))
-
-    def _prepare_vals(self, row):
-        """Mapper les valeurs brutes vers les champs du modèle, quel que soit le type."""
+    @staticmethod
+    def _build_error_report(errors):
+        """Écrire la liste des erreurs (ligne, message) dans un CSV encodé en base64."""
 
-        base_vals = {}
-        name_key = {
-            "officine": "NOM DE L'OFFICINE",
-            "depot": "NOM DU DEPOT",
-            "grossiste": "NOM GROSSISTE REPARTITEUR",
-            "agence": "NOM DE L'AGENCE DE PROMOTION",
-            "fabrication": "NOM DE L'ETABLISSEMENT",
-        }[self.type_etablissement]
-        base_vals["name"] = self._get_value(row, name_key)
-
-        base_vals["region_id"] = self._find_region(row.get("REGION"))
-        base_vals["department_id"] = self._find_department(row.get("DEPARTEMENT"), base_vals["region_id"])
-        base_vals["commune_id"] = self._find_commune(row.get("COMMUNE"), base_vals["department_id"])
-        base_vals["quartier"] = self._required_value(row, "QUARTIER") or row.get("QUARTIER/VILLAGE/HAMEAU")
-        base_vals["adresse"] = self._required_value(row, self._get_address_key())
-        latitude, longitude = self._extract_coordinates(row)
-        base_vals["latitude"] = latitude
-        base_vals["longitude"] = longitude
-        base_vals["observations"] = self._get_value(row, "OBSERVATIONS")
-
-        handler = getattr(self, f"_prepare_{self.type_etablissement}")
-        base_vals.update(handler(row))
-        return base_vals
-
-    # Traitements spécifiques -------------------------------------------------
-    def _prepare_officine(self, row):
-        """Extraire les colonnes propres aux officines."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["LIGNE", "ERREUR"])
+        writer.writerows(errors)
+        return base64.b64encode(buffer.getvalue().encode("utf-8-sig"))
 
+    def _start_import(self):
+        """Charger une fois les index utilisés par toutes les lignes de l'import."""
+
+        self._check_match_mode()
+        Model = self.env[self._get_model_name()]
         return {
-            "numero_telephone": self._required_value(row, "NUMERO TELEPHONE"),
-            "annee_creation": self._required_int(row.get("ANNEE CREATION")),
-            "annee_exploitation": self._required_int(
-                row.get("ANNEE   D'EXPLOITATION") or row.get("ANNEE D'EXPLOITATION")
-            ),
-            "statut": self._map_statut(row.get("STATUT (TRANSFERT-RACHAT)")),
-            "titulaire_nom": self._required_value(row, "PRENOM ET NOM TITULAIRE/PHARMACIEN RESPONSABLE"),
-            "numero_ordre": self._required_value(row, "NUMERO D'INSCRIPTION ORDRE DES PHARMACIEN"),
-            "sexe_titulaire": self._map_sexe(row.get("SEXE")),
-            "tranche_age": self._map_tranche(row.get("TRANCHE D'AGE")),
-            "nombre_assistants": self._required_int(row.get("NOMBRE D'ASSISTANTS")),
-            "nombre_employe_pharmacien": self._required_int(row.get("NOMBRE D'EMPLOYE PHARMACIEN")),
-            "nombre_employe_non_pharmacien": self._required_int(row.get("NOMBRE D'EMPLOYE NON PHARMACIEN")),
-            "nombre_agent_securite": self._required_int(row.get("NOMBRE D'AGENT DE SECURITE")),
-            "nombre_agent_hygiene": self._required_int(row.get("NOMBRE D'AGENT D'HYGIENE")),
-            "chiffre_affaire": self._to_float(row.get("CHIFFRE D'AFFAIRE")),
-            "nombre_vehicule": self._to_int(row.get("NOMBRE DE VEHICULE(LIVRAISON ET TRANSFERT)")),
+            "model": Model,
+            "geo_index": self._build_geo_index(),
+            "matcher": self._build_matcher(Model),
+            "counters": dict.fromkeys(("rows",) + COUNTER_KEYS, 0),
         }
 
-    def _prepare_depot(self, row):
-        """Extraire les colonnes propres aux dépôts."""
+    def _import_rows(self, rows, import_context):
+        """Préparer et écrire par lots les lignes reçues, en cumulant les compteurs."""
+
+        counters = import_context["counters"]
+        vals_list = self._iter_prepared_vals(rows, import_context)
+        self._write_vals(import_context["model"], vals_list, import_context["matcher"], counters)
+        return counters
+
+    def _pop_matched_ids(self, import_context):
+        matched_ids = import_context["matcher"]["matched_ids"]
+        if not matched_ids:
+            return []
+        record_ids = list(matched_ids)
+        matched_ids.clear()
+        return record_ids
+
+    def _restore_matched_ids(self, import_context, record_ids):
+        matched_ids = import_context["matcher"]["matched_ids"]
+        if matched_ids is not None:
+            matched_ids.update(record_ids)
+
+    def _iter_prepared_vals(self, rows, import_context):
+        """Convertir les lignes par paquets, colonne par colonne, en comptant les lignes lues."""
+
+        counters = import_context["counters"]
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, max(self.batch_size, 1)))
+            if not chunk:
+                return
+            first_row = counters["rows"] + 1
+            counters["rows"] += len(chunk)
+            add_rows(len(chunk))
+            vals_list, errors = self._prepare_vals_batch(chunk, import_context["geo_index"], first_row)
+            if errors:
+                raise UserError(self._format_row_error(*min(errors, key=lambda error: error[0])))
+            yield from vals_list
+
+    def _write_vals(self, Model, vals_list, matcher, counters):
+        """Créer ou mettre à jour les fiches par lots de ``batch_size`` valeurs."""
+
+        batch_size = max(self.batch_size, 1)
+        batch = self._new_batch()
+        vals_list = iter(vals_list)
+        while True:
+            chunk = list(itertools.islice(vals_list, batch_size))
+            if not chunk:
+                break
+            self._prefetch_similar_matches(Model, matcher, chunk)
+            for vals in chunk:
+                self._stage_vals(Model, vals, batch, counters, matcher)
+                if batch["size"] >= batch_size:
+                    self._flush_batch(Model, batch, matcher)
+                    batch = self._new_batch()
+        self._flush_batch(Model, batch, matcher)
+
+    def _finish_import(self, import_context):
+        """En import différentiel, relever les fiches déjà importées absentes du fichier.
+
+        Seules les fiches actives portant une empreinte d'import sont
+        considérées ; une fiche rapprochée par plusieurs lignes ne compte
+        qu'une fois.
+        """
+
+        counters = import_context["counters"]
+        matched_ids = import_context["matcher"]["matched_ids"]
+        if matched_ids is not None:
+            missing = import_context["model"].search(
+                [("import_hash", "!=", False), ("id", "not in", list(matched_ids))], order="id"
+            )
+            counters["missing"] = len(missing)
+            counters["missing_ids"] = missing.ids
+        return counters
+
+    def _get_result_message(self, counters):
+        if "missing" in counters:
+            message = _("%s créations, %s modifiées, %s inchangées, %s absentes du fichier") % (
+                counters["created"],
+                counters["changed"],
+                counters["unchanged"],
+                counters["missing"],
+            )
+            if counters.get("missing_ids"):
+                message = "%s : %s" % (message, self._format_missing(counters["missing_ids"]))
+            return message
+        return _("%s créations, %s mises à jour") % (counters["created"], counters["updated"])
+
+    def _format_missing(self, missing_ids):
+        """Nommer (code et nom) les premières fiches absentes du fichier."""
+
+        records = self.env[self._get_model_name()].browse(missing_ids[:MISSING_NAMES_LIMIT])
+        names = ", ".join("%s %s" % (record.code or "", record.name) for record in records)
+        if len(missing_ids) > MISSING_NAMES_LIMIT:
+            names += ", …"
+        return names
+
+    def _get_missing_action(self, missing_ids):
+        """Ouvrir la liste des fiches absentes du fichier importé."""
 
         return {
-            "numero_telephone": self._required_value(row, "NUMERO TELEPHONE"),
-            "annee_ouverture": self._required_int(row.get("ANNEE D'OUVERTURE")),
-            "responsable_nom": self._required_value(row, "PRENOM ET NOM RESPONSABLE/DEPOSITAIRE"),
-            "sexe_responsable": self._map_sexe(row.get("SEXE")),
+            "type": "ir.actions.act_window",
+            "name": _("Fiches absentes du fichier"),
+            "res_model": self._get_model_name(),
+            "view_mode": "tree,form",
+            "views": [(False, "tree"), (False, "form")],
+            "domain": [("id", "in", missing_ids)],
+            "target": "current",
         }
 
-    def _prepare_grossiste(self, row):
-        """Extraire les colonnes propres aux grossistes répartiteurs."""
+    def _get_job_options(self):
+        options = super()._get_job_options()
+        options.update(
+            {
+                "type_etablissement": self.type_etablissement,
+                "allow_update": self.allow_update,
+                "batch_size": self.batch_size,
+                "match_field": self.match_field,
+                "prefetch_matching": self.prefetch_matching,
+                "delta_import": self.delta_import,
+            }
+        )
+        return options
 
-        return {
-            "numero_telephone": self._required_value(row, "NUMERO TELEPHONE"),
-            "annee_ouverture": self._required_int(row.get("ANNEE D'OUVERTURE")),
-            "responsable_nom": self._required_value(row, "PRENOM ET NOM RESPONSABLE/DIRECTEUR"),
-            "nombre_employe_pharmacien": self._required_int(row.get("NOMBRE D'EMPLOYE PHARMACIEN")),
-            "nombre_employe_non_pharmacien": self._required_int(row.get("NOMBRE D'EMPLOYE NON PHARMACIEN")),
-            "nombre_agent_securite": self._required_int(row.get("NOMBRE D'AGENT DE SECURITE")),
-            "nombre_agent_hygiene": self._required_int(row.get("NOMBRE D'AGENT D'HYGIENE")),
-            "chiffre_affaire": self._to_float(row.get("CHIFFRE D'AFFAIRE")),
-            "nombre_vehicule": self._to_int(row.get("NOMBRE DE VEHICULE(LIVRAISON ET TRANSFERT)")),
-        }
+    def _get_model_name(self):
+        """Retourner le modèle cible correspondant au type sélectionné."""
 
-    def _prepare_agence(self, row):
-        """Extraire les colonnes propres aux agences de promotion."""
+        return {
+            "officine": "pharma.officine",
+            "depot": "pharma.depot",
+            "grossiste": "pharma.grossiste",
+            "agence": "pharma.agence",
+            "fabrication": "pharma.fabrication",
+        }[self.type_etablissement]
 
+    def _get_match_field_name(self):
+        """Retourner le champ du modèle cible utilisé pour le rapprochement."""
+
+        if self.match_field != "numero":
+            return self.match_field
+        field_name = {
+            "officine": "numero_ordre",
+            "agence": "numero_agrement",
+        }.get(self.type_etablissement)
+        if not field_name:
+            raise UserError(
+                _("Le rapprochement par numéro n'est disponible que pour les officines et les agences.")
+            )
+        return field_name
+
+    def _build_matcher(self, Model):
+        """Préparer le rapprochement : champ utilisé et, si demandé, index valeur ➔ id.
+
+        L'index est chargé en une seule requête et complété au fil des créations.
+        En mode approché, seul le rapprochement par nom accepte les noms proches ;
+        les codes et numéros restent comparés exactement.
+        """
+
+        field_name = self._get_match_field_name()
+        index = None
+        if self.prefetch_matching:
+            index = {}
+            for record in Model.search_read([(field_name, "!=", False)], [field_name], order="id"):
+                index.setdefault(self._normalize_key(record[field_name]), record["id"])
+        similar = {} if self.match_mode == "fuzzy" and field_name == "name" else None
+        hashes = None
+        if self.delta_import and self.allow_update:
+            hashes = {
+                record["id"]: record["import_hash"]
+                for record in Model.search_read([("import_hash", "!=", False)], ["import_hash"])
+            }
         return {
-            "numero_telephone": self._required_value(row, "NUMERO TELEPHONE"),
-            "annee_ouverture": self._required_int(row.get("ANNEE D'OUVERTURE")),
-            "numero_agrement": self._required_value(row, "NUMERO DE L'AGREMENT"),
-            "date_agrement": self._to_date(row.get("DATE DE L'AGREMENT"), required=True),
-            "pharmacien_responsable": self._required_value(row, "PRENOM ET NOM  DU PHARMACIEN RESPONSABLE"),
-            "nombre_employe_pharmacien": self._required_int(row.get("NOMBRE D'EMPLOYE PHARMACIEN")),
-            "nombre_employe_non_pharmacien": self._required_int(row.get("NOMBRE D'EMPLOYE NON PHARMACIEN")),
-            "chiffre_affaire": self._to_float(row.get("CHIFFRE D'AFFAIRE")),
-            "laboratoire_represente": self._get_value(row, "NOM DU LABORATOIRE REPRESENTE"),
+            "field": field_name,
+            "index": index,
+            "similar": similar,
+            "threshold": self.similarity_threshold,
+            "hashes": hashes,
+            "matched_ids": set() if hashes is not None else None,
         }
 
-    def _prepare_fabrication(self, row):
-        """Extraire les colonnes propres aux sites de fabrication."""
+    def _match_existing(self, Model, matcher, value):
+        """Retrouver l'id de la fiche existante correspondant à une valeur de rapprochement."""
+
+        key = self._normalize_key(value)
+        if matcher["index"] is not None:
+            record_id = matcher["index"].get(key)
+        else:
+            record_id = Model._find_id_by_lower_value(matcher["field"], value)
+        if not record_id and matcher["similar"]:
+            record_id = matcher["similar"].get(key)
+        return record_id
+
+    def _prefetch_similar_matches(self, Model, matcher, vals_list):
+        """En mode approché, chercher en une requête la fiche la plus proche des noms du paquet."""
+
+        similar = matcher["similar"]
+        if similar is None:
+            return
+        index = matcher["index"] or {}
+        pending = {}
+        for vals in vals_list:
+            value = vals.get(matcher["field"])
+            key = self._normalize_key(value)
+            if value and key not in similar and key not in index:
+                pending.setdefault(value, key)
+        if not pending:
+            return
+        matches = fuzzy.find_best_matches(Model, pending, matcher["threshold"], matcher["field"])
+        for value, key in pending.items():
+            similar.setdefault(key, matches.get(value, False))
 
-        return {
-            "numero_telephone": self._required_value(row, "NUMERO TELEPHONE"),
-            "annee_ouverture": self._required_int(row.get("ANNEE D'OUVERTURE")),
-            "responsable_nom": self._required_value(row, "PRENOM ET NOM RESPONSABLE"),
-            "nombre_employe_pharmacien": self._required_int(row.get("NOMBRE D'EMPLOYE PHARMACIEN")),
-            "nombre_employe_non_pharmacien": self._required_int(row.get("NOMBRE D'EMPLOYE NON PHARMACIEN")),
-            "nombre_agent_securite": self._required_int(row.get("NOMBRE D'AGENT DE SECURITE")),
-            "nombre_agent_hygiene": self._required_int(row.get("NOMBRE D'AGENT D'HYGIENE")),
-            "chiffre_affaire": self._to_float(row.get("CHIFFRE D'AFFAIRE")),
-        }
+    # ------------------------------------------------------------------
+    # Traitement par lots
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _new_batch():
+        """Préparer un lot vide : créations indexées par clé, mises à jour par id."""
 
-    def _extract_coordinates(self, row):
-        """Retourner un tuple (latitude, longitude) selon les colonnes disponibles."""
+        return {"create": {}, "update": {}, "size": 0}
 
-        latitude = self._to_coordinate(row.get("LATITUDE"))
-        longitude = self._to_coordinate(row.get("LONGITUDE"))
+    def _stage_vals(self, Model, vals, batch, counters, matcher):
+        """Ranger une ligne préparée dans le lot courant (création ou mise à jour).
 
-        if latitude is False or longitude is False:
-            raw = self._get_value(row, "POINTS DE GEOLOCALISATION")
-            latitude, longitude = self._parse_points(raw)
+        Une ligne dont la clé figure déjà dans les créations du lot est fusionnée
+        avec celle-ci, comme l'aurait fait une mise à jour ligne par ligne.
+        """
 
-        return latitude, longitude
+        value = vals.get(matcher["field"])
+        if not value:
+            raise UserError(
+                _("La valeur de rapprochement '%s' est obligatoire pour chaque enregistrement.")
+                % Model._fields[matcher["field"]].string
+            )
+        key = self._normalize_key(value)
+        pending = batch["create"].get(key)
+        if pending is not None:
+            if self.allow_update:
+                pending.update(vals)
+                counters["updated"] += 1
+            return
+
+        record_id = self._match_existing(Model, matcher, value)
+        if record_id:
+            if not self.allow_update:
+                return
+            if matcher["hashes"] is not None:
+                matcher["matched_ids"].add(record_id)
+                import_hash = self._hash_vals(vals)
+                if matcher["hashes"].get(record_id) == import_hash:
+                    counters["unchanged"] += 1
+                    return
+                matcher["hashes"][record_id] = import_hash
+                vals = dict(vals, import_hash=import_hash)
+                counters["changed"] += 1
+            else:
+                counters["updated"] += 1
+            batch["update"].setdefault(record_id, {}).update(vals)
+            batch["size"] += 1
+            return
+
+        batch["create"][key] = vals
+        batch["size"] += 1
+        counters["created"] += 1
+
+    def _flush_batch(self, Model, batch, matcher):
+        """Écrire le lot : une création multiple et une écriture par jeu de valeurs identique."""
+
+        if batch["create"]:
+            if matcher["hashes"] is not None:
+                for vals in batch["create"].values():
+                    vals["import_hash"] = self._hash_vals(vals)
+            records = Model.create(list(batch["create"].values()))
+            if matcher["matched_ids"] is not None:
+                matcher["matched_ids"].update(records.ids)
+            if matcher["index"] is not None:
+                matcher["index"].update(zip(batch["create"].keys(), records.ids))
+
+        updates = batch["update"]
+        if matcher["hashes"] is not None and updates:
+            updates = self._diff_updates(Model, updates)
+        groups = {}
+        for record_id, vals in updates.items():
+            signature = tuple(sorted(vals.items()))
+            groups.setdefault(signature, (vals, []))[1].append(record_id)
+        for vals, record_ids in groups.values():
+            Model.browse(record_ids).write(vals)
+
+    @staticmethod
+    def _hash_vals(vals):
+        """Empreinte stable des valeurs préparées d'une ligne (hors empreinte elle-même)."""
+
+        payload = {key: value for key, value in vals.items() if key != "import_hash"}
+        return hashlib.sha1(
+            json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+
+    def _diff_updates(self, Model, updates):
+        """Ne conserver, pour chaque fiche, que les champs dont la valeur change réellement.
+
+        Les valeurs actuelles sont lues en une requête pour tout le lot et
+        comparées après conversion au format du cache de l'ORM.
+        """
+
+        records = Model.browse(list(updates))
+        field_names = {name for vals in updates.values() for name in vals}
+        records.read(list(field_names), load=None)
+        diffs = {}
+        for record in records:
+            changed = {}
+            for name, value in updates[record.id].items():
+                field = record._fields[name]
+                if field.convert_to_record(field.convert_to_cache(value, record), record) != record[name]:
+                    changed[name] = value
+            if changed:
+                diffs[record.id] = changed
+        return diffs
+
+    # ------------------------------------------------------------------
+    # Fonctions utilitaires
+    # ------------------------------------------------------------------
+    def _prepare_vals(self, row, geo_index):
+        """Mapper les valeurs brutes vers les champs du modèle, quel que soit le type."""
+
+        vals_list, errors = self._prepare_vals_batch([row], geo_index)
+        if errors:
+            raise UserError(errors[0][1])
+        return vals_list[0]
+
+    def _prepare_vals_batch(self, rows, geo_index, first_row=1):
+        """Convertir un paquet de lignes colonne par colonne.
+
+        Chaque colonne est extraite en une liste puis convertie au travers d'une
+        table de correspondance valeur brute ➔ valeur du champ : une valeur déjà
+        rencontrée dans le paquet n'est convertie qu'une fois. Retourne la liste
+        des valeurs et la liste des erreurs ``(numéro de ligne, message)``, le
+        numéro étant celui de la ligne dans le fichier (``first_row`` et les
+        suivants pour des lignes qui ne le portent pas).
+        """
+
+        errors = []
+        line_numbers = self._get_line_numbers(rows, first_row)
+        vals_list = [{} for _row in rows]
+        for field_name, headers, kind, required in get_type_columns(self.type_etablissement):
+            values = self._convert_column(
+                self._column_values(rows, headers), kind, required, headers[0], line_numbers, errors
+            )
+            for vals, value in zip(vals_list, values):
+                vals[field_name] = value
+
+        codes = self._convert_column(
+            self._column_values(rows, ("CODE",)), "char", False, "CODE", line_numbers, errors
+        )
+        for vals, code in zip(vals_list, codes):
+            if code:
+                vals["code"] = code
+
+        geo_ids = self._resolve_geo_column(rows, geo_index, line_numbers, errors)
+        coordinates = self._convert_coordinate_columns(rows)
+        for vals, (region_id, department_id, commune_id), (latitude, longitude) in zip(
+            vals_list, geo_ids, coordinates
+        ):
+            vals.update(
+                region_id=region_id,
+                department_id=department_id,
+                commune_id=commune_id,
+                latitude=latitude,
+                longitude=longitude,
+            )
+        return vals_list, errors
+
+    @staticmethod
+    def _get_line_numbers(rows, first_row):
+        """Retourner le numéro de ligne dans le fichier de chaque ligne lue."""
+
+        return [getattr(row, "line_number", first_row + offset) for offset, row in enumerate(rows)]
+
+    @staticmethod
+    def _column_values(rows, headers):
+        """Extraire une colonne, en prenant le premier alias d'en-tête renseigné."""
+
+        values = [row.get(headers[0]) for row in rows]
+        for alias in headers[1:]:
+            values = [
+                value if value not in (None, "") else row.get(alias)
+                for value, row in zip(values, rows)
+            ]
+        return values
+
+    def _convert_column(self, values, kind, required, label, line_numbers, errors):
+        """Convertir toute une colonne en mémorisant le résultat de chaque valeur distincte."""
+
+        convert = {
+            "char": self._to_char,
+            "int": self._to_int,
+            "float": self._to_float,
+            "date": self._to_date,
+            "sexe": self._map_sexe,
+            "tranche": self._map_tranche,
+            "statut": self._map_statut,
+        }[kind]
+        table = {}
+        missing = _("La colonne '%s' est obligatoire.") % label
+        result = []
+        for line_number, raw in zip(line_numbers, values):
+            try:
+                value = table[raw]
+            except KeyError:
+                try:
+                    value = convert(raw)
+                except UserError as error:
+                    value = error
+                table[raw] = value
+            if isinstance(value, UserError):
+                errors.append((line_number, value.args[0]))
+                value = False
+            elif required and (value is None or value is False or value == ""):
+                errors.append((line_number, missing))
+            result.append(value)
+        return result
+
+    def _resolve_geo_column(self, rows, geo_index, line_numbers, errors):
+        """Résoudre région, département et commune, une fois par triplet distinct."""
+
+        table = {}
+        result = []
+        columns = zip(
+            self._column_values(rows, ("REGION",)),
+            self._column_values(rows, ("DEPARTEMENT",)),
+            self._column_values(rows, ("COMMUNE",)),
+        )
+        for line_number, names in zip(line_numbers, columns):
+            try:
+                ids = table[names]
+            except KeyError:
+                try:
+                    ids = self._resolve_geo_names(*names, geo_index=geo_index)
+                except UserError as error:
+                    ids = error
+                table[names] = ids
+            if isinstance(ids, UserError):
+                errors.append((line_number, ids.args[0]))
+                ids = (False, False, False)
+            result.append(ids)
+        return result
+
+    def _resolve_geo_names(self, region_name, department_name, commune_name, geo_index):
+        """Retourner les identifiants (région, département, commune) d'une ligne."""
+
+        for label, value in (("REGION", region_name), ("DEPARTEMENT", department_name), ("COMMUNE", commune_name)):
+            if not value:
+                raise UserError(_("La colonne '%s' est obligatoire.") % label)
+        region_id = self._find_region(region_name, geo_index)
+        department_id = self._find_department(department_name, region_id, geo_index)
+        commune_id = self._find_commune(commune_name, department_id, geo_index)
+        return region_id, department_id, commune_id
+
+    def _convert_coordinate_columns(self, rows):
+        """Retourner les couples (latitude, longitude) d'un paquet de lignes.
+
+        Les colonnes LATITUDE / LONGITUDE sont prioritaires ; la colonne
+        POINTS DE GEOLOCALISATION n'est décodée que pour les lignes incomplètes.
+        """
+
+        table = {}
+        latitudes = [
+            table[value] if value in table else table.setdefault(value, self._to_coordinate(value))
+            for value in self._column_values(rows, ("LATITUDE",))
+        ]
+        longitudes = [
+            table[value] if value in table else table.setdefault(value, self._to_coordinate(value))
+            for value in self._column_values(rows, ("LONGITUDE",))
+        ]
+        points = self._column_values(rows, ("POINTS DE GEOLOCALISATION",))
+        coordinates = []
+        for latitude, longitude, raw_points in zip(latitudes, longitudes, points):
+            if latitude is False or longitude is False:
+                latitude, longitude = self._parse_points(raw_points)
+            coordinates.append((latitude, longitude))
+        return coordinates
+
+    @staticmethod
+    def _format_row_error(row_number, message):
+        return _("Ligne %s : %s") % (row_number, message)
 
     # Méthodes utilitaires --------------------------------------------------
-    def _find_region(self, name):
+    def _build_geo_index(self):
+        """Reprendre la hiérarchie région ➔ département ➔ commune du cache du référentiel.
+
+        Les noms sont normalisés (casse, accents, espaces) et indexés par
+        identifiant parent afin de résoudre chaque ligne sans requête SQL.
+        Les index sont partagés par le processus : ils ne sont que lus.
+        """
+
+        snapshot = get_geo_snapshot(self.env)
+        return {
+            "regions": snapshot["region_ids"],
+            "departments": snapshot["department_ids"],
+            "departments_by_name": snapshot["departments_by_name"],
+            "communes": snapshot["commune_ids"],
+            "similar": {} if self.match_mode == "fuzzy" else None,
+            "threshold": self.similarity_threshold,
+        }
+
+    def _find_region(self, name, geo_index):
         if not name:
             return False
-        region = self.env["pharma.geo.region"].search([("name", "=ilike", name.strip())], limit=1)
-        if not region:
+        region_id = geo_index["regions"].get(self._normalize_key(name))
+        if not region_id:
+            region_id = self._find_similar_geo("pharma.geo.region", name, geo_index)
+        if not region_id:
             raise UserError(_("La région '%s' est introuvable. Veuillez l'importer au préalable.") % name)
-        return region.id
+        return region_id
 
-    def _find_department(self, name, region_id):
+    def _find_department(self, name, region_id, geo_index):
         if not name:
             return False
-        domain = [("name", "=ilike", name.strip())]
+        key = self._normalize_key(name)
         if region_id:
-            domain.append(("region_id", "=", region_id))
-        department = self.env["pharma.geo.department"].search(domain, limit=1)
-        if not department:
+            department_id = geo_index["departments"].get(region_id, {}).get(key)
+        else:
+            department_id = geo_index["departments_by_name"].get(key)
+        if not department_id:
+            department_id = self._find_similar_geo(
+                "pharma.geo.department", name, geo_index, region_id and "region_id", region_id
+            )
+        if not department_id:
             raise UserError(_("Le département '%s' est introuvable pour la région sélectionnée.") % name)
-        return department.id
+        return department_id
 
-    def _find_commune(self, name, department_id):
+    def _find_commune(self, name, department_id, geo_index):
         if not name:
             return False
         if not department_id:
             raise UserError(_("Impossible d'associer la commune '%s' sans département." % name))
-        commune = self.env["pharma.geo.commune"].search(
-            [
-                ("name", "=ilike", name.strip()),
-                ("department_id", "=", department_id),
-            ],
-            limit=1,
-        )
-        if not commune:
+        commune_id = geo_index["communes"].get(department_id, {}).get(self._normalize_key(name))
+        if not commune_id:
+            commune_id = self._find_similar_geo(
+                "pharma.geo.commune", name, geo_index, "department_id", department_id
+            )
+        if not commune_id:
             raise UserError(_("La commune '%s' est introuvable pour le département fourni.") % name)
-        return commune.id
+        return commune_id
 
-    def _get_value(self, row, key):
-        """Retourner la valeur texte nettoyée lorsqu'elle existe."""
+    def _find_similar_geo(self, model_name, name, geo_index, parent_field=None, parent_id=None):
+        """En mode approché, retrouver la fiche géographique la plus proche d'un nom inconnu.
 
-        value = row.get(key)
-        if isinstance(value, str):
-            return value.strip()
-        return value
+        Chaque nom absent de l'index n'est recherché qu'une fois par import.
+        """
 
-    def _required_value(self, row, key):
-        value = self._get_value(row, key)
-        if not value:
-            raise UserError(_("La colonne '%s' est obligatoire." % key))
-        return value
-
-    def _get_adresse(self, row):
-        """Identifier la colonne d'adresse en fonction du type sélectionné."""
+        similar = geo_index["similar"]
+        if similar is None:
+            return False
+        key = (model_name, parent_id, self._normalize_key(name))
+        if key not in similar:
+            matches = fuzzy.find_best_matches(
+                self.env[model_name],
+                [str(name)],
+                geo_index["threshold"],
+                parent_field=parent_field,
+                parent_id=parent_id,
+            )
+            similar[key] = matches.get(str(name), False)
+        return similar[key]
+
+    def _to_char(self, value):
+        """Retourner la valeur texte nettoyée lorsqu'elle existe."""
 
-        mapping = {
-            "officine": "ADRESSE  EXACTE DE L'OFFICINE",
-            "depot": "ADRESSE  EXACTE DU DEPOT",
-            "grossiste": "ADRESSE  EXACTE",
-            "agence": "ADRESSE  EXACTE",
-            "fabrication": "ADRESSE  EXACTE",
-        }
-        key = mapping[self.type_etablissement]
-        return self._get_value(row, key)
+        if value in (None, ""):
+            return False
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return str(value).strip() or False
 
     def _map_statut(self, value):
         """Normaliser le statut texte pour le ramener aux clés de sélection."""
@@ -308,7 +842,9 @@ class PharmaImportEstablishmentWizard(models.TransientModel):
             return "transfert"
         if "rach" in value:
             return "rachat"
-        return "autre"
+        if "cre" in value or "cré" in value:
+            return "creation"
+        return False
 
     def _map_sexe(self, value):
         """Normaliser les valeurs de sexe afin de correspondre à l'énumération."""
@@ -374,7 +910,7 @@ class PharmaImportEstablishmentWizard(models.TransientModel):
 
             for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y"):
                 try:
-                    return datetime.strptime(str(value), fmt).date()
+                    return datetime.strptime(str(value).strip(), fmt).date()
                 except ValueError:
                     continue
         except Exception:  # pragma: no cover - solution de repli
@@ -1,16 +1,12 @@
 # -*- coding: utf-8 -*-
-import base64
-import csv
-import io
 import unicodedata
 
-from odoo import models, fields, _
+from odoo import models, _
 from odoo.exceptions import UserError
 
-try:
-    from openpyxl import load_workbook  # type: ignore
-except ImportError:  # pragma: no cover - dépendance optionnelle
-    load_workbook = None
+from ..models.geo import get_geo_snapshot
+from ..tools import fuzzy
+from ..tools.instrumentation import add_rows, profiled
 
 
 class PharmaImportGeoWizard(models.TransientModel):
@@ -18,25 +14,44 @@ class PharmaImportGeoWizard(models.TransientModel):
 
     _name = "pharma.import.geo.wizard"
     _description = "Assistant d'import géographique"
+    _inherit = "pharma.import.mixin"
 
-    file_data = fields.Binary(string="Fichier", required=True)
-    filename = fields.Char(string="Nom du fichier")
-
+    @profiled("action_import")
     def action_import(self):
         """Parcourir le fichier reçu et créer ou compléter la hiérarchie géographique."""
 
         self.ensure_one()
-        rows = self._read_rows()
-        if not rows:
-            raise UserError(_("Le fichier ne contient aucune donnée."))
+        if self.run_in_background:
+            return self._enqueue_job()
+        counters = self._run_import()
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": _("Import géographique"),
+                "message": self._get_result_message(counters),
+                "type": "success",
+            },
+        }
 
-        Region = self.env["pharma.geo.region"]
-        Department = self.env["pharma.geo.department"]
-        Commune = self.env["pharma.geo.commune"]
+    def _start_import(self):
+        self._check_match_mode()
+        return {"counters": {"rows": 0, "regions": 0, "departments": 0, "communes": 0}}
 
-        created_regions = created_departments = created_communes = 0
+    def _import_rows(self, rows, import_context):
+        """Créer en bloc les régions, départements et communes absents des lignes reçues.
+
+        Les lignes sont d'abord dédoublonnées en mémoire ; les entités
+        existantes sont lues en trois requêtes et les manquantes créées en trois
+        appels groupés. Les noms sont comparés sans tenir compte de la casse.
+        """
+
+        counters = import_context["counters"]
+        first_row = counters["rows"]
+        regions, departments, communes = {}, {}, {}
 
         for row in rows:
+            counters["rows"] += 1
             region_name = self._get_first_value(row, "REGION", "Région")
             department_name = self._get_first_value(row, "DEPARTEMENT", "Département", "Department")
             commune_name = self._get_first_value(row, "COMMUNE", "Commune")
@@ -44,93 +59,131 @@ class PharmaImportGeoWizard(models.TransientModel):
             if not region_name:
                 raise UserError(_("La colonne REGION est obligatoire."))
 
-            region = Region.search([("name", "=ilike", region_name)], limit=1)
-            if not region:
-                region = Region.create({"name": region_name})
-                created_regions += 1
-
-            department = False
-            if department_name:
-                department = Department.search(
-                    [
-                        ("name", "=ilike", department_name),
-                        ("region_id", "=", region.id),
-                    ],
-                    limit=1,
-                )
-                if not department:
-                    department = Department.create(
-                        {
-                            "name": department_name,
-                            "region_id": region.id,
-                        }
-                    )
-                    created_departments += 1
-
-            if commune_name and department:
-                commune = Commune.search(
-                    [
-                        ("name", "=ilike", commune_name),
-                        ("department_id", "=", department.id),
-                    ],
-                    limit=1,
-                )
-                if not commune:
-                    Commune.create(
-                        {
-                            "name": commune_name,
-                            "department_id": department.id,
-                            "region_id": region.id,
-                        }
-                    )
-                    created_communes += 1
-
-        message = _(
+            region_key = region_name.lower()
+            regions.setdefault(region_key, region_name)
+            if not department_name:
+                continue
+            department_key = (region_key, department_name.lower())
+            departments.setdefault(department_key, department_name)
+            if commune_name:
+                communes.setdefault(department_key + (commune_name.lower(),), commune_name)
+
+        add_rows(counters["rows"] - first_row)
+        region_ids = self._ensure_regions(regions, counters)
+        department_ids = self._ensure_departments(departments, region_ids, counters)
+        self._ensure_communes(communes, department_ids, region_ids, counters)
+        return counters
+
+    def _ensure_regions(self, regions, counters):
+        """Retourner l'id de chaque région citée, en créant les absentes en un appel."""
+
+        Region = self.env["pharma.geo.region"]
+        region_ids = {}
+        for region_id, name in get_geo_snapshot(self.env)["regions"]:
+            region_ids.setdefault(name.lower(), region_id)
+
+        missing = [key for key in regions if key not in region_ids]
+        similar = self._find_similar(Region, missing, regions)
+        region_ids.update(similar)
+        missing = [key for key in missing if key not in similar]
+        if missing:
+            created = Region.create([{"name": regions[key]} for key in missing])
+            region_ids.update(zip(missing, created.ids))
+            counters["regions"] += len(missing)
+        return region_ids
+
+    def _ensure_departments(self, departments, region_ids, counters):
+        """Retourner l'id de chaque département cité, en créant les absents en un appel."""
+
+        Department = self.env["pharma.geo.department"]
+        involved_regions = {region_ids[region_key] for region_key, _name in departments}
+        existing = {}
+        for department_id, name, region_id in get_geo_snapshot(self.env)["departments"]:
+            if region_id in involved_regions:
+                existing.setdefault((region_id, name.lower()), department_id)
+
+        department_ids = {}
+        missing = []
+        for key in departments:
+            department_id = existing.get((region_ids[key[0]], key[1]))
+            if department_id:
+                department_ids[key] = department_id
+            else:
+                missing.append(key)
+        similar = self._find_similar(
+            Department, missing, departments, "region_id", {key: region_ids[key[0]] for key in missing}
+        )
+        department_ids.update(similar)
+        missing = [key for key in missing if key not in similar]
+        if missing:
+            created = Department.create(
+                [{"name": departments[key], "region_id": region_ids[key[0]]} for key in missing]
+            )
+            department_ids.update(zip(missing, created.ids))
+            counters["departments"] += len(missing)
+        return department_ids
+
+    def _ensure_communes(self, communes, department_ids, region_ids, counters):
+        """Créer en un appel les communes citées qui n'existent pas encore."""
+
+        Commune = self.env["pharma.geo.commune"]
+        involved_departments = {department_ids[key[:2]] for key in communes}
+        existing = set()
+        for _commune_id, name, department_id, _region_id in get_geo_snapshot(self.env)["communes"]:
+            if department_id in involved_departments:
+                existing.add((department_id, name.lower()))
+
+        missing = [key for key in communes if (department_ids[key[:2]], key[2]) not in existing]
+        similar = self._find_similar(
+            Commune, missing, communes, "department_id", {key: department_ids[key[:2]] for key in missing}
+        )
+        missing = [key for key in missing if key not in similar]
+        if missing:
+            Commune.create(
+                [
+                    {
+                        "name": communes[key],
+                        "department_id": department_ids[key[:2]],
+                        "region_id": region_ids[key[0]],
+                    }
+                    for key in missing
+                ]
+            )
+            counters["communes"] += len(missing)
+
+    def _find_similar(self, Model, missing, names, parent_field=None, parent_ids=None):
+        """En mode approché, associer les clés absentes à la fiche existante la plus proche.
+
+        Retourne ``{clé: id}`` ; une requête par parent concerné.
+        """
+
+        if self.match_mode != "fuzzy" or not missing:
+            return {}
+        keys_by_parent = {}
+        for key in missing:
+            keys_by_parent.setdefault(parent_ids[key] if parent_ids else None, []).append(key)
+        found = {}
+        for parent_id, keys in keys_by_parent.items():
+            matches = fuzzy.find_best_matches(
+                Model,
+                [names[key] for key in keys],
+                self.similarity_threshold,
+                parent_field=parent_field,
+                parent_id=parent_id,
+            )
+            found.update((key, matches[names[key]]) for key in keys if names[key] in matches)
+        return found
+
+    def _get_result_message(self, counters):
+        return _(
             "%s régions créées, %s départements créés, %s communes créées."
-        ) % (created_regions, created_departments, created_communes)
+        ) % (counters["regions"], counters["departments"], counters["communes"])
 
-        return {
-            "type": "ir.actions.client",
-            "tag": "display_notification",
-            "params": {
-                "title": _("Import géographique"),
-                "message": message,
-                "type": "success",
-            },
-        }
+    def _iter_rows(self):
+        """Parcourir les lignes CSV/XLSX en flux et les retourner normalisées."""
 
-    def _read_rows(self):
-        """Charger les lignes CSV/XLSX et retourner des dictionnaires normalisés."""
-
-        decoded = base64.b64decode(self.file_data)
-        if not self.filename:
-            raise UserError(_("Veuillez fournir un nom de fichier."))
-        extension = self.filename.lower().rsplit(".", 1)[-1]
-        if extension == "csv":
-            content = decoded.decode("utf-8-sig")
-            reader = csv.DictReader(io.StringIO(content))
-            return [self._normalize_row(row) for row in reader if any(row.values())]
-        if extension in ("xlsx", "xlsm"):
-            if load_workbook is None:
-                raise UserError(_("Le module python openpyxl est requis pour lire les fichiers XLSX."))
-            workbook = load_workbook(filename=io.BytesIO(decoded), read_only=True, data_only=True)
-            sheet = workbook.active
-            headers = []
-            data_rows = []
-            for index, row in enumerate(sheet.iter_rows(values_only=True)):
-                if index == 0:
-                    headers = [str(cell).strip() if cell else "" for cell in row]
-                    continue
-                if not any(row):
-                    continue
-                record = {}
-                for header, cell in zip(headers, row):
-                    if not header:
-                        continue
-                    record[header] = cell if cell is not None else ""
-                data_rows.append(self._normalize_row(record))
-            return data_rows
-        raise UserError(_("Format de fichier non supporté: %s" % extension))
+        for row in super()._iter_rows():
+            yield self._normalize_row(row)
 
     # ------------------------------------------------------------------
     # Fonctions utilitaires
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""Lecture en flux des fichiers CSV/XLSX partagée par les assistants d'import."""
+
+import base64
+import contextlib
+import csv
+import io
+
+from odoo import fields, models, _
+from odoo.exceptions import UserError
+
+from ..tools import fuzzy, geo_cache
+
+try:
+    from openpyxl import load_workbook  # type: ignore
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    load_workbook = None
+
+
+class ImportRow(dict):
+    """Ligne lue d'un fichier : valeurs par en-tête et numéro de la ligne dans le fichier."""
+
+    __slots__ = ("line_number",)
+
+    def __init__(self, values, line_number):
+        super().__init__(values)
+        self.line_number = line_number
+
+
+class PharmaImportMixin(models.AbstractModel):
+    """Fournir le fichier à importer et un lecteur ligne à ligne à mémoire bornée."""
+
+    _name = "pharma.import.mixin"
+    _description = "Socle des assistants d'import"
+
+    file_data = fields.Binary(string="Fichier", required=True)
+    filename = fields.Char(string="Nom du fichier")
+    run_in_background = fields.Boolean(
+        string="Exécuter en arrière-plan",
+        help="Confier l'import à une tâche planifiée traitée par lots validés, "
+        "au lieu de l'exécuter pendant la requête.",
+    )
+    match_mode = fields.Selection(
+        [
+            ("exact", "Exact"),
+            ("fuzzy", "Approché"),
+        ],
+        string="Rapprochement des noms",
+        required=True,
+        default="exact",
+        help="En mode approché, un nom absent de la base est associé à la fiche la plus proche "
+        "(fautes de frappe, accents, espaces) lorsque leur similarité atteint le seuil. "
+        "Nécessite l'extension PostgreSQL pg_trgm.",
+    )
+    similarity_threshold = fields.Float(
+        string="Seuil de similarité",
+        default=0.6,
+        help="Similarité trigram minimale (entre 0 et 1) pour accepter un rapprochement approché.",
+    )
+
+    # ------------------------------------------------------------------
+    # Déroulement de l'import
+    # ------------------------------------------------------------------
+    def _run_import(self):
+        """Importer tout le fichier dans la transaction courante et retourner les compteurs."""
+
+        import_context = self._start_import()
+        counters = self._import_rows(self._iter_rows(), import_context)
+        if not counters["rows"]:
+            raise UserError(_("Le fichier ne contient aucune donnée."))
+        return self._finish_import(import_context)
+
+    def _start_import(self):
+        """Préparer l'état partagé par tous les lots d'un import (index, compteurs).
+
+        Par défaut, seul le compteur de lignes ``rows`` est tenu.
+        """
+
+        return {"counters": {"rows": 0}}
+
+    def _import_rows(self, rows, import_context):
+        """Traiter un itérable de lignes et retourner les compteurs cumulés.
+
+        Par défaut, les lignes sont seulement comptées.
+        """
+
+        counters = import_context["counters"]
+        counters["rows"] += sum(1 for _row in rows)
+        return counters
+
+    def _pop_matched_ids(self, import_context):
+        """Retourner puis oublier les ids des fiches rapprochées depuis le dernier appel.
+
+        Une tâche d'import les conserve hors de ses compteurs, d'un lot à
+        l'autre. Par défaut, aucune fiche n'est suivie.
+        """
+
+        return []
+
+    def _restore_matched_ids(self, import_context, record_ids):
+        """Reprendre, avant la fin de l'import, les fiches rapprochées par les lots précédents."""
+
+    def _finish_import(self, import_context):
+        """Compléter et retourner les compteurs une fois toutes les lignes traitées."""
+
+        return import_context["counters"]
+
+    def _get_result_message(self, counters):
+        """Résumer les compteurs d'un import pour l'utilisateur."""
+
+        return _("%s lignes traitées.") % counters.get("rows", 0)
+
+    def _get_job_options(self):
+        """Retourner les options de l'assistant à rejouer dans une tâche d'import."""
+
+        return {"match_mode": self.match_mode, "similarity_threshold": self.similarity_threshold}
+
+    def _check_match_mode(self):
+        """Vérifier que le rapprochement approché peut être utilisé sur cette base."""
+
+        if self.match_mode != "fuzzy":
+            return
+        if not fuzzy.is_available(self.env):
+            raise UserError(_("Le rapprochement approché nécessite l'extension PostgreSQL pg_trgm."))
+        if not 0 < self.similarity_threshold <= 1:
+            raise UserError(_("Le seuil de similarité doit être compris entre 0 et 1."))
+
+    def _enqueue_job(self):
+        """Créer une tâche d'import en arrière-plan et ouvrir sa fiche de suivi."""
+
+        self._get_file_extension()
+        job = self.env["pharma.import.job"].create(
+            {
+                "name": self.filename,
+                "wizard_model": self._name,
+                "options": self._get_job_options(),
+                "file_data": self.file_data,
+                "filename": self.filename,
+            }
+        )
+        job._trigger_processing()
+        return {
+            "type": "ir.actions.act_window",
+            "res_model": "pharma.import.job",
+            "res_id": job.id,
+            "view_mode": "form",
+            "target": "current",
+        }
+
+    # ------------------------------------------------------------------
+    # Lecture du fichier
+    # ------------------------------------------------------------------
+    def _get_file_extension(self):
+        """Contrôler le nom du fichier et retourner son extension supportée."""
+
+        if not self.filename:
+            raise UserError(_("Veuillez fournir un nom de fichier."))
+        extension = self.filename.lower().rsplit(".", 1)[-1]
+        if extension not in ("csv", "xlsx", "xlsm"):
+            raise UserError(_("Format de fichier non supporté: %s" % extension))
+        if extension != "csv" and load_workbook is None:
+            raise UserError(_("Le module python openpyxl est requis pour lire les fichiers XLSX."))
+        return extension
+
+    @contextlib.contextmanager
+    def _open_file(self):
+        """Ouvrir le fichier transmis en flux binaire.
+
+        Lorsque le fichier est stocké dans le filestore, il est lu directement
+        depuis le disque sans passer par sa représentation base64.
+        """
+
+        attachment = self._get_file_attachment()
+        if attachment.store_fname:
+            handle = open(attachment._full_path(attachment.store_fname), "rb")
+        elif attachment:
+            handle = io.BytesIO(attachment.raw or b"")
+        else:
+            handle = io.BytesIO(base64.b64decode(self.file_data or b""))
+        try:
+            yield handle
+        finally:
+            handle.close()
+
+    def _get_file_attachment(self):
+        """Retourner la pièce jointe du fichier à lire.
+
+        Une tâche d'import transmet la sienne par le contexte
+        (``pharma_import_attachment_id``) ; sinon, celle du champ ``file_data``.
+        """
+
+        Attachment = self.env["ir.attachment"].sudo()
+        attachment_id = self.env.context.get("pharma_import_attachment_id")
+        if attachment_id:
+            return Attachment.browse(attachment_id).exists()
+        return Attachment.search(
+            [
+                ("res_model", "=", self._name),
+                ("res_field", "=", "file_data"),
+                ("res_id", "=", self.id),
+            ],
+            limit=1,
+        )
+
+    def _iter_rows(self):
+        """Produire les lignes non vides du fichier sous forme de dictionnaires, une à une.
+
+        Chaque ligne est une :class:`ImportRow` qui porte son numéro dans le
+        fichier (en-tête et lignes vides compris), tel que l'affiche un tableur.
+        """
+
+        extension = self._get_file_extension()
+        with self._open_file() as handle:
+            if extension == "csv":
+                yield from self._iter_csv_rows(handle)
+            else:
+                yield from self._iter_xlsx_rows(handle)
+
+    @staticmethod
+    def _iter_csv_rows(handle):
+        """Lire un CSV UTF-8 en flux depuis un descripteur binaire."""
+
+        reader = csv.reader(io.TextIOWrapper(handle, encoding="utf-8-sig", newline=""))
+        headers = next(reader, None)
+        if headers is None:
+            return
+        # Une valeur entre guillemets peut s'étendre sur plusieurs lignes du fichier.
+        line_number = reader.line_num + 1
+        for values in reader:
+            if any(values):
+                yield ImportRow(zip(headers, values), line_number)
+            line_number = reader.line_num + 1
+
+    @staticmethod
+    def _iter_xlsx_rows(handle):
+        """Lire la feuille active d'un classeur en mode lecture seule."""
+
+        workbook = load_workbook(filename=handle, read_only=True, data_only=True)
+        try:
+            sheet = workbook.active
+            rows = sheet.iter_rows(values_only=True)
+            header_row = next(rows, None)
+            if header_row is None:
+                return
+            headers = [str(cell).strip() if cell else "" for cell in header_row]
+            for line_number, row in enumerate(rows, start=(sheet.min_row or 1) + 1):
+                if not any(row):
+                    continue
+                yield ImportRow(
+                    (
+                        (header, cell if cell is not None else "")
+                        for header, cell in zip(headers, row)
+                        if header
+                    ),
+                    line_number,
+                )
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def _normalize_key(value):
+        """Ramener un libellé à une clé de comparaison sans casse ni accents."""
+
+        return geo_cache.normalize_name(value)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Import en masse des photos d'établissements depuis une archive ZIP."""
+
+import base64
+import itertools
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo import fields, models, _
+from odoo.exceptions import UserError
+from odoo.tools import image_process
+
+from ..models.establishment import ESTABLISHMENT_MODELS, PHOTO_SIZES
+from ..tools.instrumentation import add_rows, profiled
+
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp")
+
+# Taille maximale (octets) d'une image décompressée acceptée depuis l'archive.
+MAX_PHOTO_SIZE = 25 * 1024 * 1024
+
+# Nombre d'images décompressées et redimensionnées simultanément en mémoire.
+PHOTO_CHUNK_SIZE = 64
+
+
+def _load_photo(archive, info):
+    """Décompresser une image et produire la photo et ses vignettes ; None si elle est illisible.
+
+    Exécutée dans un thread de travail : chaque taille est réduite à partir
+    de la précédente, et les champs image n'ont plus rien à recalculer.
+    """
+
+    try:
+        data = archive.read(info)
+        vals = {}
+        for field_name, size in PHOTO_SIZES:
+            data = image_process(data, size=(size, size), verify_resolution=True)
+            vals[field_name] = base64.b64encode(data)
+        return vals
+    except Exception:  # pylint: disable=broad-except
+        return None
+
+
+class PharmaImportPhotoWizard(models.TransientModel):
+    """Associer à chaque établissement l'image nommée d'après son code (ex. ``off-0001.jpg``)."""
+
+    _name = "pharma.import.photo.wizard"
+    _description = "Assistant d'import des photos"
+    _inherit = "pharma.import.mixin"
+
+    overwrite = fields.Boolean(
+        string="Remplacer les photos existantes",
+        help="Sans cette option, les établissements qui ont déjà une photo sont ignorés.",
+    )
+    worker_count = fields.Integer(
+        string="Redimensionnements parallèles",
+        default=4,
+        help="Nombre d'images décodées et redimensionnées simultanément.",
+    )
+
+    @profiled("action_import")
+    def action_import(self):
+        """Lire l'archive, décompresser et redimensionner les images en parallèle, puis les enregistrer."""
+
+        self.ensure_one()
+        if not (self.filename or "").lower().endswith(".zip"):
+            raise UserError(_("Veuillez fournir une archive ZIP."))
+        counters = {"imported": 0, "skipped": 0, "unknown": 0, "invalid": 0}
+        with self._open_file() as handle:
+            try:
+                archive = zipfile.ZipFile(handle)
+            except zipfile.BadZipFile as error:
+                raise UserError(_("Archive ZIP illisible : %s") % error) from error
+            with archive:
+                entries = self._get_photo_entries(archive, counters)
+                targets = self._match_codes(entries, counters)
+                with ThreadPoolExecutor(max_workers=max(self.worker_count, 1)) as executor:
+                    pending = iter(targets.items())
+                    while True:
+                        chunk = list(itertools.islice(pending, PHOTO_CHUNK_SIZE))
+                        if not chunk:
+                            break
+                        add_rows(len(chunk))
+                        photos = executor.map(lambda item: _load_photo(archive, item[0]), chunk)
+                        loaded = []
+                        for (_info, record), vals in zip(chunk, photos):
+                            if vals is None:
+                                counters["invalid"] += 1
+                            else:
+                                loaded.append((record, vals))
+                        self._write_photos(loaded)
+                        counters["imported"] += len(loaded)
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": _("Import des photos"),
+                "message": _(
+                    "%s photos importées, %s ignorées (photo existante), %s codes inconnus, %s images illisibles."
+                )
+                % (counters["imported"], counters["skipped"], counters["unknown"], counters["invalid"]),
+                "type": "success",
+            },
+        }
+
+    def _write_photos(self, loaded):
+        """Enregistrer les photos d'un paquet par l'ORM, fiche par fiche et type par type.
+
+        Droits d'accès, règles et ``write_date`` s'appliquent comme pour une
+        saisie ; les images sont déjà réduites, les champs image n'ont donc
+        plus à les redimensionner.
+        """
+
+        by_model = {}
+        for record, vals in loaded:
+            by_model.setdefault(record._name, []).append((record, vals))
+        for model_name, items in by_model.items():
+            for record, vals in items:
+                record.write(vals)
+            self.env[model_name].flush_model()
+
+    @staticmethod
+    def _get_photo_entries(archive, counters):
+        """Retourner ``{code: entrée}`` des images de l'archive, nommées d'après le code."""
+
+        entries = {}
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            code, extension = os.path.splitext(name)
+            if info.is_dir() or name.startswith(".") or extension.lower() not in PHOTO_EXTENSIONS:
+                continue
+            if info.file_size > MAX_PHOTO_SIZE:
+                counters["invalid"] += 1
+                continue
+            entries[code.strip().lower()] = info
+        return entries
+
+    def _match_codes(self, entries, counters):
+        """Associer chaque entrée à sa fiche, en une requête par type d'établissement."""
+
+        targets = {}
+        matched = set()
+        codes = tuple(entries)
+        for model_name in ESTABLISHMENT_MODELS.values():
+            if not codes:
+                break
+            Model = self.env[model_name]
+            Model.check_access_rights("write")
+            Model.flush_model(["code"])
+            self.env.cr.execute(
+                f'SELECT lower(code), id FROM "{Model._table}" WHERE lower(code) IN %s',
+                [codes],
+            )
+            records_by_code = dict(self.env.cr.fetchall())
+            if not records_by_code:
+                continue
+            matched.update(records_by_code)
+            with_photo = set()
+            if not self.overwrite:
+                with_photo = set(
+                    Model.with_context(active_test=False)
+                    .search([("id", "in", list(records_by_code.values())), ("photo", "!=", False)])
+                    .ids
+                )
+            for code, record_id in records_by_code.items():
+                if record_id in with_photo:
+                    counters["skipped"] += 1
+                else:
+                    targets[entries[code]] = Model.browse(record_id)
+        counters["unknown"] += len(entries) - len(matched)
+        return targets